@@ -0,0 +1,133 @@
+import os
+import time
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows (desktop build): a single process, in-memory slots are enough
+    fcntl = None
+
+# --- Admission control for conversions ---
+# At most `slots` conversions run at once and at most `queue_size` more wait for a slot;
+# anything beyond that is turned away immediately (HTTP 429) instead of piling up OCR
+# processes until the instance runs out of memory.
+# Slots are lock files held with flock, so the limits are shared by every server worker
+# process, and a slot is freed automatically if the process holding it dies.
+
+POLL_INTERVAL = 0.1
+
+
+class Overloaded(Exception):
+    """Raised when no conversion slot is available (queue full or wait timed out)."""
+
+
+class Ticket:
+    """A place in the admission queue; wait() turns it into a running slot."""
+
+    def __init__(self, control, admission):
+        self._control = control
+        self._admission = admission
+        self._slot = None
+        self._extra_slots = []
+        self._released = False
+
+    def wait(self, timeout=None):
+        """Blocks until a slot is free (forever if timeout is None). Returns False on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._slot is None:
+            self._slot = self._control._try_lock(self._control._slots)
+            if self._slot is not None:
+                break
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(POLL_INTERVAL)
+        return True
+
+    def widen(self, count):
+        """
+        Once the ticket holds its slot, takes free slots without waiting until it holds
+        count of them, for a conversion that runs that many workers (bulk jobs).
+        Returns the number of slots held; release() frees them all.
+        """
+        while self._slot is not None and 1 + len(self._extra_slots) < count:
+            slot = self._control._try_lock(self._control._slots)
+            if slot is None:
+                break
+            self._extra_slots.append(slot)
+        return 1 + len(self._extra_slots)
+
+    def release(self):
+        """Frees the slots (if held) and the queue place. Safe to call more than once."""
+        if self._released:
+            return
+        self._released = True
+        for slot in self._extra_slots:
+            self._control._unlock(self._control._slots, slot)
+        if self._slot is not None:
+            self._control._unlock(self._control._slots, self._slot)
+        self._control._unlock(self._control._admissions, self._admission)
+
+
+class AdmissionControl:
+    """Bounds the number of running and waiting conversions across processes."""
+
+    def __init__(self, directory, slots, queue_size):
+        self.slots = max(1, slots)
+        self.queue_size = max(0, queue_size)
+        if fcntl is not None:
+            os.makedirs(directory, exist_ok=True)
+            self._admissions = [os.path.join(directory, f"admission-{i}.lock") for i in range(self.slots + self.queue_size)]
+            self._slots = [os.path.join(directory, f"slot-{i}.lock") for i in range(self.slots)]
+        else:
+            self._admissions = threading.BoundedSemaphore(self.slots + self.queue_size)
+            self._slots = threading.BoundedSemaphore(self.slots)
+
+    def _try_lock(self, pool):
+        """Takes a free lock of the pool without blocking. Returns a handle, or None."""
+        if fcntl is None:
+            return pool if pool.acquire(blocking=False) else None
+        for path in pool:
+            f = open(path, "a")
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                f.close()
+                continue
+            return f
+        return None
+
+    def _unlock(self, pool, handle):
+        if fcntl is None:
+            pool.release()
+        else:
+            handle.close()  # Closing the file drops the flock
+
+    def enter(self):
+        """Takes a place in the queue. Returns a Ticket, or None when the queue is full."""
+        admission = self._try_lock(self._admissions)
+        if admission is None:
+            return None
+        return Ticket(self, admission)
+
+    def admit(self, timeout=None, ticket=None):
+        """
+        Returns a ticket holding a running slot, entering the queue first unless a ticket
+        from enter() is given. Raises Overloaded if the queue is full or no slot frees up
+        within timeout seconds.
+        """
+        if ticket is None:
+            ticket = self.enter()
+            if ticket is None:
+                raise Overloaded("queue full")
+        if not ticket.wait(timeout):
+            ticket.release()
+            raise Overloaded("timed out waiting for a slot")
+        return ticket
+
+
+def release_after(chunks, ticket):
+    """Yields chunks, then releases ticket once they are exhausted or the consumer stops."""
+    try:
+        yield from chunks
+    finally:
+        ticket.release()
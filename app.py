@@ -1,13 +1,24 @@
 import os
 import sys
 import importlib
-from flask import Flask, render_template, request, jsonify, make_response
+from flask import Flask, Request, render_template, request, jsonify, make_response, url_for, stream_with_context
 import io
 import re # Import regular expressions module for sanitization
+import shutil
+import tempfile
+import zipfile
+import bulk
+from script import formats, pagecache, timing
+from script.detect import FingerprintIndex
+from script.pdfsource import count_pages
+from result_cache import ResultCache, hash_file, module_version
+from jobs import JobManager
+from admission import AdmissionControl, Overloaded, release_after
+from metrics import Registry
 
 # --- A helper function for basic filename sanitization ---
-def sanitize_filename(filename):
-    """Removes potentially dangerous characters and ensures .csv extension."""
+def sanitize_filename(filename, extension=".csv"):
+    """Removes potentially dangerous characters and ensures the extension (.csv by default)."""
     # Remove characters that are problematic in filenames across OSes
     # Keep alphanumeric, underscore, hyphen, space
     sanitized = re.sub(r'[\\/*?:"<>|]', "", filename)
@@ -17,14 +28,37 @@ def sanitize_filename(filename):
     if not sanitized or sanitized in ('.', '..'):
         sanitized = "output" # Fallback name
 
-    # Ensure it ends with .csv (case-insensitive check)
-    if not sanitized.lower().endswith('.csv'):
-        sanitized += ".csv"
+    # Ensure it ends with the extension (case-insensitive check), replacing the one of another output format
+    root, current = os.path.splitext(sanitized)
+    if current.lower() != extension and root and current.lower() in [ext for _, ext in formats.FORMATS.values()]:
+        sanitized = root
+    if not sanitized.lower().endswith(extension):
+        sanitized += extension
     return sanitized
 # -------------------------------------------------------
 
 
+# --- Uploads ---
+# Requests larger than MAX_UPLOAD_BYTES are refused with a 413 before being read.
+# Uploads up to UPLOAD_SPOOL_BYTES stay in memory; larger ones are spooled to a temporary
+# file (in UPLOAD_DIR, default the system temp dir) that the scripts read through a
+# memory map (script.pdfsource), so per-request memory does not grow with the file size.
+MAX_UPLOAD_BYTES = int(os.environ.get("MAX_UPLOAD_BYTES", 512 * 1024 * 1024))
+UPLOAD_SPOOL_BYTES = int(os.environ.get("UPLOAD_SPOOL_BYTES", 1024 * 1024))
+UPLOAD_DIR = os.environ.get("UPLOAD_DIR") or None
+
+class SpooledRequest(Request):
+    """Request whose file uploads go to a temporary file above UPLOAD_SPOOL_BYTES."""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if total_content_length is not None and total_content_length <= UPLOAD_SPOOL_BYTES:
+            return io.BytesIO()
+        return tempfile.TemporaryFile("wb+", dir=UPLOAD_DIR)
+
+
 app = Flask(__name__)
+app.request_class = SpooledRequest
+app.config["MAX_CONTENT_LENGTH"] = MAX_UPLOAD_BYTES
 
 # --- SCRIPT MAP ---
 SCRIPT_MAP = {
@@ -39,6 +73,58 @@ SCRIPT_MAP = {
     ("Buffetti", "Estratto conto"): "script.EcBuffetti",
     ("Intesa San Paolo", "Estratto conto"): "script.EcIntesa"
 }
+SCRIPT_KEYS = {script_name: key for key, script_name in SCRIPT_MAP.items()}
+
+# --- Result Cache ---
+# Repeat uploads of the same PDF for the same script are served from disk.
+# Set RESULT_CACHE_DIR to an empty string to disable the cache.
+RESULT_CACHE_DIR = os.environ.get("RESULT_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "result_cache"))
+RESULT_CACHE_MAX_BYTES = int(os.environ.get("RESULT_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+RESULT_CACHE_MAX_ENTRIES = int(os.environ.get("RESULT_CACHE_MAX_ENTRIES", 2000))
+result_cache = ResultCache(RESULT_CACHE_DIR, RESULT_CACHE_MAX_BYTES, RESULT_CACHE_MAX_ENTRIES) if RESULT_CACHE_DIR else None
+
+# --- Page Cache ---
+# What the scripts extract from each page (text, table rows, OCR tokens) is kept too,
+# so a statement uploaded again with new pages only has those parsed or OCR'd.
+# Set PAGE_CACHE_DIR to an empty string to disable it.
+PAGE_CACHE_DIR = os.environ.get("PAGE_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "page_cache"))
+PAGE_CACHE_MAX_BYTES = int(os.environ.get("PAGE_CACHE_MAX_BYTES", 128 * 1024 * 1024))
+PAGE_CACHE_MAX_ENTRIES = int(os.environ.get("PAGE_CACHE_MAX_ENTRIES", 50000))
+if PAGE_CACHE_DIR:
+    pagecache.configure(ResultCache(PAGE_CACHE_DIR, PAGE_CACHE_MAX_BYTES, PAGE_CACHE_MAX_ENTRIES,
+                                    suffix=".json", evict_interval=64))
+
+# --- Background Jobs ---
+JOBS_DIR = os.environ.get("JOBS_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "jobs"))
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", 2))
+JOB_TTL_SECONDS = int(os.environ.get("JOB_TTL_SECONDS", 3600))
+job_manager = JobManager(JOBS_DIR, JOB_WORKERS, JOB_TTL_SECONDS)
+
+# --- Bulk Conversion ---
+# A bulk job runs one worker process per conversion slot it can take (see submit_bulk),
+# up to BULK_WORKERS.
+BULK_WORKERS = int(os.environ.get("BULK_WORKERS", os.cpu_count() or 1))
+BULK_MAX_UNCOMPRESSED_BYTES = int(os.environ.get("BULK_MAX_UNCOMPRESSED_BYTES", 2 * 1024 * 1024 * 1024))
+
+# --- Admission Control ---
+# Shared by all server worker processes: CONVERSION_SLOTS conversions run at once,
+# CONVERSION_QUEUE more may wait (up to ADMISSION_WAIT_SECONDS for /run_script),
+# further uploads get a 429. Cache hits bypass it.
+ADMISSION_DIR = os.environ.get("ADMISSION_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "admission"))
+CONVERSION_SLOTS = int(os.environ.get("CONVERSION_SLOTS", 2))
+CONVERSION_QUEUE = int(os.environ.get("CONVERSION_QUEUE", 8))
+ADMISSION_WAIT_SECONDS = float(os.environ.get("ADMISSION_WAIT_SECONDS", 120))
+ADMISSION_RETRY_AFTER = 30
+admission = AdmissionControl(ADMISSION_DIR, CONVERSION_SLOTS, CONVERSION_QUEUE)
+
+# --- Metrics ---
+# Stage timings reported by the scripts (script.timing), conversion durations, in-flight
+# and error counts, exposed in Prometheus format on /metrics. Each server process writes
+# its numbers to METRICS_DIR so a scrape sees all of them; an empty METRICS_DIR keeps
+# them in memory (enough for a single process).
+METRICS_DIR = os.environ.get("METRICS_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "metrics"))
+metrics = Registry(METRICS_DIR)
+timing.add_recorder(lambda script, stage, seconds: metrics.observe("toolobm_stage_seconds", seconds, script=script, stage=stage))
 
 # --- Pre-Processing Data ---
 try:
@@ -54,48 +140,246 @@ except Exception as e:
     print(f"Critical error in configuration: {e}")
     sys.exit(1)
 
+# --- Script Preloading ---
+# Every SCRIPT_MAP module is imported once at startup, so no request pays the import
+# cost (later importlib.import_module calls are sys.modules lookups) and broken scripts
+# or missing OCR binaries show up in the log before the first upload.
+# With STARTUP_STRICT=1 any problem stops the server instead.
+STARTUP_STRICT = os.environ.get("STARTUP_STRICT", "0") == "1"
+
+def preload_scripts():
+    """Imports and validates the SCRIPT_MAP modules. Returns a list of problems found."""
+    problems = []
+    for script_name in sorted(set(SCRIPT_MAP.values())):
+        try:
+            module = importlib.import_module(script_name)
+        except Exception as e:
+            problems.append(f"{script_name}: import fallito ({type(e).__name__}: {e})")
+            continue
+        if not (hasattr(module, "process_pdf") and callable(module.process_pdf)):
+            problems.append(f"{script_name}: funzione process_pdf mancante")
+        check_dependencies = getattr(module, "check_dependencies", None)
+        if callable(check_dependencies):
+            problems.extend(f"{script_name}: {problem}" for problem in check_dependencies())
+    return problems
+
+startup_problems = preload_scripts()
+for problem in startup_problems:
+    print(f"Avviso configurazione: {problem}") # Log server-side
+if startup_problems and STARTUP_STRICT:
+    print("Critical error in configuration: STARTUP_STRICT attivo, avvio interrotto.")
+    sys.exit(1)
+
+# --- Automatic Detection ---
+# With bank and doc_type set to AUTO_DETECT (or both left out) the script is chosen from
+# page 1 of the PDF, matched against the FINGERPRINT of every SCRIPT_MAP module
+# (see script.detect). Bulk uploads without a tag are detected the same way.
+# Requests only read the text layer: a scan is attributed to the script reading scans
+# without OCR, since OCR in the request thread would bypass the admission control. Bulk
+# files still unrecognized are detected again, with OCR, once the job is admitted.
+AUTO_DETECT = "auto"
+fingerprint_index = FingerprintIndex(SCRIPT_MAP)
+
+
+def wants_detection(bank, doc_type):
+    """True when the bank/doc_type tag asks for automatic detection."""
+    return (bank or AUTO_DETECT) == AUTO_DETECT and (doc_type or AUTO_DETECT) == AUTO_DETECT
+
+
+def detection_message(candidates):
+    """Why the script could not be chosen from the PDF (candidates: the pairs that matched)."""
+    if len(candidates) < 2:
+        return "Banca e tipo di documento non riconosciuti: selezionali manualmente."
+    return "Documento compatibile con più banche o tipi di documento: selezionali manualmente."
+
+
+def detection_error(candidates):
+    """422 returned when the script cannot be chosen from the PDF."""
+    return jsonify({"status": "error", "message": detection_message(candidates),
+                    "candidates": [{"bank": bank, "doc_type": doc_type} for bank, doc_type in candidates]}), 422
+
 
 @app.route("/", methods=["GET"])
 def index():
-    return render_template("index.html", all_banche=all_banche, available_docs_by_bank=available_docs_by_bank)
+    return render_template("index.html", all_banche=all_banche, available_docs_by_bank=available_docs_by_bank,
+                           auto_detect=AUTO_DETECT)
 
 
-@app.route("/run_script", methods=["POST"])
-def run_script():
+def negotiate_format():
+    """
+    Output format of the conversion (see script.formats.FORMATS): the output_format form
+    field if given, otherwise the best match for the Accept header (CSV when the client
+    accepts anything). Returns (output_format, None), or (None, error_response).
+    """
+    output_format = request.form.get("output_format")
+    if output_format:
+        output_format = output_format.strip().lower()
+        if output_format not in formats.FORMATS:
+            return None, (jsonify({"status": "error", "message": f"Formato di output non supportato: '{output_format}'. Formati disponibili: {', '.join(formats.FORMATS)}."}), 400)
+        return output_format, None
+    content_types = [content_type for content_type, _ in formats.FORMATS.values()]
+    best = request.accept_mimetypes.best_match(content_types, default=formats.FORMATS[formats.DEFAULT_FORMAT][0])
+    return formats.format_for_mimetype(best), None
+
+
+def parse_conversion_form():
+    """
+    Validates the bank/doc_type/pdf_file/output_filename/output_format form fields,
+    detecting bank and doc_type from the PDF when asked to (see wants_detection).
+    Returns (script_name, pdf_file, safe_output_filename, output_format, None) on success,
+    or (None, None, None, None, error_response) when the form is invalid.
+    """
     bank = request.form.get("bank")
     doc_type = request.form.get("doc_type")
     pdf_file = request.files.get("pdf_file") # Use .get for safety
 
     # === NEW: Get and sanitize the desired output filename ===
     output_filename_raw = request.form.get("output_filename", "output") # Default to 'output'
-    safe_output_filename = sanitize_filename(output_filename_raw)
     # ========================================================
+    output_format, error = negotiate_format()
+    if error:
+        return None, None, None, None, error
+    safe_output_filename = sanitize_filename(output_filename_raw, formats.FORMATS[output_format][1])
+
+    if wants_detection(bank, doc_type):
+        if not pdf_file or pdf_file.filename == "":
+            return None, None, None, None, (jsonify({"status": "error", "message": "Nessun file PDF inviato."}), 400)
+        try:
+            key, script_name, candidates = fingerprint_index.detect(pdf_file.stream, ocr=False)
+        except Exception as e:
+            print(f"Riconoscimento fallito: {type(e).__name__}: {e}") # Log server-side
+            return None, None, None, None, (jsonify({"status": "error", "message": "File PDF non leggibile."}), 400)
+        if script_name is None:
+            return None, None, None, None, detection_error(candidates)
+        print(f"Riconosciuto: {key[0]} - {key[1]} ({script_name})") # Log server-side
+        return script_name, pdf_file, safe_output_filename, output_format, None
 
     if not bank or not doc_type or doc_type == "Nessun documento disponibile":
-        return jsonify({"status": "error", "message": "Seleziona una banca e un tipo di documento valido."}), 400
+        return None, None, None, None, (jsonify({"status": "error", "message": "Seleziona una banca e un tipo di documento valido."}), 400)
 
     key = (bank, doc_type)
     if key not in SCRIPT_MAP:
-        return jsonify({"status": "error", "message": f"La combinazione '{bank}' - '{doc_type}' non è valida."}), 400
+        return None, None, None, None, (jsonify({"status": "error", "message": f"La combinazione '{bank}' - '{doc_type}' non è valida."}), 400)
 
     if not pdf_file: # Check if file exists in request.files
-         return jsonify({"status": "error", "message": "Nessun file PDF inviato."}), 400
+         return None, None, None, None, (jsonify({"status": "error", "message": "Nessun file PDF inviato."}), 400)
     if pdf_file.filename == "":
-         return jsonify({"status": "error", "message": "Nome file PDF vuoto."}), 400 # Check filename specifically
+         return None, None, None, None, (jsonify({"status": "error", "message": "Nome file PDF vuoto."}), 400) # Check filename specifically
+
+    return SCRIPT_MAP[key], pdf_file, safe_output_filename, output_format, None
+
+
+def convert_pdf(script_name, module, pdf_file, progress=None, ticket=None, output_format=formats.DEFAULT_FORMAT):
+    """
+    Converts pdf_file with a script module, going through the result cache (CSV only).
+    Returns (chunks, cache_hit): chunks is an iterator of output (CSV text by default, see
+    script.formats) that is produced as the PDF is parsed (and written to the cache as it
+    goes), or the cached CSV. On a hit, progress reports every page done at once.
+    On a cache miss the conversion first takes a slot from the admission control,
+    waiting on ticket if one was reserved with admission.enter() (without time limit),
+    otherwise queueing for up to ADMISSION_WAIT_SECONDS; raises Overloaded if none is
+    available. The slot is held until chunks is exhausted or closed.
+    The conversion is counted in the metrics (in flight, duration, errors).
+    """
+    cache_key = None
+    if result_cache is not None and output_format == "csv":
+        try:
+            cache_key = ResultCache.make_key(hash_file(pdf_file), script_name, module_version(module))
+            csv_content = result_cache.get(cache_key)
+            if csv_content is not None:
+                if ticket is not None:
+                    ticket.release()
+                if progress:
+                    # Nothing is parsed on a hit, but the job still reports every page done.
+                    pages_total = count_pages(pdf_file)
+                    progress(pages_total, pages_total)
+                metrics.inc("toolobm_conversions_total", script=script_name, cache="hit")
+                return iter([csv_content]), True
+        except OSError as e:
+            print(f"Result cache lookup failed: {e}") # Log server-side, fall back to processing
+
+    if ticket is None:
+        ticket = admission.admit(ADMISSION_WAIT_SECONDS)
+    else:
+        admission.admit(ticket=ticket)
+    metrics.inc("toolobm_conversions_total", script=script_name, cache="miss")
+
+    def start_conversion():
+        if hasattr(module, "iter_batches"):
+            return formats.iter_module_output(module, pdf_file, progress, output_format)
+        # Assuming process_pdf returns CSV content as string or bytes
+        return iter([module.process_pdf(pdf_file, progress=progress)])
+
+    try:
+        chunks = metrics.track_conversion(script_name, start_conversion)
+    except BaseException:
+        ticket.release()
+        raise
+    if cache_key is not None:
+        chunks = result_cache.tee(cache_key, chunks)
+    return release_after(chunks, ticket), False
+
+
+def overloaded_response(script_name):
+    """429 returned when every conversion slot and queue place is taken."""
+    metrics.inc("toolobm_conversions_rejected_total", script=script_name)
+    response = jsonify({"status": "error", "message": "Server occupato: troppe conversioni in corso, riprova tra qualche istante."})
+    response.headers["Retry-After"] = str(ADMISSION_RETRY_AFTER)
+    return response, 429
+
+
+def format_size(num_bytes):
+    """Size for user messages, in MB or KB with at most one decimal ("512 MB", "1,5 MB", "500 KB")."""
+    for unit, size in (("MB", 1024 * 1024), ("KB", 1024)):
+        if num_bytes >= size:
+            value = f"{num_bytes / size:.1f}".removesuffix(".0").replace(".", ",")
+            return f"{value} {unit}"
+    return f"{num_bytes} byte"
+
+
+@app.errorhandler(413)
+def upload_too_large(e):
+    """JSON error for requests over MAX_UPLOAD_BYTES (raised by Werkzeug while reading the form)."""
+    print(f"Upload rifiutato: {request.content_length} byte oltre il limite di {MAX_UPLOAD_BYTES}") # Log server-side
+    return jsonify({"status": "error", "message": f"File troppo grande: il limite è {format_size(MAX_UPLOAD_BYTES)}."}), 413
+
+
+def log_stream_errors(chunks, script_name):
+    """Logs errors raised while a response is already streaming (the status code has been sent)."""
+    try:
+        yield from chunks
+    except Exception as e:
+        print(f"Errore esecuzione script {script_name}: {type(e).__name__}: {e}") # Log server-side detailed error
+        raise
+
+
+def attachment(content, filename, content_type="text/csv"):
+    """Wraps content (CSV by default) in a download response."""
+    response = make_response(content)
+    # === Use the sanitized filename in the header ===
+    response.headers["Content-Disposition"] = f"attachment; filename=\"{filename}\""
+    # ===============================================
+    response.headers["Content-Type"] = content_type
+    return response
+
+
+@app.route("/run_script", methods=["POST"])
+def run_script():
+    script_name, pdf_file, safe_output_filename, output_format, error = parse_conversion_form()
+    if error:
+        return error
 
     try:
-        script_name = SCRIPT_MAP[key]
         module = importlib.import_module(script_name)
 
         if hasattr(module, "process_pdf") and callable(module.process_pdf):
-            # Assuming process_pdf returns CSV content as string or bytes
-            csv_content = module.process_pdf(pdf_file)
-
-            response = make_response(csv_content)
-            # === Use the sanitized filename in the header ===
-            response.headers["Content-Disposition"] = f"attachment; filename=\"{safe_output_filename}\""
-            # ===============================================
-            response.headers["Content-Type"] = "text/csv"
+            chunks, cache_hit = convert_pdf(script_name, module, pdf_file, output_format=output_format)
+            # Rows are streamed to the client while the remaining pages are parsed
+            response = attachment(stream_with_context(log_stream_errors(chunks, script_name)), safe_output_filename,
+                                  formats.FORMATS[output_format][0])
+            response.headers["X-Cache"] = "HIT" if cache_hit else "MISS"
+            if wants_detection(request.form.get("bank"), request.form.get("doc_type")):
+                response.headers["X-Bank"], response.headers["X-Doc-Type"] = SCRIPT_KEYS[script_name]
             return response
         else:
             print(f"Script '{script_name}' non ha funzione process_pdf.") # Log server-side
@@ -104,6 +388,9 @@ def run_script():
     except ModuleNotFoundError:
          print(f"Errore: Modulo '{script_name}' non trovato.") # Log server-side
          return jsonify({"status": "error", "message": f"Errore interno del server: modulo non trovato."}), 500
+    except Overloaded as e:
+        print(f"Conversione rifiutata ({script_name}): {e}") # Log server-side
+        return overloaded_response(script_name)
     except Exception as e:
         print(f"Errore esecuzione script {script_name}: {type(e).__name__}: {e}") # Log server-side detailed error
         # Consider logging traceback: import traceback; traceback.print_exc()
@@ -111,5 +398,215 @@ def run_script():
         return jsonify({"status": "error", "message": f"Errore durante l'elaborazione del file."}), 500
 
 
+# --- Asynchronous Job API ---
+# POST /jobs takes the same form as /run_script and returns a job id straight away;
+# GET /jobs/<id> reports state and per-page progress, GET /jobs/<id>/result downloads the result
+# (CSV, or the output_format requested, see script.formats).
+
+@app.route("/jobs", methods=["POST"])
+def submit_job():
+    script_name, pdf_file, safe_output_filename, output_format, error = parse_conversion_form()
+    if error:
+        return error
+
+    try:
+        module = importlib.import_module(script_name)
+    except ModuleNotFoundError:
+        print(f"Errore: Modulo '{script_name}' non trovato.") # Log server-side
+        return jsonify({"status": "error", "message": "Errore interno del server: modulo non trovato."}), 500
+    if not (hasattr(module, "process_pdf") and callable(module.process_pdf)):
+        print(f"Script '{script_name}' non ha funzione process_pdf.") # Log server-side
+        return jsonify({"status": "error", "message": "Errore interno del server: script non configurato correttamente."}), 500
+
+    # Reserve a queue place now, so a full queue is reported straight away.
+    ticket = admission.enter()
+    if ticket is None:
+        print(f"Job rifiutato ({script_name}): coda piena") # Log server-side
+        return overloaded_response(script_name)
+
+    # The upload stream is closed when the request ends, so the job keeps its own copy,
+    # on disk next to the job files (removed when the job ends, or by the TTL cleanup).
+    # If the copy fails (disk full, client gone), the queue place must be given back.
+    pdf_path = None
+    try:
+        with tempfile.NamedTemporaryFile(prefix="upload_", suffix=".pdf", dir=JOBS_DIR, delete=False) as f:
+            pdf_path = f.name
+            pdf_file.stream.seek(0)
+            shutil.copyfileobj(pdf_file.stream, f)
+    except Exception as e:
+        ticket.release()
+        if pdf_path is not None:
+            try:
+                os.remove(pdf_path)
+            except OSError:
+                pass
+        print(f"Job non avviato ({script_name}): copia del file fallita: {e}") # Log server-side
+        return jsonify({"status": "error", "message": "Impossibile salvare il file caricato. Riprova."}), 500
+
+    def convert(progress):
+        try:
+            with open(pdf_path, "rb") as pdf_copy:
+                chunks, _ = convert_pdf(script_name, module, pdf_copy, progress, ticket=ticket, output_format=output_format)
+                yield from chunks
+        finally:
+            os.remove(pdf_path)
+
+    job_id = job_manager.submit(convert, safe_output_filename, formats.FORMATS[output_format][0],
+                                work_paths=[pdf_path], script=script_name)
+    return jsonify({
+        "status": "ok",
+        "job_id": job_id,
+        "status_url": url_for("job_status", job_id=job_id),
+        "result_url": url_for("job_result", job_id=job_id),
+    }), 202
+
+
+@app.route("/jobs/<job_id>", methods=["GET"])
+def job_status(job_id):
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({"status": "error", "message": "Job non trovato."}), 404
+    return jsonify({
+        "status": "ok",
+        "job_id": job_id,
+        "state": job["state"],
+        "pages_done": job["pages_done"],
+        "pages_total": job["pages_total"],
+        "progress_unit": job["progress_unit"],
+        "message": job["message"],
+    })
+
+
+@app.route("/jobs/<job_id>/result", methods=["GET"])
+def job_result(job_id):
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({"status": "error", "message": "Job non trovato."}), 404
+    if job["state"] == "error":
+        return jsonify({"status": "error", "message": job["message"]}), 500
+    if job["state"] != "done":
+        return jsonify({"status": "error", "message": "Elaborazione non ancora completata."}), 409
+    try:
+        with open(job_manager.result_path(job_id), "rb") as f:
+            content = f.read()
+    except OSError:
+        return jsonify({"status": "error", "message": "Risultato non più disponibile."}), 410
+    return attachment(content, job["output_filename"], job["content_type"])
+
+
+# --- Bulk Conversion ---
+# POST /bulk accepts many PDFs and/or ZIP archives in the "pdf_files" field. Each upload is
+# tagged with a bank/doc_type pair: either one pair for everything, or one "bank" and one
+# "doc_type" field per uploaded file, in order. PDFs inside a ZIP can be tagged individually
+# with a manifest.csv (file;bank;doc_type) at the root of the archive. Untagged files (or files
+# tagged "auto") are detected from their first page. The conversion runs as
+# a background job whose result is a ZIP of CSVs plus a per-file manifest.csv.
+
+@app.route("/bulk", methods=["POST"])
+def submit_bulk():
+    uploads = [f for f in request.files.getlist("pdf_files") if f and f.filename]
+    if not uploads:
+        return jsonify({"status": "error", "message": "Nessun file inviato."}), 400
+
+    banks = request.form.getlist("bank")
+    doc_types = request.form.getlist("doc_type")
+    if len(banks) != len(doc_types) or len(banks) not in (0, 1, len(uploads)):
+        return jsonify({"status": "error", "message": "Indica una banca e un tipo di documento per tutti i file o per ciascun file."}), 400
+
+    def tag_for(upload_index):
+        if not banks:
+            return "", ""
+        index = upload_index if len(banks) > 1 else 0
+        return banks[index], doc_types[index]
+
+    work_dir = tempfile.mkdtemp(prefix="bulk_", dir=JOBS_DIR)
+    items = []
+
+    def add_item(name, bank, doc_type, pdf_stream):
+        path = os.path.join(work_dir, f"{len(items)}.pdf")
+        with open(path, "wb") as f:
+            shutil.copyfileobj(pdf_stream, f)
+        item = {"file": name, "bank": bank, "doc_type": doc_type,
+                "script": SCRIPT_MAP.get((bank, doc_type)), "path": path}
+        if wants_detection(bank, doc_type):
+            try:
+                with open(path, "rb") as f:
+                    key, item["script"], candidates = fingerprint_index.detect(f, ocr=False)
+            except Exception as e:
+                print(f"Riconoscimento fallito ({name}): {type(e).__name__}: {e}") # Log server-side
+                key, candidates = None, []
+            if item["script"] is not None:
+                item["bank"], item["doc_type"] = key
+            else:
+                item["error"] = detection_message(candidates)
+                item["detect"] = True  # Retried with OCR by the job
+        items.append(item)
+
+    def detect_item(path):
+        with open(path, "rb") as f:
+            key, script_name, candidates = fingerprint_index.detect(f)
+        return key, script_name, detection_message(candidates)
+
+    try:
+        for upload_index, upload in enumerate(uploads):
+            bank, doc_type = tag_for(upload_index)
+            if upload.filename.lower().endswith(".zip"):
+                with zipfile.ZipFile(upload.stream) as zf:
+                    members = [m for m in zf.infolist() if not m.is_dir() and m.filename.lower().endswith(".pdf")]
+                    if sum(m.file_size for m in members) > BULK_MAX_UNCOMPRESSED_BYTES:
+                        raise ValueError(f"Archivio '{upload.filename}' troppo grande.")
+                    tags = bulk.read_manifest(zf)
+                    for member in members:
+                        member_bank, member_doc_type = tags.get(member.filename, (bank, doc_type))
+                        with zf.open(member) as member_stream:
+                            add_item(member.filename, member_bank, member_doc_type, member_stream)
+            else:
+                add_item(upload.filename, bank, doc_type, upload.stream)
+    except (zipfile.BadZipFile, ValueError) as e:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        return jsonify({"status": "error", "message": f"Archivio non valido: {e}"}), 400
+
+    if not items:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        return jsonify({"status": "error", "message": "Nessun PDF trovato nei file inviati."}), 400
+
+    # A bulk job queues like any conversion; once admitted it also takes the slots that
+    # are free (up to BULK_WORKERS) and runs one worker per slot it holds.
+    ticket = admission.enter()
+    if ticket is None:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        print("Bulk rifiutato: coda piena") # Log server-side
+        return overloaded_response("bulk")
+
+    def convert(progress):
+        def run():
+            try:
+                admission.admit(ticket=ticket)
+                workers = ticket.widen(BULK_WORKERS)
+                yield bulk.run_bulk(items, workers, result_cache, progress, detect_item)
+            finally:
+                ticket.release()
+                shutil.rmtree(work_dir, ignore_errors=True)
+        return metrics.track_conversion("bulk", run)
+
+    output_filename = os.path.splitext(sanitize_filename(request.form.get("output_filename", "conversione")))[0] + ".zip"
+    job_id = job_manager.submit(convert, output_filename, content_type="application/zip", progress_unit="files",
+                                work_paths=[work_dir])
+    return jsonify({
+        "status": "ok",
+        "job_id": job_id,
+        "files": len(items),
+        "status_url": url_for("job_status", job_id=job_id),
+        "result_url": url_for("job_result", job_id=job_id),
+    }), 202
+
+
+@app.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    response = make_response(metrics.render())
+    response.headers["Content-Type"] = "text/plain; version=0.0.4; charset=utf-8"
+    return response
+
+
 if __name__ == '__main__':
     app.run(host="0.0.0.0", port=5000, debug=True)# Keep debug=True for development ONLY
\ No newline at end of file
@@ -0,0 +1,210 @@
+import os
+
+# --- Synthetic statement PDFs for the benchmarks ---
+# One generator per SCRIPT_MAP layout: same column lines, date formats and amount
+# formats as the real statements, filled with deterministic made-up transactions.
+# Needs reportlab (pip install reportlab), which the app itself does not use.
+
+try:
+    from reportlab.pdfgen import canvas
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.utils import ImageReader
+except ImportError:
+    canvas = None
+    A4 = (595.2756, 841.8898)
+
+PAGE_WIDTH, PAGE_HEIGHT = A4
+
+def amount(n):
+    """Deterministic Italian-formatted amount for row n, e.g. "7.920,01"."""
+    return f"{(n * 7919) % 9000 + 1:,}".replace(",", ".") + f",{n % 100:02d}"
+
+def new_canvas(path):
+    if canvas is None:
+        raise RuntimeError("reportlab non installato: pip install reportlab")
+    return canvas.Canvas(path, pagesize=A4)
+
+def table_pdf(path, vlines, make_row, pages, rows_per_page=30, font=7, row_h=14, top=120, lines=True):
+    """
+    Draws a ruled table: make_row(n) returns {column_index: text} for row n, and the
+    text is drawn just right of that column's line.
+    """
+    c = new_canvas(path)
+    n = 0
+    for page in range(pages):
+        c.setFont("Helvetica", font)
+        c.drawString(40, PAGE_HEIGHT - 60, f"Estratto conto pagina {page + 1}")
+        for _ in range(rows_per_page):
+            row_top = top + (n % rows_per_page) * row_h
+            if lines:
+                c.line(vlines[0], PAGE_HEIGHT - row_top, vlines[-1], PAGE_HEIGHT - row_top)
+            for column, text in make_row(n).items():
+                c.drawString(vlines[column] + 1.5, PAGE_HEIGHT - row_top - row_h + 4, text)
+            n += 1
+        if lines:
+            row_top = top + rows_per_page * row_h
+            c.line(vlines[0], PAGE_HEIGHT - row_top, vlines[-1], PAGE_HEIGHT - row_top)
+        c.showPage()
+    c.save()
+
+def text_pdf(path, pages, make_lines):
+    """Draws free text: make_lines(page, pages) returns (x, text) lines, 12pt apart."""
+    c = new_canvas(path)
+    for page in range(pages):
+        y = PAGE_HEIGHT - 60
+        for x, text in make_lines(page, pages):
+            c.drawString(x, y, text)
+            y -= 12
+        c.showPage()
+    c.save()
+
+def ec_credit_agricole(path, pages):
+    table_pdf(path, [25, 68, 120, 174, 180, 240, 243, 525], lambda n: (
+        {0: f"{n % 28 + 1:02d}.01.24", 1: "01.01.24", 2 if n % 2 else 4: amount(n), 5: f"PAGAMENTO {n}"}
+        if n % 5 else {5: f"seguito {n}"}  # Description continuation line
+    ), pages)
+
+def ec_sondrio(path, pages):
+    table_pdf(path, [22, 77, 158, 220, 250, 320, 340, 550], lambda n: {
+        0: f"{n % 28 + 1:02d}/02/2024", 1: "02/02/2024", 2 if n % 2 else 4: amount(n),
+        6: "Saldo iniziale" if n == 0 else f"BONIFICO {n}",
+    }, pages)
+
+def m_sondrio(path, pages):
+    table_pdf(path, [40, 80, 177, 358, 380, 455, 500, 556], lambda n: (
+        {0: "DATA", 2: "DESCRIZIONE"} if n == 0 else
+        {0: f"{n % 28 + 1:02d}/03/2024", 2: f"ADDEBITO SDD {n}", 4 if n % 2 else 6: amount(n) + " EUR"}
+    ), pages)
+
+def ec_buffetti(path, pages):
+    table_pdf(path, [59, 95, 116, 273, 428, 479, 504, 553], lambda n: {
+        0: f"{n % 28 + 1:02d}/04/2024", 1: "x", 2: "SALDO INIZIALE" if n == 0 else f"POS {n}",
+        4 if n % 2 else 6: amount(n),
+    }, pages)
+
+def ec_sella(path, pages):
+    # Sella rows sit on a fixed 10pt grid, without ruling lines.
+    table_pdf(path, [30, 70, 110, 430, 500, 562], lambda n: {
+        0: f"{n % 28 + 1:02d} 05 24", 1: f"{n % 28 + 1:02d} 05 24", 2: f"DISPOSIZIONE {n}",
+        3 if n % 2 else 4: amount(n),
+    }, pages, rows_per_page=60, row_h=10, top=100, lines=False)
+
+INTESA_VLINES = [22, 62, 161, 350, 560]
+INTESA_AMOUNT_RIGHT = {"Uscite": 428, "Entrate": 555}  # Right edges, inside AMOUNT_COLUMNS
+INTESA_ROWS_PER_PAGE = 30
+
+def intesa_rows(pages):
+    """Yields (page, row_top, n, column, text) for the Intesa fixtures."""
+    for page in range(pages):
+        for row in range(INTESA_ROWS_PER_PAGE):
+            n = page * INTESA_ROWS_PER_PAGE + row
+            yield page, 120 + row * 14, n, "Uscite" if n % 2 else "Entrate", amount(n)
+
+def intesa_pdf(path, pages, scanned):
+    """
+    Intesa statement; with scanned, the amounts are only in a page image (as in the
+    statements the OCR path exists for) while dates and descriptions stay text.
+    """
+    c = new_canvas(path)
+    rows = list(intesa_rows(pages))
+    for page in range(pages):
+        c.setFont("Helvetica", 7)
+        page_rows = [r for r in rows if r[0] == page]
+        if scanned:
+            c.drawImage(ImageReader(intesa_amounts_image(page_rows)), 0, 0, PAGE_WIDTH, PAGE_HEIGHT)
+        for _, row_top, n, column, text in page_rows:
+            y = PAGE_HEIGHT - row_top
+            c.line(INTESA_VLINES[0], y + 11, INTESA_VLINES[-1], y + 11)
+            c.drawString(24, y, f"{n % 28 + 1:02d}.06.2024")
+            c.drawString(64, y, "06.06.2024")
+            c.drawString(165, y, f"COMMISSIONI {n}")
+            if not scanned:
+                c.drawRightString(INTESA_AMOUNT_RIGHT[column], y, text)
+        c.line(INTESA_VLINES[0], y - 3, INTESA_VLINES[-1], y - 3)
+        c.showPage()
+    c.save()
+
+def intesa_amounts_image(page_rows, dpi=300):
+    """Renders the amounts of one page as a grayscale 'scan' at dpi."""
+    from PIL import Image, ImageDraw, ImageFont
+    scale = dpi / 72
+    image = Image.new("L", (int(PAGE_WIDTH * scale), int(PAGE_HEIGHT * scale)), 255)
+    draw = ImageDraw.Draw(image)
+    font = ImageFont.load_default(size=int(9 * scale))
+    for _, row_top, _, column, text in page_rows:
+        draw.text((INTESA_AMOUNT_RIGHT[column] * scale, (row_top - 8) * scale), text, fill=0, font=font, anchor="ra")
+    return image
+
+def ec_intesa(path, pages):
+    intesa_pdf(path, pages, scanned=False)
+
+def ec_intesa_scanned(path, pages):
+    intesa_pdf(path, pages, scanned=True)
+
+def m_bpm(path, pages):
+    def lines(page, _):
+        for i in range(40):
+            n = page * 40 + i
+            yield 30, f"{n % 28 + 1:02d}/07/2024 {n % 28 + 1:02d}/07/2024 {'-' if n % 2 else ''}{amount(n)} EUR XX PAGAMENTO POS {n}"
+            if n % 3 == 0:
+                yield 60, "presso negozio"
+    text_pdf(path, pages, lines)
+
+def m_credit_agricole(path, pages):
+    def lines(page, pages):
+        for i in range(50):
+            n = page * 50 + i
+            yield 30, f"{n % 28 + 1:02d}/08/24 ACCREDITO STIPENDIO {n} {'-' if n % 2 else ''}{amount(n)}"
+        if page == pages - 1:
+            yield 30, "RIEPILOGO DEI SUOI MOVIMENTI"
+            yield 30, "31/08/24 saldo"
+            yield 30, "Impostadibollo 2,00"
+    text_pdf(path, pages, lines)
+
+def ec_qonto(path, pages):
+    def lines(page, pages):
+        yield 40, "Dal giorno 01/09 al 30/09"
+        yield 40, f"{page + 1}/{pages}"
+        for i in range(20):
+            n = page * 20 + i
+            yield 40, f"{n % 28 + 1}/9 Transazione {n} {'+' if n % 2 else '-'} {amount(n)} EUR"
+            yield 60, "TESA header"
+            yield 60, "riferimento extra"
+    text_pdf(path, pages, lines)
+
+def ec_bpm(path, pages):
+    def lines(page, pages):
+        for i in range(18):
+            n = page * 18 + i
+            yield 30, f"{n % 28 + 1:02d}/10/24 {n % 28 + 1:02d}/10/24 {n % 28 + 1:02d}/10/24 {'- ' if n % 2 else ''}{amount(n)} BONIFICO A {n}"
+            yield 60, "causale fattura"
+            if n % 4 == 0:
+                yield 60, "pagina 3 RIEPILOGO"
+        if page == pages - 1:
+            yield 30, "SALDO FINALE 1.000,00"
+    text_pdf(path, pages, lines)
+
+# fixture name -> (script module, generator(path, pages))
+FIXTURES = {
+    "EcBPM": ("script.EcBPM", ec_bpm),
+    "mBPM": ("script.mBPM", m_bpm),
+    "EcCreditAgricole": ("script.EcCreditAgricole", ec_credit_agricole),
+    "mCreditAgricole": ("script.mCreditAgricole", m_credit_agricole),
+    "EcQONTO": ("script.EcQONTO", ec_qonto),
+    "EcSELLA": ("script.EcSELLA", ec_sella),
+    "EcSONDRIO": ("script.EcSONDRIO", ec_sondrio),
+    "mSONDRIO": ("script.mSONDRIO", m_sondrio),
+    "EcBuffetti": ("script.EcBuffetti", ec_buffetti),
+    "EcIntesa": ("script.EcIntesa", ec_intesa),
+    "EcIntesa-scanned": ("script.EcIntesa", ec_intesa_scanned),
+}
+
+def fixture_path(directory, name, pages):
+    """Generates the fixture on first use and returns its path."""
+    path = os.path.join(directory, f"{name}-{pages}p.pdf")
+    if not os.path.exists(path):
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        FIXTURES[name][1](tmp_path, pages)
+        os.replace(tmp_path, path)
+    return path
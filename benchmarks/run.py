@@ -0,0 +1,224 @@
+"""
+Extraction benchmarks: runs every SCRIPT_MAP script on synthetic statements of
+1, 10 and 200 pages and reports pages/sec and peak memory per stage.
+
+    python -m benchmarks.run                      # run and compare with the baseline
+    python -m benchmarks.run --save-baseline      # run and store the results as baseline
+    python -m benchmarks.run --only EcSELLA --sizes 1 10
+
+Stages: "extract" consumes the script's iter_batches (PDF parsing and row logic),
+"csv" serializes the transaction batches; for scans, "ocr" is the part of "extract"
+spent rendering and OCR'ing pages. Each case runs once as warmup (imports, caches),
+then at least --repeats times and for at least MIN_MEASURED_SECONDS in total; times
+are the medians of those runs. Peak memory is measured with tracemalloc in a separate
+pass, so it does not slow down the timed ones. At the FLAT_MEMORY_SIZES another pass
+measures the peak while the batches are streamed and discarded, as the server does:
+it must not grow with the page count. Scans are only run up to SCANNED_MAX_PAGES.
+
+Exits with status 1 when a case is slower (pages/sec, only checked from
+THROUGHPUT_MIN_PAGES pages: smaller cases are dominated by fixed costs and noise) or
+uses more memory than the baseline beyond --tolerance, when its CSV output changed,
+or when its streaming peak at the largest FLAT_MEMORY_SIZES is over
+MEMORY_GROWTH_LIMIT times the one at the smallest, and with status 2 when there is
+no baseline to compare with (create it with --save-baseline).
+"""
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import importlib
+import statistics
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fixtures import FIXTURES, fixture_path
+from script import csvout, timing
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, "baseline.json")
+DEFAULT_FIXTURES_DIR = os.path.join(BENCH_DIR, ".fixtures")
+DEFAULT_SIZES = [1, 10, 200]
+DEFAULT_TOLERANCE = 0.25
+DEFAULT_REPEATS = 3
+MIN_MEASURED_SECONDS = 2.0
+MAX_RUNS = 50
+THROUGHPUT_MIN_PAGES = 10
+SCANNED_MAX_PAGES = 10
+STAGES = ["extract", "csv"]
+OCR_STAGE = "ocr"  # Stage EcIntesa reports for rendering and OCR (see script.timing)
+FLAT_MEMORY_SIZES = (10, 200)
+MEMORY_GROWTH_LIMIT = 1.5
+
+def run_stages(module, pdf_path):
+    """Runs the stages once. Returns ({stage: seconds}, csv content); "ocr" only for OCR'd pages."""
+    timings = {}
+    with open(pdf_path, "rb") as f:
+        start = time.perf_counter()
+        batches, samples = timing.collected(lambda: list(module.iter_batches(f)))
+        timings["extract"] = time.perf_counter() - start
+    ocr_seconds = sum(seconds for _, stage, seconds in samples if stage == OCR_STAGE)
+    if ocr_seconds:
+        timings[OCR_STAGE] = ocr_seconds
+    start = time.perf_counter()
+    content = csvout.to_csv(module.FIELDNAMES, module.OUTPUT, batches, **getattr(module, "CSV_FORMAT", csvout.DEFAULT_FORMAT))
+    timings["csv"] = time.perf_counter() - start
+    return timings, content
+
+def measure_peaks(module, pdf_path):
+    """Peak traced Python memory allocated by each stage (above what was held before it), in bytes."""
+    def stage_peak(run):
+        held = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        result = run()
+        return result, tracemalloc.get_traced_memory()[1] - held
+
+    peaks = {}
+    tracemalloc.start()
+    try:
+        with open(pdf_path, "rb") as f:
+            batches, peaks["extract"] = stage_peak(lambda: list(module.iter_batches(f)))
+        _, peaks["csv"] = stage_peak(lambda: csvout.to_csv(
+            module.FIELDNAMES, module.OUTPUT, batches, **getattr(module, "CSV_FORMAT", csvout.DEFAULT_FORMAT)))
+    finally:
+        tracemalloc.stop()
+    return peaks
+
+def time_stages(module, pdf_path, repeats):
+    """
+    Runs the stages once as warmup, then at least repeats times and for at least
+    MIN_MEASURED_SECONDS (at most MAX_RUNS times). Returns ({stage: median seconds},
+    median total seconds, csv content).
+    """
+    _, content = run_stages(module, pdf_path)
+    runs, measured = [], 0.0
+    while len(runs) < MAX_RUNS and (len(runs) < repeats or measured < MIN_MEASURED_SECONDS):
+        timings, _ = run_stages(module, pdf_path)
+        runs.append(timings)
+        measured += sum(timings[stage] for stage in STAGES)
+    medians = {stage: statistics.median(t.get(stage, 0.0) for t in runs) for stage in runs[0]}
+    total = statistics.median(sum(t[stage] for stage in STAGES) for t in runs)
+    return medians, total, content
+
+def measure_stream_peak(module, pdf_path):
+    """Peak traced Python memory while the batches are consumed and discarded, in bytes."""
+    tracemalloc.start()
+    try:
+        with open(pdf_path, "rb") as f:
+            for _ in module.iter_batches(f):
+                pass
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+def run_case(name, pages, fixtures_dir, measure_memory=True, repeats=DEFAULT_REPEATS):
+    """Benchmarks one fixture. Returns the result dict, or None if the case cannot run here."""
+    script_name, _ = FIXTURES[name]
+    module = importlib.import_module(script_name)
+    if name.endswith("-scanned"):
+        problems = module.check_dependencies() if hasattr(module, "check_dependencies") else []
+        if not problems and pages > SCANNED_MAX_PAGES:
+            problems = [f"scansioni solo fino a {SCANNED_MAX_PAGES} pagine"]
+        if problems:
+            print(f"{name:<18} {pages:>4}p  saltato: {problems[0]}")
+            return None
+    pdf_path = fixture_path(fixtures_dir, name, pages)
+    timings, total, content = time_stages(module, pdf_path, repeats)
+    result = {
+        "pages": pages,
+        "rows": content.count("\n") - 1,
+        "sha256": hashlib.sha256(content.encode("utf-8")).hexdigest(),
+        "seconds": {stage: round(seconds, 4) for stage, seconds in timings.items()},
+        "pages_per_sec": round(pages / total, 2) if total else None,
+        "peak_kb": None,
+    }
+    if measure_memory:
+        peaks = measure_peaks(module, pdf_path)
+        result["peak_kb"] = {stage: peaks[stage] // 1024 for stage in STAGES}
+        if pages in FLAT_MEMORY_SIZES:
+            result["stream_peak_kb"] = measure_stream_peak(module, pdf_path) // 1024
+    peak_text = "" if result["peak_kb"] is None else "  peak " + " ".join(
+        f"{stage}={result['peak_kb'][stage]}KB" for stage in STAGES)
+    ocr_text = f"  ocr {result['seconds'][OCR_STAGE]}s" if OCR_STAGE in result["seconds"] else ""
+    print(f"{name:<18} {pages:>4}p  {result['rows']:>6} righe  {result['pages_per_sec']:>8} pag/s{ocr_text}{peak_text}")
+    return result
+
+def compare(results, baseline, tolerance):
+    """Returns the list of regressions of results against baseline."""
+    regressions = []
+    for key, result in results.items():
+        base = baseline.get(key)
+        if base is None:
+            continue
+        if result["sha256"] != base["sha256"]:
+            regressions.append(f"{key}: output CSV cambiato ({base['rows']} -> {result['rows']} righe)")
+        if (result["pages"] >= THROUGHPUT_MIN_PAGES and base.get("pages_per_sec")
+                and result["pages_per_sec"] < base["pages_per_sec"] * (1 - tolerance)):
+            regressions.append(f"{key}: {result['pages_per_sec']} pag/s, baseline {base['pages_per_sec']}")
+        if base.get("peak_kb") and result["peak_kb"]:
+            for stage in STAGES:
+                if result["peak_kb"][stage] > base["peak_kb"][stage] * (1 + tolerance):
+                    regressions.append(f"{key}: picco memoria {stage} {result['peak_kb'][stage]}KB, baseline {base['peak_kb'][stage]}KB")
+    return regressions
+
+def check_flat_memory(results):
+    """Returns the fixtures whose streaming peak grows with the page count (see FLAT_MEMORY_SIZES)."""
+    small, large = min(FLAT_MEMORY_SIZES), max(FLAT_MEMORY_SIZES)
+    problems = []
+    for key, result in results.items():
+        name, pages = key.rsplit("/", 1)
+        base = results.get(f"{name}/{small}")
+        if int(pages) != large or base is None or not result.get("stream_peak_kb") or not base.get("stream_peak_kb"):
+            continue
+        if result["stream_peak_kb"] > base["stream_peak_kb"] * MEMORY_GROWTH_LIMIT:
+            problems.append(f"{name}: picco memoria in streaming {result['stream_peak_kb']}KB a {large} pagine, "
+                            f"{base['stream_peak_kb']}KB a {small}")
+    return problems
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark delle estrazioni per banca.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="numero di pagine dei PDF")
+    parser.add_argument("--only", nargs="+", choices=sorted(FIXTURES), help="limita ai fixture indicati")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="salva i risultati come nuova baseline")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help="scostamento ammesso (0.25 = 25%%)")
+    parser.add_argument("--fixtures", default=DEFAULT_FIXTURES_DIR, help="cartella dei PDF generati")
+    parser.add_argument("--no-memory", action="store_true", help="salta la misura della memoria")
+    parser.add_argument("--repeats", type=int, default=DEFAULT_REPEATS, help="esecuzioni misurate per caso (dopo il riscaldamento)")
+    args = parser.parse_args(argv)
+
+    results = {}
+    for name in args.only or FIXTURES:
+        for pages in args.sizes:
+            result = run_case(name, pages, args.fixtures, measure_memory=not args.no_memory, repeats=args.repeats)
+            if result is not None:
+                results[f"{name}/{pages}"] = result
+
+    growth = check_flat_memory(results)
+    for problem in growth:
+        print(f"REGRESSIONE {problem}")
+
+    if args.save_baseline:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline, "r", encoding="utf-8") as f:
+                baseline = json.load(f)
+        baseline.update(results)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        print(f"Baseline salvata in {args.baseline}")
+        return 1 if growth else 0
+
+    if not os.path.exists(args.baseline):
+        print(f"Nessuna baseline in {args.baseline}: esegui con --save-baseline.")
+        return 2
+    with open(args.baseline, "r", encoding="utf-8") as f:
+        regressions = compare(results, json.load(f), args.tolerance)
+    for regression in regressions:
+        print(f"REGRESSIONE {regression}")
+    return 1 if regressions or growth else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,154 @@
+import os
+import sys
+import io
+import csv
+import zipfile
+import importlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from result_cache import ResultCache, hash_file, module_version
+from script import csvout, timing
+
+# --- Bulk conversion of many PDFs ---
+# Each item is converted by the SCRIPT_MAP module it is tagged with, in a pool of
+# worker processes; the results are packed in a ZIP together with a manifest that
+# reports the outcome of every file.
+
+MANIFEST_NAME = "manifest.csv"
+MANIFEST_FIELDS = ["file", "bank", "doc_type", "status", "message", "csv"]
+
+
+def _init_worker():
+    """Files are already converted in parallel, so OCR inside each file stays sequential."""
+    os.environ["INTESA_OCR_WORKERS"] = "1"
+    intesa = sys.modules.get("script.EcIntesa")  # Already imported when the worker is forked
+    if intesa is not None:
+        intesa.OCR_WORKERS = 1
+
+
+def convert_file(script_name, pdf_path):
+    """
+    Converts a PDF stored on disk with a script module. Executed in a worker process.
+    Returns (csv_content, stage timing samples) for the parent to replay.
+    """
+    module = importlib.import_module(script_name)
+    with open(pdf_path, "rb") as f:
+        if hasattr(module, "iter_batches"):
+            return timing.collected(lambda: "".join(csvout.iter_module_csv(module, f)))
+        return timing.collected(module.process_pdf, f)
+
+
+def read_manifest(zf):
+    """
+    Reads the optional manifest.csv of an uploaded ZIP (columns: file;bank;doc_type).
+    Returns a dict mapping archive member names to (bank, doc_type).
+    """
+    if MANIFEST_NAME not in zf.namelist():
+        return {}
+    text = zf.read(MANIFEST_NAME).decode("utf-8-sig")
+    tags = {}
+    for row in csv.DictReader(io.StringIO(text), delimiter=";"):
+        name = (row.get("file") or "").strip()
+        if name:
+            tags[name] = ((row.get("bank") or "").strip(), (row.get("doc_type") or "").strip())
+    return tags
+
+
+def csv_name_for(pdf_name, used_names):
+    """Derives a unique .csv archive name from a PDF file name."""
+    base = os.path.splitext(os.path.basename(pdf_name))[0] or "output"
+    name = f"{base}.csv"
+    counter = 2
+    while name in used_names:
+        name = f"{base}_{counter}.csv"
+        counter += 1
+    used_names.add(name)
+    return name
+
+
+def run_bulk(items, workers, result_cache=None, progress=None, detect=None):
+    """
+    Converts a batch of PDFs and returns the ZIP archive as bytes.
+    items is a list of dicts with keys "file", "bank", "doc_type", "script" (None when the
+    bank/doc_type pair is not in SCRIPT_MAP) and "path" (the PDF saved on disk).
+    Items flagged "detect" are detected again first with detect(path), which returns
+    (key, script_name, error message).
+    Results already in result_cache are reused; the rest are converted in parallel.
+    If given, progress(files_done, files_total) is called as files complete.
+    """
+    results = {}  # item index -> (status, message, csv_content)
+    pending = {}  # item index -> cache key (or None)
+    for index, item in enumerate(items):
+        if item.get("detect") and detect is not None:
+            try:
+                key, script_name, message = detect(item["path"])
+            except Exception as e:
+                print(f"Riconoscimento fallito ({item['file']}): {type(e).__name__}: {e}") # Log server-side
+            else:
+                if script_name is not None:
+                    item["script"], (item["bank"], item["doc_type"]) = script_name, key
+                else:
+                    item["error"] = message
+        if item["script"] is None:
+            results[index] = ("error", item.get("error") or f"La combinazione '{item['bank']}' - '{item['doc_type']}' non è valida.", None)
+            continue
+        cache_key = None
+        if result_cache is not None:
+            try:
+                module = importlib.import_module(item["script"])
+                with open(item["path"], "rb") as f:
+                    cache_key = ResultCache.make_key(hash_file(f), item["script"], module_version(module))
+                cached = result_cache.get(cache_key)
+                if cached is not None:
+                    results[index] = ("ok", "", cached)
+                    continue
+            except (OSError, ImportError) as e:
+                print(f"Bulk cache lookup failed for {item['file']}: {e}") # Log server-side
+        pending[index] = cache_key
+
+    files_total = len(items)
+    if progress:
+        progress(len(results), files_total)
+
+    if pending:
+        with ProcessPoolExecutor(max_workers=max(1, min(workers, len(pending))), initializer=_init_worker) as executor:
+            futures = {
+                executor.submit(convert_file, items[index]["script"], items[index]["path"]): index
+                for index in pending
+            }
+            for future in as_completed(futures):
+                index = futures[future]
+                try:
+                    csv_content, samples = future.result()
+                    timing.replay(samples)
+                except Exception as e:
+                    print(f"Errore bulk {items[index]['file']}: {type(e).__name__}: {e}") # Log server-side
+                    results[index] = ("error", "Errore durante l'elaborazione del file.", None)
+                else:
+                    results[index] = ("ok", "", csv_content)
+                    if pending[index] is not None and isinstance(csv_content, str):
+                        try:
+                            result_cache.put(pending[index], csv_content)
+                        except OSError as e:
+                            print(f"Result cache store failed: {e}") # Log server-side
+                if progress:
+                    progress(len(results), files_total)
+
+    archive = io.BytesIO()
+    used_names = {MANIFEST_NAME}
+    manifest = io.StringIO()
+    writer = csv.DictWriter(manifest, fieldnames=MANIFEST_FIELDS, delimiter=";")
+    writer.writeheader()
+    with zipfile.ZipFile(archive, "w", zipfile.ZIP_DEFLATED) as zf:
+        for index, item in enumerate(items):
+            status, message, csv_content = results[index]
+            csv_name = ""
+            if status == "ok":
+                csv_name = csv_name_for(item["file"], used_names)
+                zf.writestr(csv_name, csv_content)
+            writer.writerow({
+                "file": item["file"], "bank": item["bank"], "doc_type": item["doc_type"],
+                "status": status, "message": message, "csv": csv_name,
+            })
+        zf.writestr(MANIFEST_NAME, manifest.getvalue())
+    return archive.getvalue()
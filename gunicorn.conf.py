@@ -0,0 +1,17 @@
+import os
+
+# --- Production serving (gunicorn -c gunicorn.conf.py app:app) ---
+# Several worker processes with a few threads each; the app is loaded once in the
+# master (startup checks run once, workers share its memory). How many conversions
+# actually run at the same time is decided by the app's admission control
+# (CONVERSION_SLOTS / CONVERSION_QUEUE), not by the number of workers.
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+workers = int(os.environ.get("WEB_CONCURRENCY", 2))
+worker_class = "gthread"
+threads = int(os.environ.get("WEB_THREADS", 4))
+# Long enough for a /run_script request that waits for a slot and then runs OCR.
+timeout = int(os.environ.get("WEB_TIMEOUT", 300))
+graceful_timeout = 30
+preload_app = True
+accesslog = "-"
@@ -0,0 +1,140 @@
+import os
+import json
+import time
+import uuid
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# --- Background conversion jobs ---
+# Job state is kept on disk (one JSON status file and one result file per job), so
+# any server process can answer status/result polls, not only the one running the job.
+
+JOB_STATES = ("queued", "running", "done", "error")
+
+# A queued or running job whose status has not changed for this many TTLs is taken as
+# abandoned (e.g. the server restarted before running it), and its files are cleaned up.
+ABANDONED_TTL_FACTOR = 24
+
+
+class JobManager:
+    """Runs conversions on a pool of background threads and tracks their progress."""
+
+    def __init__(self, directory, workers, ttl_seconds):
+        self.directory = directory
+        self.ttl_seconds = ttl_seconds
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="job")
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _status_path(self, job_id):
+        return os.path.join(self.directory, f"{job_id}.json")
+
+    def result_path(self, job_id):
+        return os.path.join(self.directory, f"{job_id}.out")
+
+    def _write_status(self, job_id, status):
+        path = self._status_path(job_id)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(status, f)
+        os.replace(tmp_path, path)  # Atomic: pollers never see a partial file
+
+    def _update(self, job_id, **changes):
+        with self._lock:
+            status = self.get(job_id) or {}
+            status.update(changes, updated_at=time.time())
+            self._write_status(job_id, status)
+
+    def get(self, job_id):
+        """Returns the status dict of a job, or None if the id is unknown or malformed."""
+        try:
+            uuid.UUID(hex=job_id)
+        except (TypeError, ValueError):
+            return None  # Never build paths from arbitrary user input
+        try:
+            with open(self._status_path(job_id), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def submit(self, convert, output_filename, content_type="text/csv", progress_unit="pages", work_paths=(), **info):
+        """
+        Queues convert(progress) for background execution and returns the new job id.
+        convert must return the result as a string (stored as UTF-8), bytes, or an
+        iterable of string chunks that is written out as it is produced;
+        progress(done, total) may be called by it to report progress, counted in
+        progress_unit ("pages" for a single PDF, "files" for bulk jobs).
+        work_paths lists the files or directories in the jobs directory that convert
+        reads (e.g. an uploaded PDF): cleanup() leaves them alone until the job is over.
+        """
+        self.cleanup()
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        self._write_status(job_id, dict(
+            info, job_id=job_id, state="queued", pages_done=0, pages_total=None,
+            output_filename=output_filename, content_type=content_type, progress_unit=progress_unit,
+            work_paths=[os.path.abspath(path) for path in work_paths],
+            message="", created_at=now, updated_at=now,
+        ))
+        self._executor.submit(self._run, job_id, convert)
+        return job_id
+
+    def _run(self, job_id, convert):
+        self._update(job_id, state="running")
+
+        def progress(pages_done, pages_total):
+            self._update(job_id, pages_done=pages_done, pages_total=pages_total)
+
+        try:
+            content = convert(progress)
+            if isinstance(content, (str, bytes)):
+                content = [content]
+            with open(self.result_path(job_id), "wb") as f:
+                for chunk in content:
+                    f.write(chunk.encode("utf-8") if isinstance(chunk, str) else chunk)
+            # A conversion can end before its last page (e.g. at a statement's end marker):
+            # once done, every page counts as done.
+            job = self.get(job_id) or {}
+            self._update(job_id, state="done", pages_done=job.get("pages_total") or job.get("pages_done", 0))
+        except Exception as e:
+            print(f"Errore job {job_id}: {type(e).__name__}: {e}") # Log server-side detailed error
+            self._update(job_id, state="error", message="Errore durante l'elaborazione del file.")
+
+    def cleanup(self):
+        """
+        Removes the files older than the TTL from the jobs directory: status and result
+        files, uploads and bulk work directories. The files of queued or running jobs
+        (their status, result and work_paths) are kept, unless the job was abandoned.
+        """
+        now = time.time()
+        cutoff = now - self.ttl_seconds
+        abandoned = now - self.ttl_seconds * ABANDONED_TTL_FACTOR
+        with os.scandir(self.directory) as it:
+            entries = list(it)
+        keep = set()
+        for entry in entries:
+            if not entry.name.endswith(".json"):
+                continue
+            try:
+                with open(entry.path, "r", encoding="utf-8") as f:
+                    status = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if status.get("state") in ("queued", "running") and status.get("updated_at", 0) >= abandoned:
+                job_id = entry.name[:-len(".json")]
+                keep.add(os.path.abspath(entry.path))
+                keep.add(os.path.abspath(self.result_path(job_id)))
+                keep.update(status.get("work_paths", []))
+        for entry in entries:
+            if os.path.abspath(entry.path) in keep:
+                continue
+            try:
+                if entry.stat().st_mtime >= cutoff:
+                    continue
+                if entry.is_dir(follow_symlinks=False):
+                    shutil.rmtree(entry.path)
+                else:
+                    os.remove(entry.path)
+            except OSError:
+                continue
@@ -0,0 +1,266 @@
+import os
+import json
+import time
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows (desktop build): a single process, no snapshots to retire
+    fcntl = None
+
+# --- Prometheus-style metrics ---
+# Each server process keeps its own counters and histograms and periodically writes a
+# snapshot to METRICS_DIR/<pid>.json; /metrics merges the snapshots of all processes,
+# so every gunicorn worker's traffic is visible whichever worker answers the scrape.
+# Conversions run in pool processes report their stage timings back to the parent
+# (see script.timing.collected), so they end up here too.
+# When a process is gone (e.g. a worker recycled by gunicorn), its counters and
+# histograms are folded into RETIRED_SNAPSHOT, so totals never go down, and its gauges
+# are dropped: what it had in flight is not running any more.
+
+# Histogram buckets, in seconds: from a fast pdfplumber page up to a long OCR job.
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+SNAPSHOT_INTERVAL = 1.0
+RETIRED_SNAPSHOT = "retired.json"
+
+HELP = {
+    "toolobm_stage_seconds": ("histogram", "Time spent in one extraction stage of one conversion."),
+    "toolobm_conversion_seconds": ("histogram", "Total time of a conversion (cache misses only)."),
+    "toolobm_conversions_total": ("counter", "Conversions requested, by cache outcome."),
+    "toolobm_conversion_errors_total": ("counter", "Conversions that failed."),
+    "toolobm_conversions_in_flight": ("gauge", "Conversions currently running."),
+    "toolobm_conversions_rejected_total": ("counter", "Conversions turned away by admission control (HTTP 429)."),
+}
+
+
+def _key(name, labels):
+    return json.dumps([name, sorted(labels.items())])
+
+
+class Registry:
+    """Counters, gauges and histograms of this process, with on-disk snapshots."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._values = {}      # key -> number (counters and gauges)
+        self._histograms = {}  # key -> {"buckets": [...], "sum": s, "count": n}
+        self._lock = threading.Lock()
+        self._last_snapshot = 0.0
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            self._remove_dead_snapshots()
+
+    def inc(self, name, amount=1, **labels):
+        with self._lock:
+            key = _key(name, labels)
+            self._values[key] = self._values.get(key, 0) + amount
+        self._maybe_snapshot()
+
+    def observe(self, name, seconds, **labels):
+        with self._lock:
+            key = _key(name, labels)
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = {"buckets": [0] * len(BUCKETS), "sum": 0.0, "count": 0}
+            for index, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    histogram["buckets"][index] += 1
+            histogram["sum"] += seconds
+            histogram["count"] += 1
+        self._maybe_snapshot()
+
+    def _snapshot_path(self, pid):
+        return os.path.join(self.directory, f"{pid}.json")
+
+    def _maybe_snapshot(self):
+        if self.directory and time.monotonic() - self._last_snapshot >= SNAPSHOT_INTERVAL:
+            self.snapshot()
+
+    def snapshot(self):
+        """Writes this process's metrics to its snapshot file."""
+        if not self.directory:
+            return
+        with self._lock:
+            data = {"values": dict(self._values), "histograms": json.loads(json.dumps(self._histograms))}
+            self._last_snapshot = time.monotonic()
+        path = self._snapshot_path(os.getpid())
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            os.replace(tmp_path, path)  # Atomic: scrapes never read a partial file
+        except OSError as e:
+            print(f"Metrics snapshot failed: {e}") # Log server-side
+
+    def _remove_dead_snapshots(self):
+        """Drops snapshots left by processes that no longer exist (e.g. a previous run)."""
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                pid = entry.name.split(".")[0]
+                if entry.name == RETIRED_SNAPSHOT or (pid.isdigit() and not _pid_alive(int(pid))):
+                    try:
+                        os.remove(entry.path)
+                    except OSError:
+                        pass
+
+    def _retire_dead_snapshots(self):
+        """
+        Folds the snapshots of processes that have exited into RETIRED_SNAPSHOT, without
+        their gauges, and removes them. Serialized across processes with a lock file.
+        """
+        if fcntl is None:
+            return
+        with open(os.path.join(self.directory, "retire.lock"), "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            dead = []
+            with os.scandir(self.directory) as it:
+                for entry in it:
+                    pid = entry.name[:-len(".json")]
+                    if entry.name.endswith(".json") and pid.isdigit() and not _pid_alive(int(pid)):
+                        dead.append(entry.path)
+            if not dead:
+                return
+            retired_path = os.path.join(self.directory, RETIRED_SNAPSHOT)
+            snapshots = [_load_snapshot(retired_path) or {"values": {}, "histograms": {}}]
+            for path in dead:
+                data = _load_snapshot(path)
+                if data is not None:
+                    data["values"] = {key: value for key, value in data["values"].items() if not _is_gauge(key)}
+                    snapshots.append(data)
+            values, histograms = _merge(snapshots)
+            tmp_path = f"{retired_path}.{os.getpid()}.tmp"
+            try:
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump({"values": values, "histograms": histograms}, f)
+                os.replace(tmp_path, retired_path)
+                for path in dead:
+                    os.remove(path)
+            except OSError as e:
+                print(f"Metrics retire failed: {e}") # Log server-side
+
+    def collect(self):
+        """Returns the metrics of all processes merged: (values, histograms)."""
+        self.snapshot()
+        snapshots = []
+        if self.directory:
+            self._retire_dead_snapshots()
+            with os.scandir(self.directory) as it:
+                for entry in it:
+                    if entry.name.endswith(".json"):
+                        data = _load_snapshot(entry.path)
+                        if data is not None:
+                            snapshots.append(data)
+        else:
+            with self._lock:
+                snapshots.append({"values": dict(self._values), "histograms": json.loads(json.dumps(self._histograms))})
+        return _merge(snapshots)
+
+    def render(self):
+        """Prometheus text exposition format (version 0.0.4)."""
+        values, histograms = self.collect()
+        families = {}
+        for key, value in sorted(values.items()):
+            name, labels = json.loads(key)
+            families.setdefault(name, []).append(f"{name}{_format_labels(labels)} {_format_number(value)}")
+        for key, histogram in sorted(histograms.items()):
+            name, labels = json.loads(key)
+            lines = families.setdefault(name, [])
+            for bound, count in zip(BUCKETS, histogram["buckets"]):
+                lines.append(f"{name}_bucket{_format_labels(labels + [['le', _format_number(bound)]])} {count}")
+            lines.append(f"{name}_bucket{_format_labels(labels + [['le', '+Inf']])} {histogram['count']}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {_format_number(histogram['sum'])}")
+            lines.append(f"{name}_count{_format_labels(labels)} {histogram['count']}")
+        output = []
+        for name in sorted(families):
+            metric_type, help_text = HELP.get(name, ("untyped", ""))
+            output.append(f"# HELP {name} {help_text}")
+            output.append(f"# TYPE {name} {metric_type}")
+            output.extend(families[name])
+        return "\n".join(output) + "\n"
+
+    def track_conversion(self, script, make_chunks):
+        """
+        Starts a conversion with make_chunks() and returns its chunks, counting it as in
+        flight while they are consumed, from the first chunk until they are exhausted or
+        closed; records its duration, or an error. make_chunks should be lazy (a
+        generator), so the conversion runs while it is counted.
+        """
+        start = time.perf_counter()
+        try:
+            chunks = make_chunks()
+        except BaseException:
+            self._finish_conversion(script, start, failed=True)
+            raise
+        return self._tracked(script, start, chunks)
+
+    def _tracked(self, script, start, chunks):
+        failed = False
+        self.inc("toolobm_conversions_in_flight", 1, script=script)
+        try:
+            yield from chunks
+        except GeneratorExit:
+            raise  # Consumer stopped early (e.g. client disconnected): not a conversion error
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            self.inc("toolobm_conversions_in_flight", -1, script=script)
+            self._finish_conversion(script, start, failed)
+
+    def _finish_conversion(self, script, start, failed):
+        if failed:
+            self.inc("toolobm_conversion_errors_total", 1, script=script)
+        else:
+            self.observe("toolobm_conversion_seconds", time.perf_counter() - start, script=script)
+        self.snapshot()  # Idle processes must not report a stale in-flight count
+
+
+def _load_snapshot(path):
+    """Returns the snapshot stored at path, or None if it is missing or unreadable."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _merge(snapshots):
+    """Sums snapshots into (values, histograms)."""
+    values, histograms = {}, {}
+    for data in snapshots:
+        for key, value in data["values"].items():
+            values[key] = values.get(key, 0) + value
+        for key, histogram in data["histograms"].items():
+            merged = histograms.setdefault(key, {"buckets": [0] * len(BUCKETS), "sum": 0.0, "count": 0})
+            merged["buckets"] = [a + b for a, b in zip(merged["buckets"], histogram["buckets"])]
+            merged["sum"] += histogram["sum"]
+            merged["count"] += histogram["count"]
+    return values, histograms
+
+
+def _is_gauge(key):
+    return HELP.get(json.loads(key)[0], ("untyped",))[0] == "gauge"
+
+
+def _pid_alive(pid):
+    if os.name == "nt":
+        return True  # os.kill(pid, 0) would terminate the process on Windows
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True  # Exists but belongs to someone else
+    return True
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    def escape(value):
+        return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{name}="{escape(value)}"' for name, value in labels) + "}"
+
+
+def _format_number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
@@ -0,0 +1,173 @@
+import os
+import sys
+import json
+import types
+import hashlib
+import threading
+
+# --- Content-addressed cache of conversion results ---
+# Entries live on disk (one file per result) so they survive restarts, and are
+# evicted least-recently-used first once the size or entry limits are exceeded.
+# The file mtime doubles as the "last used" timestamp.
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def package_modules(module):
+    """
+    Returns module and the modules of its package it uses, directly or through each
+    other (e.g. script.EcSELLA -> script.transactions -> script.amounts), by name.
+    """
+    package = module.__name__.rpartition(".")[0]
+    found = {}
+    pending = [module]
+    while pending:
+        current = pending.pop()
+        if current.__name__ in found:
+            continue
+        found[current.__name__] = current
+        if not package:
+            continue
+        for value in vars(current).values():
+            used = value if isinstance(value, types.ModuleType) else sys.modules.get(getattr(value, "__module__", None) or "")
+            if used is not None and used.__name__.startswith(package + "."):
+                pending.append(used)
+    return [found[name] for name in sorted(found)]
+
+
+def module_version(module):
+    """
+    Returns a version string for a script module.
+    Uses the module's __version__ if it defines one, otherwise a digest of its
+    source file and of the shared modules it uses (see package_modules), so editing
+    a script or a helper such as script.amounts automatically invalidates its cached
+    results. The module's OUTPUT_SETTINGS (settings read from the environment that
+    change its output) are part of the version too.
+    """
+    digest = hashlib.sha256()
+    version = getattr(module, "__version__", None)
+    if version:
+        digest.update(str(version).encode("utf-8"))
+    else:
+        for used in package_modules(module):
+            source = getattr(used, "__file__", None)
+            if not source:
+                continue
+            digest.update(used.__name__.encode("utf-8") + b"\0")
+            with open(source, "rb") as f:
+                digest.update(f.read())
+    settings = getattr(module, "OUTPUT_SETTINGS", None)
+    if settings:
+        digest.update(json.dumps(settings, sort_keys=True, default=repr).encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+def hash_file(file_obj):
+    """Hashes a file-like object in chunks and rewinds it."""
+    digest = hashlib.sha256()
+    file_obj.seek(0)
+    for chunk in iter(lambda: file_obj.read(CHUNK_SIZE), b""):
+        digest.update(chunk)
+    file_obj.seek(0)
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """
+    LRU, size-bounded on-disk cache mapping a cache key to text content (CSV by
+    default; suffix is the extension of the entry files).
+    Limits are enforced after every evict_interval stores: caches of many small
+    entries can use more than 1, since each check lists the whole directory.
+    """
+
+    def __init__(self, directory, max_bytes, max_entries, suffix=".csv", evict_interval=1):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.suffix = suffix
+        self.evict_interval = evict_interval
+        self._stores = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def make_key(pdf_digest, module_name, version):
+        """Builds the cache key from the PDF digest and the script module identity."""
+        return hashlib.sha256(f"{pdf_digest}|{module_name}|{version}".encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}{self.suffix}")
+
+    def get(self, key):
+        """Returns the cached content for key, or None. A hit marks the entry as recently used."""
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8", newline="") as f:
+                content = f.read()
+            os.utime(path)
+        except OSError:
+            return None
+        return content
+
+    def put(self, key, content):
+        """Stores content under key, then evicts old entries if over the limits."""
+        for _ in self.tee(key, [content]):
+            pass
+
+    def tee(self, key, chunks):
+        """
+        Yields the text chunks unchanged while writing them to the cache entry for key.
+        The entry is only stored once the whole stream has been consumed, so an
+        interrupted conversion never leaves a truncated result behind.
+        """
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            f = open(tmp_path, "w", encoding="utf-8", newline="")
+        except OSError as e:
+            print(f"Result cache store failed: {e}") # Log server-side, keep streaming uncached
+            yield from chunks
+            return
+        completed = False
+        try:
+            with f:
+                for chunk in chunks:
+                    f.write(chunk)
+                    yield chunk
+            completed = True
+        finally:
+            if completed:
+                os.replace(tmp_path, path)  # Atomic: readers never see a partial file
+                with self._lock:
+                    self._stores += 1
+                    evict = self._stores % self.evict_interval == 0
+                if evict:
+                    self._evict()
+            else:
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+
+    def _evict(self):
+        with self._lock:
+            entries = []
+            total = 0
+            with os.scandir(self.directory) as it:
+                for entry in it:
+                    if not entry.name.endswith(self.suffix):
+                        continue
+                    try:
+                        stat = entry.stat()
+                    except OSError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+                    total += stat.st_size
+            entries.sort()  # Oldest (least recently used) first
+            while entries and (total > self.max_bytes or len(entries) > self.max_entries):
+                _, size, path = entries.pop(0)
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                total -= size
@@ -1,19 +1,32 @@
-import re
 import csv
-import pdfplumber
-import io
+from contextlib import closing
+from script.pdfsource import iter_pages, open_pdf
+from script.pagecache import page_text
+from script.csvout import to_csv
+from script.linerules import LineRules, START, STOP, SKIP, TEXT, pattern, phrases
+from script.timing import timed_iter
+from script.transactions import Layout, NO_AMOUNT, batched
 
-def extract_text_with_pdfplumber(pdf_file):
+FIELDNAMES = ["Data", "Descrizione", "Uscite", "Entrate"]
+CSV_FORMAT = {"delimiter": ";", "quoting": csv.QUOTE_NONE, "escapechar": "\\"}
+OUTPUT = Layout(["date", "description", "debit", "credit"], date_format="dd/mm/yy")
+
+# Page 1 markers for automatic detection (see script.detect).
+FINGERPRINT = {
+    "phrases": ["Banco BPM", "Banca Popolare di Milano"],
+    "patterns": [r"^\d{2}/\d{2}/\d{2}\s+\d{2}/\d{2}/\d{2}\s+\d{2}/\d{2}/\d{2}\s"],
+}
+
+def extract_lines_with_pdfplumber(pdf_file, progress=None):
     """
-    Extract text from all pages of the given PDF file-like object using pdfplumber.
+    Extract text from the pages of the given PDF file-like object using pdfplumber,
+    yielding it line by line. Pages are only read as the lines are consumed.
     """
-    full_text = []
-    with pdfplumber.open(pdf_file) as pdf:
-        for page in pdf.pages:
-            text = page.extract_text(x_tolerance=1.5, y_tolerance=1.5)
+    with open_pdf(pdf_file) as pdf:
+        for _, page in iter_pages(pdf, progress):
+            text = page_text(page, x_tolerance=1.5, y_tolerance=1.5)
             if text:
-                full_text.append(text)
-    return "\n".join(full_text)
+                yield from text.splitlines()
 
 def clean_description(description):
     """
@@ -31,90 +44,79 @@ def clean_description(description):
     description = description.replace("30.09.2024 00393/000000009713 APP *1 *2 *3", "")
     return description.strip()
 
-def extract_transactions_from_text(text):
-    """
-    Extracts transactions from the PDF text. Each transaction is expected to be in the format:
-      dd/mm/yy dd/mm/yy dd/mm/yy [-] amount description
-    Returns a list of dictionaries with keys: Data, Descrizione, Uscite, Entrate.
-    """
-    pattern = re.compile(
+# Line rules of the statement (see script.linerules). A transaction starts with:
+#   dd/mm/yy dd/mm/yy dd/mm/yy [-] amount description
+LINE_RULES = LineRules(
+    (STOP, phrases(
+        "SALDO FINALE", "Saldo contabile finale", "Saldo liquido finale",
+        "Totale numeri del periodo",
+    )),
+    (START, pattern(
         r'^(\d{2}/\d{2}/\d{2})\s+'   # first date
         r'\d{2}/\d{2}/\d{2}\s+'      # second date
         r'\d{2}/\d{2}/\d{2}\s+'      # third date
         r'(-\s*)?'                  # optional minus sign
         r'([\d\.,]+)\s+'            # monetary amount
         r'(.+)$'                    # description
-    )
-    skip_phrases = [
+    )),
+    (SKIP, phrases(
         "pagina", "INDEX:", "Data di riferimento", "ATM DATA", "USCITE",
         "ENTRATE", "WEB CONTABILE", "NUMERI A DEBITO", "NUMERI A CREDITO",
         "RIASSUNTO SCALARE", "INTERESSI MATURATI", "RIEPILOGO", "DECORRENZA",
         "COMPETENZE LIQUIDATE", "TOTALE", "FONDO INTERBANCARIO",
         "30.09.2024 00393/000000009713", "APP *1 *2 *3",
-    ]
-    stop_phrases = [
-        "SALDO FINALE", "Saldo contabile finale", "Saldo liquido finale",
-        "Totale numeri del periodo",
-    ]
-    transactions = []
+    )),
+)
+
+def extract_transactions_from_lines(lines):
+    """
+    Extracts transactions from the PDF text lines (see LINE_RULES).
+    Yields dictionaries with keys: Data, Descrizione, Uscite, Entrate.
+    Stops reading lines at the first stop phrase.
+    """
     current_record = None
-    lines = text.splitlines()
-    parsing = True
 
-    for line in lines:
-        if not parsing:
-            break
-        line = line.strip()
-        if not line:
-            continue
-        if any(phrase in line for phrase in stop_phrases):
-            if current_record:
-                transactions.append(current_record)
-                current_record = None
-            parsing = False
+    for kind, fields, line in LINE_RULES.iter_lines(lines):
+        if kind == STOP:
             break
-        match = pattern.match(line)
-        if match:
+        if kind == START:
             if current_record:
-                transactions.append(current_record)
-            data_value = match.group(1)
-            is_negative = (match.group(2) is not None)
-            amount = match.group(3)
-            descr_line = match.group(4)
+                yield current_record
+            data_value, minus, amount, descr_line = fields
+            is_negative = (minus is not None)
             descr_line = clean_description(descr_line)
-            uscita, entrata = ("0", amount) if not is_negative else (amount, "0")
+            uscita, entrata = (NO_AMOUNT, amount) if not is_negative else (amount, NO_AMOUNT)
             current_record = {
                 "Data": data_value,
                 "Descrizione": descr_line,
                 "Uscite": uscita,
                 "Entrate": entrata
             }
-        else:
+        elif kind == TEXT:
             if current_record:
-                if not any(phrase in line for phrase in skip_phrases):
-                    current_record["Descrizione"] += " " + line
+                current_record["Descrizione"] += " " + line
     if current_record:
-        transactions.append(current_record)
-    return transactions
+        yield current_record
+
+def iter_batches(pdf_file, progress=None):
+    """
+    Yields the transactions in TransactionBatch objects as they are parsed, page by page.
+    Pages after the one holding the stop phrase are never extracted.
+    """
+    def records():
+        lines = timed_iter(extract_lines_with_pdfplumber(pdf_file, progress), __name__, "extract_text")
+        with closing(lines):  # Closes the PDF as soon as the stop phrase is reached
+            for transaction in extract_transactions_from_lines(lines):
+                # Ensure all descriptions are on a single line
+                descrizione = transaction["Descrizione"].replace('\n', ' ').replace('\\n', ' ').strip()
+                yield transaction["Data"], descrizione, transaction["Uscite"], transaction["Entrate"]
+    return batched(OUTPUT, records())
 
-def process_pdf(pdf_file):
+def process_pdf(pdf_file, progress=None):
     """
     Processes the uploaded PDF file-like object and returns CSV content as a string.
     """
-    text = extract_text_with_pdfplumber(pdf_file)
-    transactions = extract_transactions_from_text(text)
-    
-    # Ensure all descriptions are on a single line
-    for transaction in transactions:
-        transaction["Descrizione"] = transaction["Descrizione"].replace('\n', ' ').replace('\\n', ' ').strip()
-    
-    output = io.StringIO()
-    fieldnames = ["Data", "Descrizione", "Uscite", "Entrate"]
-    writer = csv.DictWriter(output, fieldnames=fieldnames, delimiter=";", quoting=csv.QUOTE_NONE, escapechar="\\")
-    writer.writeheader()
-    for transaction in transactions:
-        writer.writerow(transaction)
-    return output.getvalue()
+    return to_csv(FIELDNAMES, OUTPUT, iter_batches(pdf_file, progress), **CSV_FORMAT)
 
 if __name__ == "__main__":
     import sys
@@ -124,4 +126,4 @@ if __name__ == "__main__":
             csv_content = process_pdf(f)
         print(csv_content)
     else:
-        print("Usage: python EcBPM.py <pdf_file>")
+        print("Usage: python -m script.EcBPM <pdf_file>")
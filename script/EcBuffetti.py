@@ -1,55 +1,26 @@
 import re
-import csv
-import pdfplumber
-import io
+from script.csvout import to_csv
+from script.tables import iter_table_pages
+from script.timing import timed_iter
+from script.transactions import Layout, amount_column, batched
 
-def extract_table_standard(pdf_file):
-    """
-    Extracts the table rows using a 'standard' horizontal strategy
-    (lines-based) and explicit vertical lines.
-    """
-    table_settings = {
-        "vertical_strategy": "explicit",
-        "horizontal_strategy": "lines",
-        "explicit_vertical_lines": [59, 95, 116, 273, 428, 479, 504, 553],
-        "snap_tolerance": 3,
-    }
-    all_rows = []
-    with pdfplumber.open(pdf_file) as pdf:
-        for page in pdf.pages:
-            table = page.extract_table(table_settings)
-            if table:
-                all_rows.extend(table)
-    return all_rows
+FIELDNAMES = ["Data", "Descrizione", "Entrate", "Uscite"]
+OUTPUT = Layout(["date", "description", "credit", "debit"], date_format="dd/mm/yyyy")
 
-def parse_eu(num_str):
-    """
-    Converts a European style number string (e.g. "3.793,67") to a float.
-    """
-    num_str = num_str.strip()
-    if not num_str:
-        return 0.0
-    num_str = num_str.replace('.', '')  # remove thousand separators
-    num_str = num_str.replace(',', '.')  # replace comma with dot
-    try:
-        return float(num_str)
-    except ValueError:
-        return 0.0
+# Page 1 markers for automatic detection (see script.detect).
+FINGERPRINT = {
+    "phrases": ["Buffetti"],
+    "patterns": [r"^\d{2}/\d{2}/\d{4}\S*\s+\D.*\s[\d.]+,\d{2}\s*$", r"SALDO INIZIALE"],
+}
 
-def format_eu(value):
-    """
-    Formats a float into European number format (e.g. 3793.67 -> "3.793,67").
-    """
-    s = f"{value:,.2f}"
-    s = s.replace(',', 'X').replace('.', ',').replace('X', '.')
-    return s
+# Column separators of the statement table (see script.tables).
+TABLE_LAYOUT = {"vertical_lines": [59, 95, 116, 273, 428, 479, 504, 553]}
 
 def process_rows(rows):
     """
-    Processes extracted rows and returns a list of dictionaries with keys:
-    Data, Descrizione, Entrate, Uscite.
+    Processes extracted rows and yields entries with:
+    Data, Descrizione, Uscite, Entrate (amounts as printed).
     """
-    transactions = []
     date_regex = re.compile(r'\d{2}/\d{2}/\d{4}')
     for row in rows:
         if len(row) < 7:
@@ -64,28 +35,28 @@ def process_rows(rows):
             continue
         entrate_str = row[4].strip() if len(row) > 4 else ""
         uscite_str = row[6].strip() if len(row) > 6 else ""
-        entrate = parse_eu(entrate_str) if entrate_str else 0.0
-        uscite = parse_eu(uscite_str) if uscite_str else 0.0
-        transactions.append({
-            "Data": data_value,
-            "Descrizione": descr,
-            "Entrate": format_eu(entrate),
-            "Uscite": format_eu(uscite)
-        })
-    return transactions
+        yield data_value, descr, uscite_str, entrate_str
+
+def iter_batches(pdf_file, progress=None):
+    """
+    Yields the transactions in TransactionBatch objects, page by page.
+    The amounts of a page are converted column by column (in cents, 0 when missing).
+    """
+    def records():
+        tables = timed_iter(iter_table_pages(pdf_file, TABLE_LAYOUT, progress), __name__, "extract_table")
+        for table in tables:
+            entries = list(process_rows(table))
+            uscite = amount_column((entry[2] for entry in entries), empty=0, invalid=0)
+            entrate = amount_column((entry[3] for entry in entries), empty=0, invalid=0)
+            for (data_value, descr, _, _), debit, credit in zip(entries, uscite, entrate):
+                yield data_value, descr, debit, credit
+    return batched(OUTPUT, records())
 
-def process_pdf(pdf_file):
+def process_pdf(pdf_file, progress=None):
     """
     Processes the uploaded PDF file-like object and returns CSV content as a string.
     """
-    rows = extract_table_standard(pdf_file)
-    transactions = process_rows(rows)
-    output = io.StringIO()
-    writer = csv.DictWriter(output, fieldnames=["Data", "Descrizione", "Entrate", "Uscite"], delimiter=";")
-    writer.writeheader()
-    for t in transactions:
-        writer.writerow(t)
-    return output.getvalue()
+    return to_csv(FIELDNAMES, OUTPUT, iter_batches(pdf_file, progress), delimiter=";")
 
 if __name__ == "__main__":
     import sys
@@ -95,4 +66,4 @@ if __name__ == "__main__":
             csv_content = process_pdf(f)
         print(csv_content)
     else:
-        print("Usage: python EcBuffetti.py <pdf_file>")
+        print("Usage: python -m script.EcBuffetti <pdf_file>")
@@ -1,19 +1,21 @@
-import pdfplumber
-import csv
 import re
-import io
+from script.csvout import to_csv
+from script.tables import iter_table_rows
+from script.timing import timed_iter
+from script.transactions import Layout, amount_value, batched
 
-def convert_date(date_str):
-    """
-    Converts a date string from dd.mm.yy to dd/mm/20yy.
-    """
-    parts = date_str.split(".")
-    if len(parts) == 3:
-        day, month, year = parts
-        if len(year) == 2:
-            year = "20" + year
-        return f"{day}/{month}/{year}"
-    return date_str
+FIELDNAMES = ["Data", "Descrizione", "Uscite", "Entrate"]
+# Dates are printed as dd.mm.yy and written as dd/mm/20yy.
+OUTPUT = Layout(["date", "description", "debit", "credit"], date_format="dd/mm/yyyy", input_date_format="dd.mm.yy")
+
+# Page 1 markers for automatic detection (see script.detect).
+FINGERPRINT = {
+    "phrases": ["Crédit Agricole", "Credit Agricole"],
+    "patterns": [r"^\d{2}\.\d{2}\.\d{2}\s+\d{2}\.\d{2}\.\d{2}\s"],
+}
+
+# Column separators of the statement table (see script.tables).
+TABLE_LAYOUT = {"vertical_lines": [25, 68, 120, 174, 180, 240, 243, 525]}
 
 def is_date(date_str):
     """
@@ -21,21 +23,6 @@ def is_date(date_str):
     """
     return bool(re.match(r"^\d{2}\.\d{2}\.\d{2}$", date_str.strip()))
 
-def reformat_number(num_str):
-    """
-    Reformats a number string to have dot as thousand separator and comma as decimal separator.
-    """
-    if not num_str or num_str.strip() == "":
-        return "0"
-    temp = num_str.replace(".", "").replace(",", ".")
-    try:
-        value = float(temp)
-        formatted = f"{value:,.2f}"
-        formatted = formatted.replace(",", "X").replace(".", ",").replace("X", ".")
-        return formatted
-    except ValueError:
-        return num_str
-
 def is_valid_number(num_str):
     """
     Validates that the number string is in a proper format.
@@ -44,29 +31,11 @@ def is_valid_number(num_str):
     pattern = r"^\d+(?:\.\d{3})*,\d{2}$"
     return bool(re.match(pattern, num_str))
 
-def extract_table_standard(pdf_file):
-    """
-    Extracts table rows from the PDF using explicit vertical lines.
-    """
-    table_settings = {
-        "vertical_strategy": "explicit",
-        "horizontal_strategy": "lines",
-        "explicit_vertical_lines": [25, 68, 120, 174, 180, 240, 243, 525],
-        "snap_tolerance": 3,
-    }
-    all_rows = []
-    with pdfplumber.open(pdf_file) as pdf:
-        for page in pdf.pages:
-            table = page.extract_table(table_settings)
-            if table:
-                all_rows.extend(table)
-    return all_rows
-
 def process_extracted_rows(rows):
     """
-    Processes extracted rows to create a list of transaction dictionaries.
+    Processes extracted rows and yields transaction dictionaries.
+    A transaction is yielded once the next row shows that its description is complete.
     """
-    transactions = []
     current_transaction = None
     forbidden_desc = {"SALDO FINALE", "SALDO INIZIALE"}
     for row in rows:
@@ -76,7 +45,7 @@ def process_extracted_rows(rows):
         if cleaned[0]:
             if current_transaction is not None:
                 if current_transaction["Descrizione"].strip().upper() not in forbidden_desc:
-                    transactions.append(current_transaction)
+                    yield current_transaction
                 current_transaction = None
             if not is_date(cleaned[0]):
                 continue
@@ -88,14 +57,11 @@ def process_extracted_rows(rows):
                 continue
             if cleaned[5].strip().upper() in forbidden_desc:
                 continue
-            date = convert_date(cleaned[0])
-            uscite = reformat_number(raw_uscite) if raw_uscite else "0"
-            entrate = reformat_number(raw_entrate) if raw_entrate else "0"
             current_transaction = {
-                "Data": date,
+                "Data": cleaned[0],
                 "Descrizione": cleaned[5],
-                "Uscite": uscite,
-                "Entrate": entrate,
+                "Uscite": amount_value(raw_uscite),
+                "Entrate": amount_value(raw_entrate),
             }
         else:
             if all(not cell for cell in cleaned[:5]) and cleaned[5]:
@@ -103,26 +69,25 @@ def process_extracted_rows(rows):
                     current_transaction["Descrizione"] += " " + cleaned[5]
     if current_transaction is not None:
         if current_transaction["Descrizione"].strip().upper() not in forbidden_desc:
-            transactions.append(current_transaction)
-    return transactions
+            yield current_transaction
+
+def iter_batches(pdf_file, progress=None):
+    """
+    Yields the transactions in TransactionBatch objects as they are parsed, page by page.
+    """
+    def records():
+        rows = timed_iter(iter_table_rows(pdf_file, TABLE_LAYOUT, progress), __name__, "extract_table")
+        for t in process_extracted_rows(rows):
+            # Clean up any newlines in Descrizione fields
+            descrizione = t["Descrizione"].replace('\n', ' ').replace('\\n', ' ').strip()
+            yield t["Data"], descrizione, t["Uscite"], t["Entrate"]
+    return batched(OUTPUT, records())
 
-def process_pdf(pdf_file):
+def process_pdf(pdf_file, progress=None):
     """
     Processes the uploaded PDF file-like object and returns CSV content as a string.
     """
-    rows = extract_table_standard(pdf_file)
-    transactions = process_extracted_rows(rows)
-    
-    # Clean up any newlines in Descrizione fields
-    for t in transactions:
-        t["Descrizione"] = t["Descrizione"].replace('\n', ' ').replace('\\n', ' ').strip()
-    
-    output = io.StringIO()
-    writer = csv.DictWriter(output, fieldnames=["Data", "Descrizione", "Uscite", "Entrate"], delimiter=";")
-    writer.writeheader()
-    for t in transactions:
-        writer.writerow(t)
-    return output.getvalue()
+    return to_csv(FIELDNAMES, OUTPUT, iter_batches(pdf_file, progress), delimiter=";")
 
 if __name__ == "__main__":
     import sys
@@ -132,4 +97,4 @@ if __name__ == "__main__":
             csv_content = process_pdf(f)
         print(csv_content)
     else:
-        print("Usage: python EcCreditAgricole.py <pdf_file>")
+        print("Usage: python -m script.EcCreditAgricole <pdf_file>")
@@ -1,178 +1,613 @@
 import sys
 import os
-import pytesseract  # Must be imported before using pytesseract
-from io import BytesIO
-import io
-from pdf2image import convert_from_bytes
-import cv2
+import importlib.util
+import threading
 import re
-import csv
-import pdfplumber
-from PIL import Image
-from pytesseract import Output
-import shutil
-
-def resource_path(relative_path):
-    """Get absolute path to resource, works for dev and for PyInstaller."""
-    if hasattr(sys, '_MEIPASS'):
-        return os.path.join(sys._MEIPASS, relative_path)
-    return os.path.join(os.path.abspath("."), relative_path)
-
-# Set up external executable paths using resource_path.
-pytesseract.pytesseract.tesseract_cmd = resource_path(r"Tesseract-OCR/tesseract.exe")
-poppler_path = resource_path(r"poppler-24.08.0/Library/bin")
+import tempfile
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+from script.csvout import to_csv
+from script.tables import iter_page_tables
+from script.pdfsource import mapped, open_pdf, count_pages
+from script.timing import StageTimer, timed, timed_iter, collected, replay
+from script.transactions import Layout, NO_AMOUNT, batched
+from script import ocrengine, pagecache
+
+# External executables, looked up for this platform (see script.ocrengine).
+tesseract_cmd = ocrengine.find_tesseract()
+poppler_path = ocrengine.find_poppler()
+
+# OCR-only dependencies, imported by load_ocr() the first time a page must be OCR'd,
+# so that importing this module and reading text-layer statements stays cheap.
+# The OCR engine itself (tesserocr or pytesseract) is loaded by script.ocrengine.
+OCR_PACKAGES = ["cv2", "numpy", "pdf2image"]
+cv2 = np = convert_from_path = None
+_ocr_lock = threading.Lock()
+
+# OCR worker processes outlive a conversion, so the engines they hold keep their
+# models loaded for the next pages and requests. One pool per worker count.
+_executors = {}
+_executors_lock = threading.Lock()
+
+FIELDNAMES = ["Data", "Descrizione", "Uscite", "Entrate"]
+OUTPUT = Layout(["date", "description", "debit", "credit"], date_format="dd.mm.yyyy")
+
+# Page 1 markers for automatic detection (see script.detect).
+FINGERPRINT = {
+    "phrases": ["Intesa Sanpaolo", "Intesa San Paolo"],
+    "patterns": [r"^\d{2}\.\d{2}\.\d{4}\s+\d{2}\.\d{2}\.\d{4}\s"],
+    "scanned": True,
+}
+
+# Column separators of the Data/Valuta/Descrizione part of the table (see script.tables).
+TABLE_LAYOUT = {"vertical_lines": [22, 62, 161, 350]}
+
+# Number of worker processes used to OCR pages in parallel (1 = sequential).
+OCR_WORKERS = int(os.environ.get("INTESA_OCR_WORKERS", os.cpu_count() or 1))
+
+# Where amounts are read from: "auto" reads them from the PDF text layer and only
+# OCRs pages without usable characters in the amount columns, "ocr" always OCRs.
+AMOUNT_SOURCE = os.environ.get("INTESA_AMOUNT_SOURCE", "auto")
+
+# OCR mode: "strips" OCRs only the Addebiti/Accrediti column strips with a numeric
+# whitelist, "page" OCRs the whole page and filters tokens by position.
+OCR_MODE = os.environ.get("INTESA_OCR_MODE", "strips")
+
+# Resolution pages are rendered at for OCR.
+OCR_DPI = 300
+
+# Adaptive resolution ("strips" mode): pages are first rendered and OCR'd at
+# OCR_DRAFT_DPI, and a column strip is read again from an OCR_DPI rendering only when
+# tesseract is unsure about it (a word below OCR_MIN_CONFIDENCE, or a line that is not a
+# valid amount); the whole page is when its amounts do not match its table rows.
+# INTESA_OCR_DRAFT_DPI=0 always OCRs at OCR_DPI.
+OCR_DRAFT_DPI = int(os.environ.get("INTESA_OCR_DRAFT_DPI", 200))
+OCR_MIN_CONFIDENCE = float(os.environ.get("INTESA_OCR_MIN_CONFIDENCE", 80))
+
+# Pages rendered per poppler call. Pages are rendered straight to grayscale and OCR'd
+# window by window, each image being dropped once its tokens are read, so peak memory
+# depends on the window (and OCR_WORKERS), not on the page count.
+OCR_RENDER_WINDOW = int(os.environ.get("INTESA_OCR_WINDOW", 4))
+
+# Settings above that change the output, part of the result cache key (see
+# result_cache.module_version).
+OUTPUT_SETTINGS = {
+    "amount_source": AMOUNT_SOURCE,
+    "ocr_mode": OCR_MODE,
+    "ocr_draft_dpi": OCR_DRAFT_DPI,
+    "ocr_min_confidence": OCR_MIN_CONFIDENCE,
+    "tesseract_lang": ocrengine.TESSERACT_LANG,
+}
+
+# Horizontal boundaries (in pixels at OCR_DPI) of the amount columns; a token belongs to a
+# column when its center falls inside the range. None means "up to the page edge".
+AMOUNT_COLUMNS = [
+    ("Uscite", 1650, 1790),   # "Addebiti"
+    ("Entrate", 2050, None),  # "Accrediti"
+]
+# Extra pixels cropped on each side of a column strip, so that amounts wider than
+# the column range are not cut in half.
+STRIP_MARGIN = 150
+STRIP_OCR_CONFIG = "--psm 6 -c tessedit_char_whitelist=0123456789.,"
+
+# Pattern for a valid token (e.g. "1.234,56")
+valid_pattern = re.compile(r'^\d+(?:\.\d+)*,\d{2}$')
 
 #############################################
-# OCR Extraction for Uscite and Entrate
+# OCR Dependencies
 #############################################
-def extract_ocr_tokens_from_bytes(pdf_bytes):
+def load_ocr():
     """
-    Extract tokens from the PDF using OCR.
-    Returns a list of dictionaries, each with keys "Uscite" and "Entrate".
-    Instead of using a file path, this uses the PDF bytes and pdf2image.convert_from_bytes.
+    Imports the OCR dependencies on first use.
+    Cheap once loaded; worker processes that start without them load them here too.
     """
-    temp_dir = "temp_images"
-    os.makedirs(temp_dir, exist_ok=True)
+    global cv2, np, convert_from_path
+    if convert_from_path is not None:
+        return
+    with _ocr_lock:  # Job threads may OCR concurrently; publish convert_from_path last
+        if convert_from_path is not None:
+            return
+        import cv2
+        import numpy as np
+        from pdf2image import convert_from_path as render
+        convert_from_path = render
 
-    # Convert PDF pages to images using pdf2image.convert_from_bytes.
-    pages = convert_from_bytes(pdf_bytes, dpi=300, poppler_path=poppler_path)
+def check_dependencies():
+    """
+    Returns a list of problems that would make OCR fail (missing Python packages or
+    tesseract/poppler binaries), without importing anything. Empty when all is in place.
+    """
+    problems = [f"pacchetto Python '{name}' non installato" for name in OCR_PACKAGES
+                if importlib.util.find_spec(name) is None]
+    problems.extend(ocrengine.check_engine(tesseract_cmd))
+    if poppler_path is None:
+        problems.append("poppler (pdftoppm) non trovato (imposta POPPLER_PATH o installalo nel PATH)")
+    return problems
 
-    preprocessed_image_paths = []
-    for i, page in enumerate(pages):
-        page_path = os.path.join(temp_dir, f'page_{i+1}.png')
-        page.save(page_path, 'PNG')
+#############################################
+# OCR Extraction for Uscite and Entrate
+#############################################
+def preprocess_page(page):
+    """
+    Converts a rendered PIL page to grayscale (if it is not already) and applies Otsu's
+    thresholding. Returns the binarized page as a numpy array; nothing is written to disk.
+    """
+    load_ocr()
+    with timed(__name__, "threshold"):
+        gray = np.asarray(page if page.mode == "L" else page.convert("L"))
+        _, thresh = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    return thresh
 
-        # Load image in grayscale and apply Otsu's thresholding
-        img_cv = cv2.imread(page_path, cv2.IMREAD_GRAYSCALE)
-        _, thresh = cv2.threshold(img_cv, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+def extract_ocr_tokens_from_image(img):
+    """
+    Runs OCR on a single preprocessed page image (numpy array).
+    Returns the list of {"Uscite", "Entrate"} tokens found on that page, in reading order.
+    """
+    load_ocr()
+    # Get OCR data with bounding box information.
+    with timed(__name__, "tesseract"):
+        data = ocrengine.image_to_data(img, "--psm 6", tesseract_cmd)
 
-        preprocessed_path = os.path.join(temp_dir, f'page_{i+1}_preprocessed.png')
-        cv2.imwrite(preprocessed_path, thresh)
-        preprocessed_image_paths.append(preprocessed_path)
+    # Set horizontal boundaries based on document layout.
+    addebiti_x_min, addebiti_x_max = AMOUNT_COLUMNS[0][1:]  # For "Addebiti" (Uscite)
+    accrediti_x_min, accrediti_x_max = AMOUNT_COLUMNS[1][1], img.shape[1]  # For "Accrediti" (Entrate)
 
-    tokens_list = []
-    for image_path in preprocessed_image_paths:
-        img = cv2.imread(image_path)
-        if img is None:
+    tokens = []
+    for i, text in enumerate(data['text']):
+        token_text = text.strip()
+        if token_text == "":
+            continue
+        left = data['left'][i]
+        width = data['width'][i]
+        center_x = left + width / 2
+        if not any(char.isdigit() for char in token_text):
             continue
-        # Get OCR data with bounding box information.
-        data = pytesseract.image_to_data(img, config="--psm 6", output_type=Output.DICT)
+        if addebiti_x_min <= center_x <= addebiti_x_max:
+            column = "Uscite"
+        elif accrediti_x_min <= center_x <= accrediti_x_max:
+            column = "Entrate"
+        else:
+            continue
+        tokens.append({"order": i, "text": token_text, "column": column})
+    tokens.sort(key=lambda t: t["order"])
 
-        # Set horizontal boundaries based on document layout.
-        addebiti_x_min, addebiti_x_max = 1650, 1790  # For "Addebiti" (Uscite)
-        accrediti_x_min, accrediti_x_max = 2050, img.shape[1]  # For "Accrediti" (Entrate)
+    # Merge adjacent tokens if the next token (with the same column) starts with a comma.
+    merged_tokens = []
+    i = 0
+    while i < len(tokens):
+        token = tokens[i]
+        merged_text = token["text"]
+        if i + 1 < len(tokens) and tokens[i + 1]["column"] == token["column"] and tokens[i + 1]["text"].startswith(','):
+            merged_text += tokens[i + 1]["text"]
+            i += 2
+        else:
+            i += 1
+        if valid_pattern.match(merged_text):
+            if token["column"] == "Uscite":
+                merged_tokens.append({"Uscite": merged_text, "Entrate": "0"})
+            else:
+                merged_tokens.append({"Uscite": "0", "Entrate": merged_text})
+    return merged_tokens
 
-        # Pattern for a valid token (e.g. "1.234,56")
-        valid_pattern = re.compile(r'^\d+(?:\.\d+)*,\d{2}$')
+def read_strip_lines(img, dpi=OCR_DPI, columns=None):
+    """
+    Runs OCR only on the Addebiti/Accrediti column strips (or on the given columns) of a
+    preprocessed page rendered at dpi, restricted to digits, dot and comma.
+    The strips of the page are OCR'd together (see ocrengine.images_to_data). Words on
+    the same OCR line of a strip are joined, so amounts split around the decimal comma
+    come back whole. Returns (lines, uncertain): lines are the (top, column, text) of
+    the valid amounts, with top in pixels at OCR_DPI; uncertain lists the columns with
+    a word below OCR_MIN_CONFIDENCE or a line that is not a valid amount.
+    """
+    load_ocr()
+    scale = dpi / OCR_DPI
+    page_width = img.shape[1]
+    strips = []
+    for column, x_min, x_max in AMOUNT_COLUMNS:
+        if columns is not None and column not in columns:
+            continue
+        x_min = int(x_min * scale)
+        x_max = page_width if x_max is None else int(x_max * scale)
+        crop_left = max(0, x_min - int(STRIP_MARGIN * scale))
+        crop_right = min(page_width, x_max + int(STRIP_MARGIN * scale))
+        if crop_left < crop_right:
+            strips.append((column, x_min, x_max, crop_left, img[:, crop_left:crop_right]))
+    with timed(__name__, "tesseract"):
+        strips_data = ocrengine.images_to_data([strip[-1] for strip in strips], STRIP_OCR_CONFIG, tesseract_cmd)
 
-        tokens = []
+    lines = []
+    uncertain = []
+    for (column, x_min, x_max, crop_left, _), data in zip(strips, strips_data):
+        strip_lines = {}
         for i, text in enumerate(data['text']):
             token_text = text.strip()
             if token_text == "":
                 continue
-            left = data['left'][i]
-            width = data['width'][i]
-            center_x = left + width / 2
-            if not any(char.isdigit() for char in token_text):
-                continue
-            if addebiti_x_min <= center_x <= addebiti_x_max:
-                column = "Uscite"
-            elif accrediti_x_min <= center_x <= accrediti_x_max:
-                column = "Entrate"
-            else:
+            key = (data['block_num'][i], data['par_num'][i], data['line_num'][i])
+            line = strip_lines.setdefault(key, {"words": [], "left": None, "right": None, "top": data['top'][i], "conf": 100.0})
+            left = data['left'][i] + crop_left
+            right = left + data['width'][i]
+            line["words"].append(token_text)
+            line["left"] = left if line["left"] is None else min(line["left"], left)
+            line["right"] = right if line["right"] is None else max(line["right"], right)
+            line["top"] = min(line["top"], data['top'][i])
+            line["conf"] = min(line["conf"], float(data['conf'][i]))
+
+        for line in strip_lines.values():
+            center_x = (line["left"] + line["right"]) / 2
+            if not (x_min <= center_x <= x_max):
                 continue
-            tokens.append({"order": i, "text": token_text, "column": column})
-        tokens.sort(key=lambda t: t["order"])
-
-        # Merge adjacent tokens if the next token (with the same column) starts with a comma.
-        merged_tokens = []
-        i = 0
-        while i < len(tokens):
-            token = tokens[i]
-            merged_text = token["text"]
-            if i + 1 < len(tokens) and tokens[i + 1]["column"] == token["column"] and tokens[i + 1]["text"].startswith(','):
-                merged_text += tokens[i + 1]["text"]
-                i += 2
+            text = "".join(line["words"])
+            valid = valid_pattern.match(text) is not None
+            if valid:
+                lines.append((line["top"] / scale, column, text))
+            if (not valid or line["conf"] < OCR_MIN_CONFIDENCE) and column not in uncertain:
+                uncertain.append(column)
+    return lines, uncertain
+
+def tokens_from_lines(lines):
+    """Turns (top, column, text) amount lines into tokens ordered top to bottom."""
+    return [
+        {"Uscite": text, "Entrate": "0"} if column == "Uscite" else {"Uscite": "0", "Entrate": text}
+        for _, column, text in sorted(lines, key=lambda l: l[0])
+    ]
+
+def extract_ocr_tokens_from_strips(img, dpi=OCR_DPI):
+    """
+    Runs OCR only on the Addebiti/Accrediti column strips of a preprocessed page
+    (see read_strip_lines). Returns tokens ordered top to bottom.
+    """
+    lines, _ = read_strip_lines(img, dpi)
+    return tokens_from_lines(lines)
+
+def extract_ocr_tokens_from_page(page, mode=None):
+    """
+    Preprocesses and OCRs a single rendered PIL page, entirely in memory.
+    """
+    if mode is None:
+        mode = OCR_MODE
+    img = preprocess_page(page)
+    if mode == "strips":
+        return extract_ocr_tokens_from_strips(img)
+    return extract_ocr_tokens_from_image(img)
+
+def extract_ocr_tokens_adaptive(page, pdf_path, page_number, expected_count=None, draft_dpi=None):
+    """
+    Adaptive-resolution OCR of a page rendered at draft_dpi (default OCR_DRAFT_DPI),
+    strips mode. The column strips the draft is unsure about, or all of them when the
+    number of amounts differs from expected_count, are read again from page_number of
+    pdf_path rendered at OCR_DPI.
+    """
+    lines, uncertain = read_strip_lines(preprocess_page(page), draft_dpi or OCR_DRAFT_DPI)
+    if expected_count is not None and len(lines) != expected_count:
+        uncertain = [column for column, _, _ in AMOUNT_COLUMNS]
+    if uncertain:
+        with timed(__name__, "rasterize"):
+            page = convert_from_path(pdf_path, dpi=OCR_DPI, poppler_path=poppler_path, grayscale=True,
+                                     first_page=page_number, last_page=page_number)[0]
+        retry_lines, _ = read_strip_lines(preprocess_page(page), OCR_DPI, uncertain)
+        lines = [line for line in lines if line[1] not in uncertain] + retry_lines
+    return tokens_from_lines(lines)
+
+def page_ranges(page_numbers):
+    """
+    Groups sorted 1-based page numbers into contiguous (first_page, last_page) ranges,
+    so each range can be rendered with a single poppler call.
+    """
+    ranges = []
+    for number in page_numbers:
+        if ranges and number == ranges[-1][1] + 1:
+            ranges[-1][1] = number
+        else:
+            ranges.append([number, number])
+    return [tuple(r) for r in ranges]
+
+def page_windows(page_numbers, window):
+    """
+    Splits sorted 1-based page numbers into (first_page, last_page) ranges of contiguous
+    pages, at most `window` pages each.
+    """
+    for first_page, last_page in page_ranges(page_numbers):
+        for window_first in range(first_page, last_page + 1, window):
+            yield window_first, min(window_first + window - 1, last_page)
+
+@contextmanager
+def poppler_input(pdf_bytes):
+    """
+    Writes the PDF to a temporary file, since poppler reads from files, and yields its
+    path; it is removed on exit. Written once, it serves all renderings of the PDF.
+    """
+    with tempfile.TemporaryDirectory(prefix="intesa_") as tmp_dir:
+        pdf_path = os.path.join(tmp_dir, "statement.pdf")
+        with open(pdf_path, "wb") as f:
+            f.write(pdf_bytes)
+        yield pdf_path
+
+def render_pages(pdf_path, page_numbers, window=None, dpi=OCR_DPI):
+    """
+    Renders the given 1-based pages of pdf_path at dpi in grayscale, yielding them one at
+    a time in page order. Pages are rendered `window` at a time (default
+    OCR_RENDER_WINDOW) and the generator keeps no reference to the pages it has yielded,
+    so only about one window of images is alive at once.
+    """
+    load_ocr()
+    for first_page, last_page in page_windows(page_numbers, window or OCR_RENDER_WINDOW):
+        images = convert_from_path(pdf_path, dpi=dpi, poppler_path=poppler_path, grayscale=True,
+                                   first_page=first_page, last_page=last_page)
+        images.reverse()
+        while images:
+            yield images.pop()
+
+def ocr_executor(workers):
+    """Returns the shared pool of `workers` OCR processes, creating it on first use."""
+    with _executors_lock:
+        executor = _executors.get(workers)
+        if executor is None:
+            executor = _executors[workers] = ProcessPoolExecutor(max_workers=workers)
+        return executor
+
+def discard_executor(workers, executor):
+    """Drops a broken pool (e.g. a worker was killed), so the next conversion starts a new one."""
+    with _executors_lock:
+        if _executors.get(workers) is executor:
+            del _executors[workers]
+    executor.shutdown(wait=False, cancel_futures=True)
+
+def extract_ocr_pages_from_bytes(pdf_bytes, workers=None, mode=None, progress=None, page_numbers=None, row_counts=None):
+    """
+    Extract tokens from the PDF using OCR.
+    Yields, for each page, the list of dictionaries with keys "Uscite" and "Entrate".
+    Pages are rendered window by window (see render_pages), binarized and OCR'd in
+    memory, so memory stays bounded on long PDFs.
+    Pages are OCR'd in the shared pool of `workers` processes (default OCR_WORKERS), with
+    at most two pages per worker queued ahead of the OCR; tokens are always yielded in page
+    order. `mode` selects "strips" or "page" OCR (default OCR_MODE); strips are read at
+    adaptive resolution unless OCR_DRAFT_DPI is 0 (see extract_ocr_tokens_adaptive).
+    If given, progress(pages_done, pages_total) is called after each page is OCR'd.
+    page_numbers restricts rendering and OCR to those 1-based pages (default: all pages);
+    row_counts, aligned with it, holds each page's expected number of amounts.
+    Rasterize/threshold/tesseract stage times of all pages are reported once, at the end.
+    """
+    if workers is None:
+        workers = OCR_WORKERS
+    mode = mode or OCR_MODE
+    if page_numbers is None:
+        page_numbers = range(1, count_pages(pdf_bytes) + 1)
+    if row_counts is None:
+        row_counts = [None] * len(page_numbers)
+    pages_total = len(page_numbers)
+    adaptive = mode == "strips" and 0 < OCR_DRAFT_DPI < OCR_DPI
+
+    with poppler_input(pdf_bytes) as pdf_path:
+        # Each page returns (tokens, stage timing samples), also from worker processes.
+        if adaptive:
+            ocr_page = partial(collected, extract_ocr_tokens_adaptive, pdf_path=pdf_path)
+            pages = timed_iter(render_pages(pdf_path, page_numbers, dpi=OCR_DRAFT_DPI), __name__, "rasterize")
+            tasks = (((page,), {"page_number": number, "expected_count": count})
+                     for page, number, count in zip(pages, page_numbers, row_counts))
+        else:
+            ocr_page = partial(collected, extract_ocr_tokens_from_page, mode=mode)
+            pages = timed_iter(render_pages(pdf_path, page_numbers), __name__, "rasterize")
+            tasks = (((page,), {}) for page in pages)
+
+        def ocr_results():
+            if workers > 1 and pages_total > 1:
+                executor = ocr_executor(workers)
+                # Submit pages as they are rendered, but only a few ahead of the OCR:
+                # executor.map would render the whole PDF up front.
+                pending = deque()
+                try:
+                    for args, kwargs in tasks:
+                        pending.append(executor.submit(ocr_page, *args, **kwargs))
+                        del args
+                        if len(pending) >= 2 * workers:
+                            yield pending.popleft().result()
+                    while pending:
+                        yield pending.popleft().result()
+                except BrokenProcessPool:
+                    discard_executor(workers, executor)
+                    raise
+                finally:
+                    for future in pending:  # Stopped early: the shared pool must not OCR them
+                        future.cancel()
             else:
-                i += 1
-            if valid_pattern.match(merged_text):
-                if token["column"] == "Uscite":
-                    merged_tokens.append({"Uscite": merged_text, "Entrate": "0"})
-                else:
-                    merged_tokens.append({"Uscite": "0", "Entrate": merged_text})
-        tokens_list.extend(merged_tokens)
-    shutil.rmtree(temp_dir)
-    return tokens_list
+                for args, kwargs in tasks:
+                    yield ocr_page(*args, **kwargs)
+
+        samples = []
+        try:
+            for page_number, (page_tokens, page_samples) in enumerate(ocr_results(), 1):
+                samples.extend(page_samples)
+                yield page_tokens
+                if progress:
+                    progress(page_number, pages_total)
+        finally:
+            pages.close()
+            replay(samples)
+
+def extract_ocr_tokens_from_bytes(pdf_bytes, workers=None, mode=None, progress=None, page_numbers=None):
+    """
+    Same as extract_ocr_pages_from_bytes, but yields the tokens of all pages as one sequence.
+    """
+    for page_tokens in extract_ocr_pages_from_bytes(pdf_bytes, workers, mode, progress, page_numbers):
+        yield from page_tokens
+
+#############################################
+# Text-layer Extraction for Uscite and Entrate
+#############################################
+def extract_text_tokens_from_page(page):
+    """
+    Reads the Uscite/Entrate amounts of a pdfplumber page from its text layer, using the
+    same column bounds as the OCR path (converted from pixels to PDF points).
+    Returns the tokens ordered top to bottom, or None when the amount columns hold no
+    digits at all, i.e. the page has no usable text layer and must be OCR'd.
+    """
+    scale = 72 / OCR_DPI
+    columns = [
+        (column, x_min * scale, page.width if x_max is None else x_max * scale)
+        for column, x_min, x_max in AMOUNT_COLUMNS
+    ]
+    found_digits = False
+    lines = []  # [top, column, text], words on the same line of a column are joined
+    for word in sorted(page.extract_words(), key=lambda w: (w["top"], w["x0"])):
+        if not any(char.isdigit() for char in word["text"]):
+            continue
+        center_x = (word["x0"] + word["x1"]) / 2
+        for column, x_min, x_max in columns:
+            if x_min <= center_x <= x_max:
+                break
+        else:
+            continue
+        found_digits = True
+        previous = next((line for line in reversed(lines) if line[1] == column), None)
+        if previous is not None and abs(word["top"] - previous[0]) <= 3:
+            previous[2] += word["text"]
+        else:
+            lines.append([word["top"], column, word["text"]])
+    if not found_digits:
+        return None
+    return [
+        {"Uscite": text, "Entrate": "0"} if column == "Uscite" else {"Uscite": "0", "Entrate": text}
+        for _, column, text in lines
+        if valid_pattern.match(text)
+    ]
 
 #############################################
 # Table Extraction for Data and Descrizione
 #############################################
-def extract_table_rows_from_bytes(pdf_bytes):
+def ocr_namespace(mode=None):
+    """Page cache namespace of the OCR tokens: the settings they depend on."""
+    return pagecache.namespace(f"{__name__}.ocr", mode=mode or OCR_MODE, dpi=OCR_DPI,
+                               draft_dpi=OCR_DRAFT_DPI, min_confidence=OCR_MIN_CONFIDENCE,
+                               columns=AMOUNT_COLUMNS, margin=STRIP_MARGIN, config=STRIP_OCR_CONFIG)
+
+def extract_table_pages_from_bytes(pdf_bytes, read_amounts=False):
     """
     Uses pdfplumber to extract table rows from the PDF.
-    Returns a list of dictionaries with keys "Data" and "Descrizione".
-    """
-    def extract_table_standard(file_bytes):
-        table_settings = {
-            "vertical_strategy": "explicit",
-            "horizontal_strategy": "lines",
-            "explicit_vertical_lines": [22, 62, 161, 350],
-            "snap_tolerance": 3,
-        }
-        all_rows = []
-        with pdfplumber.open(BytesIO(file_bytes)) as pdf:
-            for page in pdf.pages:
-                table = page.extract_table(table_settings)
-                if table:
-                    all_rows.extend(table)
-        return all_rows
-
+    Yields (page_number, rows, amounts, ocr_key) for every page, where rows is the list of
+    dictionaries with keys "Data" and "Descrizione" found on that page (empty for pages
+    without dated rows, such as cover, legal and summary pages). With read_amounts, amounts
+    holds the page's text-layer tokens (see extract_text_tokens_from_page) when there is
+    one per row; otherwise it is None and the page needs OCR. ocr_key is the page cache
+    key of the page's OCR tokens (None when the cache is off).
+    """
     def is_valid_date(date_str):
         return re.match(r'^\d{2}\.\d{2}\.\d{4}$', date_str) is not None
 
-    rows = extract_table_standard(pdf_bytes)
-    extracted_rows = []
-    for row in rows:
-        if len(row) < 3:
-            continue
-        if is_valid_date(row[0]):
-            # Clean descrizione by replacing newlines with spaces
-            descrizione = row[2]
-            if descrizione:
-                descrizione = descrizione.replace('\n', ' ').replace('\\n', ' ').strip()
-            extracted_rows.append({"Data": row[0], "Descrizione": descrizione})
-    return extracted_rows
+    text_layer = StageTimer(__name__, "text_layer")
+    text_namespace = pagecache.namespace(f"{__name__}.text_layer", dpi=OCR_DPI, columns=AMOUNT_COLUMNS)
+    ocr_tokens = ocr_namespace()
+    with open_pdf(pdf_bytes) as pdf:
+        tables = timed_iter(iter_page_tables(pdf, TABLE_LAYOUT), __name__, "extract_table")
+        for page_number, page, table in tables:
+            extracted_rows = []
+            for row in table:
+                if len(row) < 3:
+                    continue
+                if is_valid_date(row[0]):
+                    # Clean descrizione by replacing newlines with spaces
+                    descrizione = row[2]
+                    if descrizione:
+                        descrizione = descrizione.replace('\n', ' ').replace('\\n', ' ').strip()
+                    extracted_rows.append({"Data": row[0], "Descrizione": descrizione})
+            amounts = None
+            if read_amounts and extracted_rows:
+                # Same document, same page object: the text layer is read without reopening the PDF.
+                with text_layer:
+                    amounts = pagecache.cached(page, text_namespace, extract_text_tokens_from_page)
+                if amounts is not None and len(amounts) != len(extracted_rows):
+                    amounts = None  # Partial text layer: let OCR read the whole page instead
+            ocr_key = pagecache.page_key(page, ocr_tokens) if extracted_rows and amounts is None else None
+            yield page_number, extracted_rows, amounts, ocr_key
+    if read_amounts:
+        text_layer.done()
 
 #############################################
 # Main processing function for web usage.
 #############################################
-def process_pdf(pdf_file):
+def iter_records(pdf_file, progress=None):
     """
-    Processes the uploaded PDF file-like object and returns CSV content as a string.
+    Yields (Data, Descrizione, Uscite, Entrate) page by page, amounts as read ("0" when empty).
     Combines OCR extraction (for Uscite/Entrate) and table extraction (for Data/Descrizione).
     """
-    pdf_bytes = pdf_file.read()
-    # Extract OCR tokens from the PDF bytes.
-    ocr_tokens = extract_ocr_tokens_from_bytes(pdf_bytes)
-    # Extract table rows from the PDF bytes.
-    table_rows = extract_table_rows_from_bytes(pdf_bytes)
-    # Combine rows by index. If counts differ, use the minimum number.
-    min_rows = min(len(ocr_tokens), len(table_rows))
-    combined_rows = []
-    for i in range(min_rows):
-        combined_rows.append({
-            "Data": table_rows[i]["Data"],
-            "Descrizione": table_rows[i]["Descrizione"],
-            "Uscite": ocr_tokens[i]["Uscite"],
-            "Entrate": ocr_tokens[i]["Entrate"]
-        })
-    # Write CSV data to a memory buffer.
-    output = io.StringIO()
-    writer = csv.writer(output, delimiter=';')
-    writer.writerow(["Data", "Descrizione", "Uscite", "Entrate"])
-    for row in combined_rows:
-        writer.writerow([row["Data"], row["Descrizione"], row["Uscite"], row["Entrate"]])
-    return output.getvalue()
+    # The PDF is read through a memory map (no in-memory copy) by both pdfplumber and
+    # the renderer.
+    with mapped(pdf_file) as pdf_bytes:
+        # Progress counts every page of the PDF: pages are done once their table is read,
+        # or, for the pages that need it, once they are OCR'd.
+        pages_total = count_pages(pdf_bytes)
+        pages_done = 0
+
+        def page_done():
+            nonlocal pages_done
+            pages_done += 1
+            if progress:
+                progress(pages_done, pages_total)
+
+        # Extract table rows (and text-layer amounts) from the PDF bytes; only pages with
+        # dated rows hold transactions. Pages without usable text-layer amounts are
+        # rendered and OCR'd, unless their tokens are in the page cache. Each of them
+        # should hold one amount per table row.
+        # Text-layer pages (one amount per row) are yielded as they are read, until the
+        # first page that needs OCR tokens: that page and the following ones are kept
+        # for the second pass, where rows and tokens are paired across pages.
+        table_pages = []
+        ocr_cached = {}
+        for page in extract_table_pages_from_bytes(pdf_bytes, read_amounts=(AMOUNT_SOURCE == "auto")):
+            page_number, rows, amounts, ocr_key = page
+            if rows and amounts is not None and not table_pages:
+                for table_row, token in zip(rows, amounts):
+                    yield table_row["Data"], table_row["Descrizione"], token["Uscite"], token["Entrate"]
+            elif rows:
+                table_pages.append(page)
+                if amounts is None:
+                    tokens = pagecache.load(ocr_key)
+                    if tokens is None:
+                        continue  # Done once OCR'd
+                    ocr_cached[page_number] = tokens
+            page_done()
+        table_rows = (row for _, rows, _, _ in table_pages for row in rows)
+        ocr_targets = [(page_number, len(rows)) for page_number, rows, amounts, _ in table_pages
+                       if amounts is None and page_number not in ocr_cached]
+        ocr_pages = timed_iter(extract_ocr_pages_from_bytes(pdf_bytes,
+                                                            page_numbers=[number for number, _ in ocr_targets],
+                                                            row_counts=[count for _, count in ocr_targets]),
+                               __name__, "ocr")
+
+        def amount_tokens():
+            for page_number, _, amounts, ocr_key in table_pages:
+                if amounts is not None:
+                    yield from amounts
+                elif page_number in ocr_cached:
+                    yield from ocr_cached[page_number]
+                else:
+                    tokens = next(ocr_pages)
+                    pagecache.store(ocr_key, tokens)
+                    page_done()
+                    yield from tokens
+
+        # Combine rows by index. If counts differ, stop at the shorter of the two.
+        for table_row, token in zip(table_rows, amount_tokens()):
+            yield table_row["Data"], table_row["Descrizione"], token["Uscite"], token["Entrate"]
+
+def iter_batches(pdf_file, progress=None):
+    """
+    Yields the transactions in TransactionBatch objects, page by page.
+    """
+    def records():
+        for data, descrizione, uscite, entrate in iter_records(pdf_file, progress):
+            yield (data, descrizione,
+                   NO_AMOUNT if uscite == "0" else uscite, NO_AMOUNT if entrate == "0" else entrate)
+    return batched(OUTPUT, records())
+
+def process_pdf(pdf_file, progress=None):
+    """
+    Processes the uploaded PDF file-like object and returns CSV content as a string.
+    """
+    return to_csv(FIELDNAMES, OUTPUT, iter_batches(pdf_file, progress), delimiter=";")
 
 if __name__ == "__main__":
     # For testing via command-line: pass a PDF file path.
@@ -182,4 +617,4 @@ if __name__ == "__main__":
             csv_content = process_pdf(f)
         print(csv_content)
     else:
-        print("Usage: python EcIntesa.py <pdf_file>")
+        print("Usage: python -m script.EcIntesa <pdf_file>")
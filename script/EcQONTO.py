@@ -1,93 +1,102 @@
-import pdfplumber
+from script.pdfsource import iter_pages, open_pdf
+from script.pagecache import page_text
 import re
-import csv
-import io
+from script.csvout import to_csv
+from script.linerules import LineRules, START, SKIP, pattern
+from script.timing import timed_iter
+from script.transactions import Layout, NO_AMOUNT, amount_value, batched
 
-def format_currency(value):
+FIELDNAMES = ["Data", "Descrizione", "Uscite", "Entrate"]
+# Dates are printed without the year.
+OUTPUT = Layout(["date", "description", "debit", "credit"], date_format="d/m")
+
+# Page 1 markers for automatic detection (see script.detect).
+FINGERPRINT = {
+    "phrases": ["Qonto"],
+    "patterns": [r"^Dal giorno \d{1,2}/\d{1,2}", r"^\d{1,2}/\d{1,2}\s+.*[+-]\s*[\d.,]+\s*EUR"],
+}
+
+amt_pattern = re.compile(r'([+-])\s*([\d.,]+)\s*EUR')
+
+def extract_lines_from_pdf(pdf_file, progress=None):
     """
-    Format a float value as a string with thousand separator '.' and decimal separator ','.
+    Extract text from the PDF using pdfplumber, yielding it line by line, page by page.
     """
-    formatted = f"{value:,.2f}"
-    formatted = formatted.replace(',', 'X').replace('.', ',').replace('X', '.')
-    return formatted
+    with open_pdf(pdf_file) as pdf:
+        for _, page in iter_pages(pdf, progress):
+            text = page_text(page, x_tolerance=1.5, y_tolerance=1.5)
+            if text:
+                yield from text.splitlines()
 
-def extract_text_from_pdf(pdf_file):
+def finalize_transaction(tx):
     """
-    Extract text from the PDF using pdfplumber.
+    Moves the signed "... EUR" amount out of the description into Uscite/Entrate.
     """
-    full_text = []
-    with pdfplumber.open(pdf_file) as pdf:
-        for page in pdf.pages:
-            text = page.extract_text(x_tolerance=1.5, y_tolerance=1.5)
-            if text:
-                full_text.append(text)
-    return "\n".join(full_text)
+    amt_match = amt_pattern.search(tx["Descrizione"])
+    if amt_match:
+        sign = amt_match.group(1)
+        amount_str = amt_match.group(2)
+        if "," not in amount_str:
+            amount_str = amount_str.replace(".", ",")  # Without a comma, a dot is the decimal separator
+        amount = amount_value(amount_str, invalid=0)
+        if sign == '+':
+            tx["Entrate"] = amount
+            tx["Uscite"] = 0
+        else:
+            tx["Entrate"] = 0
+            tx["Uscite"] = amount
+        tx["Descrizione"] = amt_pattern.sub("", tx["Descrizione"]).strip()
 
-def extract_transactions_from_text(text):
+    # Ensure Descrizione has no newlines before writing to CSV
+    tx["Descrizione"] = tx["Descrizione"].replace('\n', ' ').replace('\\n', ' ').strip()
+    return tx
+
+# Line rules of the statement (see script.linerules): a transaction starts with its
+# d/m date; section headers and page numbers ("2/5") are left out of descriptions.
+LINE_RULES = LineRules(
+    (SKIP, pattern(r'Dal giorno|TESA|\d+/\d+$')),
+    (START, pattern(r'^(\d{1,2}/\d{1,2})\s+(.*)')),
+)
+
+def extract_transactions_from_lines(lines):
     """
-    Processes the extracted text to group transaction entries.
+    Processes the extracted text lines to group transaction entries.
+    Each transaction is yielded once the next one starts (or the lines end).
     """
-    lines = text.splitlines()
-    transactions = []
     current_tx = None
-    date_line_pattern = re.compile(r'^(\d{1,2}/\d{1,2})\s+(.*)')
-    for line in lines:
-        line = line.strip()
-        if not line:
-            continue
-        if line.startswith("Dal giorno") or line.startswith("TESA") or re.fullmatch(r'\d+/\d+', line):
+    for kind, fields, line in LINE_RULES.iter_lines(lines):
+        if kind == SKIP:
             continue
-        m = date_line_pattern.match(line)
-        if m:
+        if kind == START:
             if current_tx is not None:
-                transactions.append(current_tx)
+                yield finalize_transaction(current_tx)
             current_tx = {
-                "Data": m.group(1),
-                "Descrizione": m.group(2),
-                "Uscite": "0",
-                "Entrate": "0"
+                "Data": fields[0],
+                "Descrizione": fields[1],
+                "Uscite": NO_AMOUNT,
+                "Entrate": NO_AMOUNT
             }
         else:
             if current_tx:
                 current_tx["Descrizione"] += " " + line
     if current_tx:
-        transactions.append(current_tx)
-    
-    amt_pattern = re.compile(r'([+-])\s*([\d.,]+)\s*EUR')
-    for tx in transactions:
-        amt_match = amt_pattern.search(tx["Descrizione"])
-        if amt_match:
-            sign = amt_match.group(1)
-            amount_str = amt_match.group(2).replace(",", ".")
-            try:
-                amount = float(amount_str)
-            except ValueError:
-                amount = 0.0
-            if sign == '+':
-                tx["Entrate"] = format_currency(amount)
-                tx["Uscite"] = format_currency(0)
-            else:
-                tx["Entrate"] = format_currency(0)
-                tx["Uscite"] = format_currency(amount)
-            tx["Descrizione"] = amt_pattern.sub("", tx["Descrizione"]).strip()
-        
-        # Ensure Descrizione has no newlines before writing to CSV
-        tx["Descrizione"] = tx["Descrizione"].replace('\n', ' ').replace('\\n', ' ').strip()
-    return transactions
+        yield finalize_transaction(current_tx)
+
+def iter_batches(pdf_file, progress=None):
+    """
+    Yields the transactions in TransactionBatch objects as they are parsed, page by page.
+    """
+    def records():
+        lines = timed_iter(extract_lines_from_pdf(pdf_file, progress), __name__, "extract_text")
+        for tx in extract_transactions_from_lines(lines):
+            yield tx["Data"], tx["Descrizione"], tx["Uscite"], tx["Entrate"]
+    return batched(OUTPUT, records())
 
-def process_pdf(pdf_file):
+def process_pdf(pdf_file, progress=None):
     """
     Processes the uploaded PDF file-like object and returns CSV content as a string.
     """
-    text = extract_text_from_pdf(pdf_file)
-    transactions = extract_transactions_from_text(text)
-    output = io.StringIO()
-    fieldnames = ["Data", "Descrizione", "Uscite", "Entrate"]
-    writer = csv.DictWriter(output, fieldnames=fieldnames, delimiter=";")
-    writer.writeheader()
-    for tx in transactions:
-        writer.writerow(tx)
-    return output.getvalue()
+    return to_csv(FIELDNAMES, OUTPUT, iter_batches(pdf_file, progress), delimiter=";")
 
 if __name__ == "__main__":
     import sys
@@ -97,4 +106,4 @@ if __name__ == "__main__":
             csv_content = process_pdf(f)
         print(csv_content)
     else:
-        print("Usage: python EcQONTO.py <pdf_file>")
+        print("Usage: python -m script.EcQONTO <pdf_file>")
@@ -1,26 +1,25 @@
-import pdfplumber
-import csv
 import re
-import io
+from script.csvout import to_csv
+from script.tables import iter_table_pages
+from script.timing import timed_iter
+from script.transactions import Layout, amount_column, batched
 
-def extract_table_explicit(pdf_file):
-    table_settings = {
-        "vertical_strategy": "explicit",
-        "horizontal_strategy": "explicit",
-        "explicit_vertical_lines": [30, 70, 110, 430, 500, 562],
-        "explicit_horizontal_lines": list(range(100, 770, 10)),
-        "snap_tolerance": 3,
-    }
-    all_rows = []
-    with pdfplumber.open(pdf_file) as pdf:
-        for page in pdf.pages:
-            table = page.extract_table(table_settings)
-            if table:
-                all_rows.extend(table)
-    return all_rows
+FIELDNAMES = ['Data contabile', 'Data valuta', 'Descrizione', 'Uscite', 'Entrate']
+OUTPUT = Layout(["date", "value_date", "description", "debit", "credit"], date_format="dd mm yy")
+
+# Page 1 markers for automatic detection (see script.detect).
+FINGERPRINT = {
+    "phrases": ["Banca Sella"],
+    "patterns": [r"^\d{2} \d{2} \d{2}\s+\d{2} \d{2} \d{2}\s"],
+}
+
+# Column and row grid of the statement table (see script.tables).
+TABLE_LAYOUT = {
+    "vertical_lines": [30, 70, 110, 430, 500, 562],
+    "horizontal_lines": list(range(100, 770, 10)),
+}
 
 def filter_valid_rows(rows):
-    valid_rows = []
     date_regex = re.compile(r'^\d{2}\s\d{2}\s\d{2}$')
     for row in rows:
         if row is None or len(row) != 5:
@@ -30,37 +29,28 @@ def filter_valid_rows(rows):
             description = description.replace('\n', ' ').replace('\\n', ' ').strip()
             if description not in ["SALDO INIZIALE A VS. CREDITO", "SALDO FINALE A VS. CREDITO"]:
                 row[2] = description
-                valid_rows.append(row)
-    return valid_rows
+                yield row
 
-def format_euro_number(num_str):
-    if not num_str or not num_str.strip():
-        return "0"
-    num_str = num_str.strip()
-    num_clean = num_str.replace('.', '').replace(',', '.')
-    try:
-        num = float(num_clean)
-    except Exception:
-        return num_str
-    formatted = "{:,.2f}".format(num)
-    formatted = formatted.replace(',', 'X').replace('.', ',').replace('X', '.')
-    return formatted
+def iter_batches(pdf_file, progress=None):
+    """
+    Yields the transactions in TransactionBatch objects, page by page.
+    The amounts of a page are converted column by column (see transactions.amount_column).
+    """
+    def records():
+        tables = timed_iter(iter_table_pages(pdf_file, TABLE_LAYOUT, progress), __name__, "extract_table")
+        for table in tables:
+            rows = list(filter_valid_rows(table))
+            uscite = amount_column(row[3] for row in rows)
+            entrate = amount_column(row[4] for row in rows)
+            for row, debit, credit in zip(rows, uscite, entrate):
+                yield row[0], row[2], debit, credit, row[1]
+    return batched(OUTPUT, records())
 
-def process_pdf(pdf_file):
+def process_pdf(pdf_file, progress=None):
     """
     Processes the uploaded PDF file-like object and returns CSV content as a string.
     """
-    rows = extract_table_explicit(pdf_file)
-    valid_rows = filter_valid_rows(rows)
-    output = io.StringIO()
-    writer = csv.writer(output, delimiter=";")
-    header = ['Data contabile', 'Data valuta', 'Descrizione', 'Uscite', 'Entrate']
-    writer.writerow(header)
-    for row in valid_rows:
-        row[3] = format_euro_number(row[3])
-        row[4] = format_euro_number(row[4])
-        writer.writerow(row)
-    return output.getvalue()
+    return to_csv(FIELDNAMES, OUTPUT, iter_batches(pdf_file, progress), delimiter=";")
 
 if __name__ == "__main__":
     import sys
@@ -70,4 +60,4 @@ if __name__ == "__main__":
             csv_content = process_pdf(f)
         print(csv_content)
     else:
-        print("Usage: python EcSELLA.py <pdf_file>")
+        print("Usage: python -m script.EcSELLA <pdf_file>")
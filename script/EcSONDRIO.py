@@ -1,33 +1,26 @@
-import pdfplumber
-import csv
 import re
-import io
+from script.csvout import to_csv
+from script.tables import iter_table_rows
+from script.timing import timed_iter
+from script.transactions import Layout, NO_AMOUNT, batched
 
-def extract_table_standard(pdf_file):
-    """
-    Extracts table rows using a 'standard' horizontal strategy (lines-based)
-    and explicit vertical lines.
-    """
-    table_settings = {
-        "vertical_strategy": "explicit",
-        "horizontal_strategy": "lines",
-        "explicit_vertical_lines": [22, 77, 158, 220, 250, 320, 340, 550],
-        "snap_tolerance": 3,
-    }
-    all_rows = []
-    with pdfplumber.open(pdf_file) as pdf:
-        for page in pdf.pages:
-            table = page.extract_table(table_settings)
-            if table:
-                all_rows.extend(table)
-    return all_rows
+FIELDNAMES = ["Data", "Descrizione", "Uscite", "Entrate"]
+OUTPUT = Layout(["date", "description", "debit", "credit"], date_format="dd/mm/yyyy")
+
+# Page 1 markers for automatic detection (see script.detect).
+FINGERPRINT = {
+    "phrases": ["Popolare di Sondrio"],
+    "patterns": [r"^\d{2}/\d{2}/\d{4}\s+\d{2}/\d{2}/\d{4}\s+[\d.]+,\d{2}\s+(?!EUR\b)"],
+}
+
+# Column separators of the statement table (see script.tables).
+TABLE_LAYOUT = {"vertical_lines": [22, 77, 158, 220, 250, 320, 340, 550]}
 
 def process_rows(rows):
     """
-    Processes the extracted rows and returns a list of entries with:
+    Processes the extracted rows and yields entries with:
     Data, Descrizione, Uscite, Entrate.
     """
-    processed = []
     date_pattern = re.compile(r'\d{2}/\d{2}/\d{4}')
     for row in rows:
         if len(row) != 7:
@@ -40,25 +33,24 @@ def process_rows(rows):
             descrizione = descrizione.replace('\\n', ' ').replace('\n', ' ').strip()
         if descrizione in ["Saldo iniziale", "Saldo finale"]:
             continue
-        uscita = row[2].strip() if row[2] and row[2].strip() != "" else "0"
-        entrata = row[4].strip() if row[4] and row[4].strip() != "" else "0"
+        uscita = row[2].strip() if row[2] else ""
+        entrata = row[4].strip() if row[4] else ""
         if "%" in uscita or "%" in entrata:
             continue
-        processed.append([data.strip(), descrizione, uscita, entrata])
-    return processed
+        yield data.strip(), descrizione, uscita or NO_AMOUNT, entrata or NO_AMOUNT
+
+def iter_batches(pdf_file, progress=None):
+    """
+    Yields the transactions in TransactionBatch objects, page by page.
+    """
+    rows = timed_iter(iter_table_rows(pdf_file, TABLE_LAYOUT, progress), __name__, "extract_table")
+    return batched(OUTPUT, process_rows(rows))
 
-def process_pdf(pdf_file):
+def process_pdf(pdf_file, progress=None):
     """
     Processes the uploaded PDF file-like object and returns CSV content as a string.
     """
-    rows = extract_table_standard(pdf_file)
-    processed_rows = process_rows(rows)
-    output = io.StringIO()
-    writer = csv.writer(output, delimiter=";")
-    writer.writerow(["Data", "Descrizione", "Uscite", "Entrate"])
-    for row in processed_rows:
-        writer.writerow(row)
-    return output.getvalue()
+    return to_csv(FIELDNAMES, OUTPUT, iter_batches(pdf_file, progress), delimiter=";")
 
 if __name__ == "__main__":
     import sys
@@ -68,4 +60,4 @@ if __name__ == "__main__":
             csv_content = process_pdf(f)
         print(csv_content)
     else:
-        print("Usage: python EcSONDRIO.py <pdf_file>")
+        print("Usage: python -m script.EcSONDRIO <pdf_file>")
@@ -0,0 +1,96 @@
+import re
+
+# --- Italian-format amounts ---
+# Amounts are parsed into integer cents and formatted back from them, so they are exact
+# at any size (no float round-trip). Parsing follows what the scripts used to accept:
+# dots are thousands separators and are ignored wherever they appear, the comma is the
+# decimal separator, an optional sign leads. Digits after the second decimal are
+# rounded half up.
+
+_AMOUNT = re.compile(r"\s*([+-]?)([\d.]*)(?:,([\d.]*))?\s*")
+# Already in the output format (what statements print almost always): converted without
+# splitting it into parts.
+_CANONICAL = re.compile(r"(?!-0,00)-?(?:0|[1-9]\d{0,2}(?:\.\d{3})*),\d\d")
+
+def parse_cents(text):
+    """
+    Parses an Italian-format amount into integer cents: "1.234,56" -> 123456,
+    "-7,5" -> -750, "12" -> 1200. Raises ValueError when text is not an amount.
+    """
+    if _CANONICAL.fullmatch(text):
+        return int(text.replace(".", "").replace(",", ""))
+    match = _AMOUNT.fullmatch(text)
+    if match is None:
+        raise ValueError(f"Importo non valido: {text!r}")
+    sign, units, fraction = match.groups()
+    units = units.replace(".", "")
+    fraction = fraction.replace(".", "") if fraction else ""
+    if not units and not fraction:
+        raise ValueError(f"Importo non valido: {text!r}")
+    cents = int(units or "0") * 100 + int(fraction[:2].ljust(2, "0"))
+    if fraction[2:3] >= "5":
+        cents += 1
+    return -cents if sign == "-" else cents
+
+def format_cents(cents):
+    """Formats integer cents as an Italian amount: 123456 -> "1.234,56", -5 -> "-0,05"."""
+    units, rest = divmod(abs(cents), 100)
+    text = f"{units:,}".replace(",", ".") + f",{rest:02d}"
+    return "-" + text if cents < 0 else text
+
+def reformat(text, empty="0", invalid=None):
+    """
+    Normalizes an amount string to Italian format with two decimals ("1234,5" ->
+    "1.234,50"). Returns empty for a missing or blank text, and invalid (by default the
+    text itself, stripped) when it is not an amount.
+    """
+    if not text or text.isspace():
+        return empty
+    if _CANONICAL.fullmatch(text):
+        return text
+    try:
+        return format_cents(parse_cents(text))
+    except ValueError:
+        return text.strip() if invalid is None else invalid
+
+def parse_column(texts, empty=None, invalid=None):
+    """
+    parse_cents over a whole column (e.g. the Uscite of a page). Blank texts become
+    empty and texts that are not amounts become invalid; when these are None, such
+    texts raise ValueError. Repeated values are parsed once.
+    """
+    seen = {}
+    column = []
+    for text in texts:
+        if text in seen:
+            column.append(seen[text])
+            continue
+        if not text or text.isspace():
+            if empty is None:
+                raise ValueError(f"Importo mancante: {text!r}")
+            cents = empty
+        else:
+            try:
+                cents = parse_cents(text)
+            except ValueError:
+                if invalid is None:
+                    raise
+                cents = invalid
+        seen[text] = cents
+        column.append(cents)
+    return column
+
+def format_column(cents_column, known=None):
+    """
+    format_cents over a whole column; repeated values are formatted once. known maps
+    values to their text in advance (e.g. the text written for a missing amount).
+    """
+    seen = dict(known) if known else {}
+    return [seen[cents] if cents in seen else seen.setdefault(cents, format_cents(cents))
+            for cents in cents_column]
+
+def reformat_column(texts, empty="0", invalid=None):
+    """reformat over a whole column (e.g. all the Uscite of a page); repeated values are converted once."""
+    seen = {}
+    return [seen[text] if text in seen else seen.setdefault(text, reformat(text, empty, invalid))
+            for text in texts]
@@ -0,0 +1,54 @@
+import csv
+import io
+from script.timing import StageTimer
+from script.transactions import iter_module_batches
+
+# Writer options used by the scripts unless they define their own CSV_FORMAT.
+DEFAULT_FORMAT = {"delimiter": ";"}
+
+# Rows are buffered and emitted in chunks of roughly this many characters.
+FLUSH_SIZE = 8192
+
+def iter_csv(fieldnames, layout, batches, script=None, **fmtparams):
+    """
+    Serializes transaction batches (see script.transactions) lazily: yields the header
+    line straight away, then the rows rendered through layout, in chunks of about
+    FLUSH_SIZE characters as the batches are produced.
+    With script, the time spent writing is reported as that script's "csv" stage.
+    """
+    timer = StageTimer(script, "csv")
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, **(fmtparams or DEFAULT_FORMAT))
+    writer.writerow(fieldnames)
+    yield buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+    try:
+        for batch in batches:
+            with timer:
+                writer.writerows(layout.render(batch))
+            if buffer.tell() >= FLUSH_SIZE:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue()
+    finally:
+        if script:
+            timer.done()
+
+def iter_module_csv(module, pdf_file, progress=None):
+    """
+    Streams the CSV produced by a script module, using its FIELDNAMES, OUTPUT layout,
+    CSV_FORMAT and iter_batches(pdf_file, progress).
+    Unreadable PDFs raise here rather than halfway through the stream. Stage times are
+    reported under the module's name: "parse" (see script.transactions.iter_module_batches)
+    and "csv" for the serialization.
+    """
+    fmtparams = getattr(module, "CSV_FORMAT", DEFAULT_FORMAT)
+    batches = iter_module_batches(module, pdf_file, progress)
+    return iter_csv(module.FIELDNAMES, module.OUTPUT, batches, script=module.__name__, **fmtparams)
+
+def to_csv(fieldnames, layout, batches, **fmtparams):
+    """Returns the whole CSV content as a string."""
+    return "".join(iter_csv(fieldnames, layout, batches, **fmtparams))
@@ -0,0 +1,126 @@
+import os
+import re
+import importlib
+from script import ocrengine
+from script.pagecache import page_text
+from script.pdfsource import mapped, open_pdf
+from script.timing import timed
+
+# --- Bank and document-type detection ---
+# Every script declares a FINGERPRINT of what page 1 of its statements looks like:
+#   "phrases":  texts identifying the bank (case-insensitive), PHRASE_SCORE points each;
+#   "patterns": line regexes typical of the document (usually the transaction lines its
+#               parser reads), one point per matching line, at most PATTERN_CAP each;
+#   "scanned":  True if the script also reads scanned statements.
+# Only page 1 is read: its text layer, or for scans a low-resolution OCR thumbnail
+# (THUMBNAIL_DPI), when tesseract and poppler are available and the caller allows OCR
+# (not in a request thread, where it would run outside the admission control). The
+# best-scoring script wins if it reaches MIN_SCORE and no other script scores as much.
+PHRASE_SCORE = 5
+PATTERN_CAP = 5
+MIN_SCORE = 2
+THUMBNAIL_DPI = int(os.environ.get("DETECT_THUMBNAIL_DPI", 100))
+
+class FingerprintIndex:
+    """The FINGERPRINTs of the scripts of a script map ({(bank, doc_type): module name})."""
+
+    def __init__(self, script_map):
+        self.entries = []  # (key, script_name, phrases, patterns, scanned)
+        for key, script_name in script_map.items():
+            try:
+                fingerprint = getattr(importlib.import_module(script_name), "FINGERPRINT", None)
+            except Exception:
+                continue  # Reported by the caller's own import checks
+            if not fingerprint:
+                continue
+            self.entries.append((
+                key, script_name,
+                [phrase.lower() for phrase in fingerprint.get("phrases", [])],
+                [re.compile(pattern, re.MULTILINE) for pattern in fingerprint.get("patterns", [])],
+                fingerprint.get("scanned", False),
+            ))
+
+    def rank(self, text):
+        """Returns [(score, key, script_name)] for the scripts matching text, best first."""
+        lowered = text.lower()
+        ranking = []
+        for key, script_name, phrases, patterns, _ in self.entries:
+            score = sum(PHRASE_SCORE for phrase in phrases if phrase in lowered)
+            for pattern in patterns:
+                matches = 0
+                for _ in pattern.finditer(text):
+                    matches += 1
+                    if matches == PATTERN_CAP:
+                        break
+                score += matches
+            if score:
+                ranking.append((score, key, script_name))
+        ranking.sort(key=lambda entry: -entry[0])
+        return ranking
+
+    def scanned_scripts(self):
+        return [(key, script_name) for key, script_name, _, _, scanned in self.entries if scanned]
+
+    def detect(self, pdf_file, ocr=True):
+        """
+        Detects the script for pdf_file from its first page; with ocr=False scans are
+        not OCR'd.
+        Returns (key, script_name, candidates): key and script_name are None when the
+        document is not recognized or the best score is shared; candidates lists the
+        (bank, doc_type) pairs that matched, best first.
+        """
+        with timed("script.detect", "fingerprint"):
+            text, scanned = first_page_text(pdf_file, ocr)
+            if scanned and not text:
+                # Scan without OCR: only a script reading scans can be meant.
+                scripts = self.scanned_scripts()
+                if len(scripts) == 1:
+                    return scripts[0][0], scripts[0][1], [scripts[0][0]]
+                return None, None, [key for key, _ in scripts]
+            ranking = self.rank(text)
+        candidates = [key for _, key, _ in ranking]
+        if not ranking or ranking[0][0] < MIN_SCORE or (len(ranking) > 1 and ranking[1][0] == ranking[0][0]):
+            return None, None, candidates
+        return ranking[0][1], ranking[0][2], candidates
+
+def first_page_text(pdf_file, ocr=True):
+    """
+    Returns (text, scanned) for page 1 of pdf_file: scanned is True when the page has no
+    text layer but holds images, in which case text comes from a thumbnail OCR ("" if OCR
+    is not available or ocr is False).
+    The file is rewound.
+    """
+    pdf_file.seek(0)
+    try:
+        with mapped(pdf_file) as pdf_bytes:
+            with open_pdf(pdf_bytes) as pdf:
+                if not pdf.pages:
+                    return "", False
+                page = pdf.pages[0]
+                text = page_text(page, x_tolerance=1.5, y_tolerance=1.5) or ""
+                if text.strip() or not page.images:
+                    return text, False
+            return (thumbnail_text(pdf_bytes) if ocr else ""), True
+    finally:
+        pdf_file.seek(0)
+
+def thumbnail_text(pdf_bytes):
+    """OCR text of page 1 rendered at THUMBNAIL_DPI, one line per OCR line; "" without OCR."""
+    tesseract_cmd = ocrengine.find_tesseract()
+    poppler_path = ocrengine.find_poppler()
+    if ocrengine.check_engine(tesseract_cmd) or poppler_path is None:
+        return ""
+    try:
+        from pdf2image import convert_from_bytes
+    except ImportError:
+        return ""
+    images = convert_from_bytes(pdf_bytes, dpi=THUMBNAIL_DPI, first_page=1, last_page=1,
+                                grayscale=True, poppler_path=poppler_path)
+    if not images:
+        return ""
+    data = ocrengine.image_to_data(images[0], "", tesseract_cmd)
+    lines = {}
+    for block, paragraph, line, word in zip(data["block_num"], data["par_num"], data["line_num"], data["text"]):
+        if word.strip():
+            lines.setdefault((block, paragraph, line), []).append(word)
+    return "\n".join(" ".join(words) for _, words in sorted(lines.items()))
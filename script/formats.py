@@ -0,0 +1,261 @@
+import re
+import json
+import zipfile
+from datetime import date
+from xml.sax.saxutils import escape
+from script import csvout
+from script.timing import StageTimer
+from script.transactions import NO_AMOUNT, NO_DATE, iter_module_batches
+
+# --- Output formats ---
+# Besides CSV, conversions can be returned in formats meant for programs, written
+# straight from the transaction batches (no CSV in between):
+#   jsonl  one JSON object per transaction, streamed line by line;
+#   json   one JSON document {"status": "ok", "fields": [...], "transactions": [...]};
+#   xlsx   an Excel workbook with real dates and numbers (written without extra packages).
+# JSON records use the same keys for every bank (the batch fields: date, value_date when
+# the statement has it, description, debit, credit), ISO dates ("2024-05-31", or
+# "--05-31" when the statement omits the year) and amounts as numbers (null when empty).
+# Values the statement prints in a form that cannot be read as a date or amount are null.
+
+# format -> (content type, file extension)
+FORMATS = {
+    "csv": ("text/csv", ".csv"),
+    "jsonl": ("application/x-ndjson", ".jsonl"),
+    "json": ("application/json", ".json"),
+    "xlsx": ("application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", ".xlsx"),
+}
+DEFAULT_FORMAT = "csv"
+
+# The xlsx workbook is emitted in chunks of roughly this many bytes.
+FLUSH_SIZE = csvout.FLUSH_SIZE
+
+def format_for_mimetype(mimetype):
+    """Returns the format served as mimetype, or None."""
+    return next((name for name, (content_type, _) in FORMATS.items() if content_type == mimetype), None)
+
+def iso_date(value):
+    """YYYYMMDD integer -> ISO 8601 date ("--MM-DD" without year); None for NO_DATE."""
+    if value == NO_DATE:
+        return None
+    year, month_day = divmod(value, 10000)
+    month, day = divmod(month_day, 100)
+    return f"{year:04d}-{month:02d}-{day:02d}" if year else f"--{month:02d}-{day:02d}"
+
+def amount_number(cents):
+    """Integer cents -> number of euros (1234.56); None for NO_AMOUNT."""
+    return None if cents == NO_AMOUNT else cents / 100
+
+def typed_columns(layout, batch):
+    """The layout's fields of batch as columns of JSON-ready values."""
+    columns = {}
+    for name in layout.columns:
+        if name == "description":
+            columns[name] = batch.descriptions
+        elif name in ("date", "value_date"):
+            seen = {}
+            columns[name] = [seen[value] if value in seen else seen.setdefault(value, iso_date(value))
+                             for value in getattr(batch, name + "s")]
+        else:
+            columns[name] = [amount_number(cents) for cents in getattr(batch, name + "s")]
+    return columns
+
+def typed_records(layout, batch):
+    """Yields the transactions of batch as dicts of JSON-ready values (see typed_columns)."""
+    columns = typed_columns(layout, batch)
+    names = layout.columns
+    for values in zip(*(columns[name] for name in names)):
+        yield dict(zip(names, values))
+
+_json = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"))
+
+def iter_jsonl(layout, batches, script=None):
+    """Serializes batches as JSON Lines, one transaction per line, yielded batch by batch."""
+    timer = StageTimer(script, "jsonl")
+    try:
+        for batch in batches:
+            with timer:
+                text = "".join(_json.encode(record) + "\n" for record in typed_records(layout, batch))
+            yield text
+    finally:
+        if script:
+            timer.done()
+
+def iter_json(layout, batches, script=None):
+    """
+    Serializes batches as one JSON document {"status": "ok", "fields": [...],
+    "transactions": [...]}, yielded in pieces as the batches are produced.
+    """
+    timer = StageTimer(script, "json")
+    yield '{"status":"ok","fields":' + _json.encode(layout.columns) + ',"transactions":['
+    separator = ""
+    try:
+        for batch in batches:
+            with timer:
+                text = ",".join(_json.encode(record) for record in typed_records(layout, batch))
+            if text:
+                yield separator + text
+                separator = ","
+        yield "]}"
+    finally:
+        if script:
+            timer.done()
+
+#############################################
+# XLSX (SpreadsheetML written by hand)
+#############################################
+_XLSX_PARTS = {
+    "[Content_Types].xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '<Override PartName="/xl/styles.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+        '</Types>'),
+    "_rels/.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>'
+        '</Relationships>'),
+    "xl/workbook.xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="Movimenti" sheetId="1" r:id="rId1"/></sheets></workbook>'),
+    "xl/_rels/workbook.xml.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>'
+        '<Relationship Id="rId2" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" Target="styles.xml"/>'
+        '</Relationships>'),
+    # Cell styles: 0 default, 1 date (dd/mm/yyyy), 2 amount (#,##0.00)
+    "xl/styles.xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+        '<numFmts count="1"><numFmt numFmtId="164" formatCode="dd/mm/yyyy"/></numFmts>'
+        '<fonts count="1"><font><sz val="11"/><name val="Calibri"/></font></fonts>'
+        '<fills count="1"><fill><patternFill patternType="none"/></fill></fills>'
+        '<borders count="1"><border/></borders>'
+        '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+        '<cellXfs count="3"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+        '<xf numFmtId="164" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>'
+        '<xf numFmtId="4" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/></cellXfs>'
+        '</styleSheet>'),
+}
+_SHEET_START = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>')
+_SHEET_END = '</sheetData></worksheet>'
+
+# Characters XML 1.0 does not allow, even escaped.
+_XML_INVALID = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f]")
+_EXCEL_EPOCH = date(1899, 12, 30).toordinal()
+
+class _ChunkSink:
+    """Write-only, unseekable file collecting what zipfile writes, taken out in chunks."""
+
+    def __init__(self):
+        self._parts = []
+        self.size = 0
+
+    def write(self, data):
+        self._parts.append(bytes(data))
+        self.size += len(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data = b"".join(self._parts)
+        self._parts = []
+        self.size = 0
+        return data
+
+def _text_cell(ref, text):
+    return f'<c r="{ref}" t="inlineStr"><is><t xml:space="preserve">{escape(_XML_INVALID.sub("", text))}</t></is></c>'
+
+def _date_cell(ref, value, layout):
+    year, month_day = divmod(value, 10000)
+    month, day = divmod(month_day, 100)
+    try:
+        serial = date(year, month, day).toordinal() - _EXCEL_EPOCH
+    except ValueError:  # No year (or not a calendar date): keep it as text
+        return _text_cell(ref, layout.date_format.format(value))
+    return f'<c r="{ref}" s="1"><v>{serial}</v></c>'
+
+def _amount_cell(ref, cents):
+    return f'<c r="{ref}" s="2"><v>{cents / 100!r}</v></c>'
+
+def _column_letters(count):
+    return [chr(ord("A") + index) for index in range(count)]
+
+def _xlsx_rows(layout, batch, first_row):
+    letters = _column_letters(len(layout.columns))
+    columns = [(letter, name, getattr(batch, name + "s")) for letter, name in zip(letters, layout.columns)]
+    out = []
+    for index in range(len(batch)):
+        row_number = first_row + index
+        cells = []
+        for letter, name, values in columns:
+            value = values[index]
+            ref = f"{letter}{row_number}"
+            if name == "description":
+                if value:
+                    cells.append(_text_cell(ref, value))
+            elif name in ("date", "value_date"):
+                if value != NO_DATE:
+                    cells.append(_date_cell(ref, value, layout))
+            elif value != NO_AMOUNT:
+                cells.append(_amount_cell(ref, value))
+        out.append(f'<row r="{row_number}">{"".join(cells)}</row>')
+    return "".join(out)
+
+def iter_xlsx(fieldnames, layout, batches, script=None):
+    """
+    Serializes batches as an XLSX workbook (one "Movimenti" sheet, header row from
+    fieldnames), with dates and amounts stored as Excel dates and numbers.
+    The workbook is zipped as it is written and yielded in chunks of about FLUSH_SIZE bytes.
+    """
+    timer = StageTimer(script, "xlsx")
+    sink = _ChunkSink()
+    try:
+        with zipfile.ZipFile(sink, "w", zipfile.ZIP_DEFLATED) as zf:
+            for name, content in _XLSX_PARTS.items():
+                zf.writestr(name, content)
+            with zf.open("xl/worksheets/sheet1.xml", "w") as sheet:
+                header = "".join(_text_cell(f"{letter}1", name)
+                                 for letter, name in zip(_column_letters(len(fieldnames)), fieldnames))
+                sheet.write((_SHEET_START + f'<row r="1">{header}</row>').encode("utf-8"))
+                next_row = 2
+                for batch in batches:
+                    with timer:
+                        sheet.write(_xlsx_rows(layout, batch, next_row).encode("utf-8"))
+                    next_row += len(batch)
+                    if sink.size >= FLUSH_SIZE:
+                        yield sink.take()
+                sheet.write(_SHEET_END.encode("utf-8"))
+        yield sink.take()
+    finally:
+        if script:
+            timer.done()
+
+def iter_module_output(module, pdf_file, progress=None, output_format=DEFAULT_FORMAT):
+    """
+    Streams the conversion of pdf_file by a script module in output_format (see FORMATS):
+    text chunks, or bytes for xlsx. Like csvout.iter_module_csv, unreadable PDFs raise
+    here rather than halfway through the stream; the serialization is reported as the
+    module's stage named after the format.
+    """
+    if output_format == "csv":
+        return csvout.iter_module_csv(module, pdf_file, progress)
+    if output_format not in FORMATS:
+        raise ValueError(f"Formato di output non supportato: {output_format!r}")
+    batches = iter_module_batches(module, pdf_file, progress)
+    if output_format == "jsonl":
+        return iter_jsonl(module.OUTPUT, batches, script=module.__name__)
+    if output_format == "json":
+        return iter_json(module.OUTPUT, batches, script=module.__name__)
+    return iter_xlsx(module.FIELDNAMES, module.OUTPUT, batches, script=module.__name__)
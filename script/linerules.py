@@ -0,0 +1,71 @@
+import re
+import itertools
+
+# --- Line classification for the text-layer parsers ---
+# The line parsers (EcBPM, mBPM, EcQONTO, mCreditAgricole) read a statement as text
+# lines and decide what each one is: the first line of a transaction, the end of the
+# transactions, a header or footer to leave out of the descriptions, or plain text
+# continuing the current description. Each script declares these rules once, as a
+# LineRules compiled at import time, instead of checking every line in its own loop.
+# Rules are tried in order and the first match wins; a line matching none is TEXT.
+# Consecutive rules of the same kind are compiled into one alternation regex (escaped
+# phrases and anchored patterns), so each kind costs a single regex call per line: a
+# match when the kind has only patterns, a search otherwise.
+
+START = "start"  # First line of a transaction; its fields are the pattern's groups
+STOP = "stop"    # No transactions after this line
+SKIP = "skip"    # Not part of any description
+TEXT = "text"    # Anything else
+
+def phrases(*texts):
+    """Matches lines containing any of texts."""
+    if not texts:
+        return r"(?!)", 0, False  # Matches nothing
+    return "|".join(re.escape(text) for text in texts), 0, False
+
+def pattern(regex):
+    """
+    Matches lines starting with regex (anchor it with $ to match whole lines); fields
+    are its groups, which must be unnamed and not referenced by number.
+    """
+    return regex, re.compile(regex).groups, True
+
+class LineRules:
+    """An ordered list of (kind, matcher) rules, see phrases and pattern."""
+
+    def __init__(self, *rules):
+        # [(kind, match or search, {group index of a rule: slice of its fields in groups()})]
+        self.categories = []
+        for kind, group in itertools.groupby(rules, key=lambda rule: rule[0]):
+            matchers = [matcher for _, matcher in group]
+            # Only patterns: one match at the start of the line; otherwise one search,
+            # with the patterns anchored
+            anchored = all(starts for _, _, starts in matchers)
+            alternatives, fields = [], {}
+            group_index = 1
+            for regex, field_count, starts in matchers:
+                if starts and not anchored:
+                    regex = rf"\A(?:{regex})"
+                # Each rule is wrapped in a group, which is the lastindex when it matches
+                alternatives.append(f"({regex})")
+                fields[group_index] = slice(group_index, group_index + field_count)
+                group_index += 1 + field_count
+            compiled = re.compile("|".join(alternatives))
+            self.categories.append((kind, compiled.match if anchored else compiled.search, fields))
+
+    def classify(self, line):
+        """Returns (kind, fields) for line: the first matching rule's kind and fields, or (TEXT, ())."""
+        for kind, search, fields in self.categories:
+            found = search(line)
+            if found is not None:
+                return kind, found.groups()[fields[found.lastindex]]
+        return TEXT, ()
+
+    def iter_lines(self, lines):
+        """Yields (kind, fields, line) for the stripped, non-blank lines."""
+        classify = self.classify
+        for line in lines:
+            line = line.strip()
+            if line:
+                kind, fields = classify(line)
+                yield kind, fields, line
@@ -1,103 +1,110 @@
-import pdfplumber
-import re
-import csv
-import io
+from script.pdfsource import iter_pages, open_pdf
+from script.pagecache import page_text
+from script.csvout import to_csv
+from script.linerules import LineRules, START, pattern
+from script.timing import timed_iter
+from script.amounts import parse_cents
+from script.transactions import Layout, batched
 
-def extract_text_with_pdfplumber(pdf_file):
+FIELDNAMES = ["Data", "Descrizione", "Uscite", "Entrate"]
+OUTPUT = Layout(["date", "description", "debit", "credit"], date_format="dd/mm/yyyy")
+
+# Page 1 markers for automatic detection (see script.detect).
+FINGERPRINT = {
+    "phrases": ["Banco BPM", "Banca Popolare di Milano"],
+    "patterns": [r"^\d{2}/\d{2}/\d{4}\s+\d{2}/\d{2}/\d{4}\s+-?[\d.,]+\s+EUR\s"],
+}
+
+def extract_lines_with_pdfplumber(pdf_file, progress=None):
     """
-    Extract text from a PDF using pdfplumber.
+    Extract text from a PDF using pdfplumber, yielding it line by line, page by page.
     """
-    full_text = []
-    with pdfplumber.open(pdf_file) as pdf:
-        for page in pdf.pages:
-            text = page.extract_text(x_tolerance=1.5, y_tolerance=1.5)
+    with open_pdf(pdf_file) as pdf:
+        for _, page in iter_pages(pdf, progress):
+            text = page_text(page, x_tolerance=1.5, y_tolerance=1.5)
             if text:
-                full_text.append(text)
-    return "\n\n".join(full_text)
+                yield from text.splitlines()
 
-def format_amount(amount_float):
+def finalize_transaction(tx):
     """
-    Format a float into the format 1.000,00.
+    Converts a collected transaction (Data, Descrizione, Amount_str) into a row with
+    Uscite and Entrate (depending on the sign). Returns None if the amount is not a number.
     """
-    formatted = f"{amount_float:,.2f}"
-    formatted = formatted.replace(",", "X").replace(".", ",").replace("X", ".")
-    return formatted
+    amt_str = tx["Amount_str"]
+    negative = amt_str.startswith("-")
+    try:
+        amount = parse_cents(amt_str[1:] if negative else amt_str)
+    except ValueError:
+        return None
+    if negative:
+        uscite = amount
+        entrate = 0
+    else:
+        entrate = amount
+        uscite = 0
+    # Clean up description to ensure it's on a single line
+    description = tx["Descrizione"].replace('\n', ' ').replace('\\n', ' ').strip()
+    return {
+        "Data": tx["Data"],
+        "Descrizione": description,
+        "Uscite": uscite,
+        "Entrate": entrate
+    }
 
-def parse_transactions(text):
-    """
-    Parse the extracted text and return a list of transaction dictionaries.
-    Each transaction is expected to have fields: Data, Descrizione, and an Amount_str.
-    Then, it creates two fields: Uscite and Entrate (depending on the sign).
-    """
-    transactions = []
-    current_transaction = None
-    transaction_re = re.compile(
+# Line rules of the statement (see script.linerules).
+LINE_RULES = LineRules(
+    (START, pattern(
         r'^(\d{2}/\d{2}/\d{4})\s+'      # date field 1
         r'(\d{2}/\d{2}/\d{4})\s+'       # date field 2 (ignored)
         r'([-]?[0-9\.,]+)\s+'           # amount field (with optional minus)
         r'EUR\s+'                      # literal "EUR"
         r'\S+\s+'                      # skip a field
         r'(.+)$'                       # description
-    )
-    lines = text.splitlines()
-    for line in lines:
-        line = line.strip()
-        if not line:
-            continue
-        match = transaction_re.match(line)
-        if match:
+    )),
+)
+
+def parse_transactions(lines):
+    """
+    Parse the extracted text lines and yield transaction dictionaries.
+    Each transaction is expected to have fields: Data, Descrizione, and an Amount_str;
+    a transaction is yielded once the next one starts (or the lines end).
+    """
+    current_transaction = None
+    for kind, fields, line in LINE_RULES.iter_lines(lines):
+        if kind == START:
             if current_transaction:
-                transactions.append(current_transaction)
-            data = match.group(1)
-            amount_str = match.group(3)
-            descr = match.group(4).strip()
+                parsed = finalize_transaction(current_transaction)
+                if parsed:
+                    yield parsed
+            data, _, amount_str, descr = fields
             current_transaction = {
                 "Data": data,
-                "Descrizione": descr,
+                "Descrizione": descr.strip(),
                 "Amount_str": amount_str
             }
         else:
             if current_transaction:
                 current_transaction["Descrizione"] += " " + line
     if current_transaction:
-        transactions.append(current_transaction)
+        parsed = finalize_transaction(current_transaction)
+        if parsed:
+            yield parsed
 
-    parsed_transactions = []
-    for tx in transactions:
-        amt_str = tx["Amount_str"]
-        cleaned_amt = amt_str.replace(".", "").replace(",", ".")
-        try:
-            amt = float(cleaned_amt)
-        except ValueError:
-            continue
-        if amt < 0:
-            uscite = format_amount(abs(amt))
-            entrate = "0,00"
-        else:
-            entrate = format_amount(amt)
-            uscite = "0,00"
-        # Clean up description to ensure it's on a single line
-        description = tx["Descrizione"].replace('\n', ' ').replace('\\n', ' ').strip()
-        parsed_transactions.append({
-            "Data": tx["Data"],
-            "Descrizione": description,
-            "Uscite": uscite,
-            "Entrate": entrate
-        })
-    return parsed_transactions
+def iter_batches(pdf_file, progress=None):
+    """
+    Yields the transactions in TransactionBatch objects as they are parsed, page by page.
+    """
+    def records():
+        lines = timed_iter(extract_lines_with_pdfplumber(pdf_file, progress), __name__, "extract_text")
+        for tx in parse_transactions(lines):
+            yield tx["Data"], tx["Descrizione"], tx["Uscite"], tx["Entrate"]
+    return batched(OUTPUT, records())
 
-def process_pdf(pdf_file):
+def process_pdf(pdf_file, progress=None):
     """
     Processes the PDF file-like object and returns a CSV string.
     """
-    text = extract_text_with_pdfplumber(pdf_file)
-    transactions = parse_transactions(text)
-    output = io.StringIO()
-    writer = csv.DictWriter(output, fieldnames=["Data", "Descrizione", "Uscite", "Entrate"], delimiter=";")
-    writer.writeheader()
-    for tx in transactions:
-        writer.writerow(tx)
-    return output.getvalue()
+    return to_csv(FIELDNAMES, OUTPUT, iter_batches(pdf_file, progress), delimiter=";")
 
 if __name__ == "__main__":
     import sys
@@ -107,4 +114,4 @@ if __name__ == "__main__":
             csv_content = process_pdf(f)
         print(csv_content)
     else:
-        print("Usage: python mBPM.py <pdf_file>")
+        print("Usage: python -m script.mBPM <pdf_file>")
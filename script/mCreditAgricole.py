@@ -1,115 +1,124 @@
-import pdfplumber
+from script.pdfsource import iter_pages, open_pdf
+from script.pagecache import page_text
 import re
-import csv
-import io
+from script.csvout import to_csv
+from script.linerules import LineRules, START, pattern, phrases
+from script.timing import timed_iter
+from script.transactions import Layout, NO_AMOUNT, amount_value, batched
 
-def extract_text_from_pdf(pdf_file):
+FIELDNAMES = ["Data", "Descrizione", "Uscite", "Entrate"]
+OUTPUT = Layout(["date", "description", "debit", "credit"], date_format="dd/mm/yy")
+
+# Page 1 markers for automatic detection (see script.detect).
+FINGERPRINT = {
+    "phrases": ["Crédit Agricole", "Credit Agricole"],
+    "patterns": [r"^\d{2}/\d{2}/\d{2}\s+\D.*\s-?[\d.]+,\d{2}\s*$", r"RIEPILOGO DEI SUOI MOVIMENTI"],
+}
+
+def extract_lines_from_pdf(pdf_file, progress=None):
     """
-    Extracts text from all pages of the PDF.
+    Extracts text from the pages of the PDF, yielding it line by line, page by page.
+    An empty line separates consecutive pages.
     """
-    full_text = []
-    with pdfplumber.open(pdf_file) as pdf:
-        for page in pdf.pages:
-            text = page.extract_text(x_tolerance=1.5, y_tolerance=1.5)
+    first_page = True
+    with open_pdf(pdf_file) as pdf:
+        for _, page in iter_pages(pdf, progress):
+            text = page_text(page, x_tolerance=1.5, y_tolerance=1.5)
             if text:
-                full_text.append(text)
-    return "\n\n".join(full_text)
+                if not first_page:
+                    yield ""
+                first_page = False
+                yield from text.splitlines()
 
-def format_number(amount_str):
-    """
-    Converts an amount string into a formatted string with Italian formatting.
-    """
-    normalized = amount_str.replace('.', '').replace(',', '.')
-    try:
-        value = float(normalized)
-    except ValueError:
-        return amount_str
-    formatted = format(value, ",.2f")
-    formatted = formatted.replace(",", "X").replace(".", ",").replace("X", ".")
-    return formatted
+# Line rules of the statement (see script.linerules): transactions are the lines
+# starting with a dd/mm/yy date and ending with the amount; the summary header is
+# followed by the stamp duty ("Impostadibollo"), read by extract_summary_transaction.
+SUMMARY = "summary"
+LINE_RULES = LineRules(
+    (SUMMARY, phrases("RIEPILOGO DEI SUOI MOVIMENTI")),
+    (START, pattern(r"^(\d{2}/\d{2}/\d{2})\s+(.+?)\s+(-?[\d\.,]+)\s*$")),
+)
 
-def extract_transactions(text):
+def extract_transactions(lines):
     """
-    Extracts transactions that start with a date (dd/mm/yy) from the text.
+    Extracts transactions that start with a date (dd/mm/yy) from the text lines.
+    The summary transaction (if present) is yielded last.
     """
-    transactions = []
-    lines = text.splitlines()
-    pattern = re.compile(r"^(\d{2}/\d{2}/\d{2})\s+(.+?)\s+(-?[\d\.,]+)\s*$")
+    classify = LINE_RULES.classify
+    summary_lines = None
     for line in lines:
-        match = pattern.match(line)
-        if match:
-            date = match.group(1)
-            description = match.group(2).strip()
-            amount_str = match.group(3).strip()
+        kind, fields = classify(line)
+        # Keep the 10 lines starting at the summary header for extract_summary_transaction.
+        if summary_lines is None and kind == SUMMARY:
+            summary_lines = []
+        if summary_lines is not None and len(summary_lines) < 10:
+            summary_lines.append(line)
+        if kind == START:
+            date, description, amount_str = fields
+            description = description.strip()
+            amount_str = amount_str.strip()
             if amount_str.startswith("-"):
-                formatted_amount = format_number(amount_str[1:])
-                uscite = "0"
+                formatted_amount = amount_value(amount_str[1:])
+                uscite = NO_AMOUNT
                 entrate = formatted_amount
             else:
-                formatted_amount = format_number(amount_str)
+                formatted_amount = amount_value(amount_str)
                 uscite = formatted_amount
-                entrate = "0"
-            transactions.append({
+                entrate = NO_AMOUNT
+            yield {
                 "Data": date,
                 "Descrizione": description,
                 "Uscite": uscite,
                 "Entrate": entrate
-            })
-    return transactions
+            }
+    if summary_lines:
+        yield from extract_summary_transaction(summary_lines)
 
-def extract_summary_transaction(text):
+def extract_summary_transaction(summary_lines):
     """
-    Extracts a summary transaction (if present) from the text.
+    Extracts a summary transaction (if present) from the lines following the
+    "RIEPILOGO DEI SUOI MOVIMENTI" header.
     """
     transactions = []
-    if "RIEPILOGO DEI SUOI MOVIMENTI" in text:
-        lines = text.splitlines()
-        summary_lines = []
-        for i, line in enumerate(lines):
-            if "RIEPILOGO DEI SUOI MOVIMENTI" in line:
-                summary_lines = lines[i:i+10]
-                break
-        summary_date = None
-        date_pattern = re.compile(r"^(\d{2}/\d{2}/\d{2})")
-        for line in summary_lines:
-            m = date_pattern.match(line)
-            if m:
-                summary_date = m.group(1)
-                break
-        imp_pattern = re.compile(r"^Impostadibollo\s+([\d\.,]+)")
-        for line in summary_lines:
-            m = imp_pattern.match(line)
-            if m:
-                amount_str = m.group(1)
-                formatted_amount = format_number(amount_str)
-                transactions.append({
-                    "Data": summary_date if summary_date else "",
-                    "Descrizione": "Impostadibollo",
-                    "Uscite": formatted_amount,
-                    "Entrate": "0"
-                })
-                break
+    summary_date = None
+    date_pattern = re.compile(r"^(\d{2}/\d{2}/\d{2})")
+    for line in summary_lines:
+        m = date_pattern.match(line)
+        if m:
+            summary_date = m.group(1)
+            break
+    imp_pattern = re.compile(r"^Impostadibollo\s+([\d\.,]+)")
+    for line in summary_lines:
+        m = imp_pattern.match(line)
+        if m:
+            amount_str = m.group(1)
+            formatted_amount = amount_value(amount_str)
+            transactions.append({
+                "Data": summary_date if summary_date else "",
+                "Descrizione": "Impostadibollo",
+                "Uscite": formatted_amount,
+                "Entrate": NO_AMOUNT
+            })
+            break
     return transactions
 
-def process_pdf(pdf_file):
+def iter_batches(pdf_file, progress=None):
+    """
+    Yields the transactions in TransactionBatch objects as they are parsed, page by page.
+    """
+    def records():
+        lines = timed_iter(extract_lines_from_pdf(pdf_file, progress), __name__, "extract_text")
+        for tx in extract_transactions(lines):
+            # Clean up descriptions to ensure they're on a single line
+            descrizione = tx["Descrizione"].replace('\n', ' ').replace('\\n', ' ').strip()
+            yield tx["Data"], descrizione, tx["Uscite"], tx["Entrate"]
+    return batched(OUTPUT, records())
+
+def process_pdf(pdf_file, progress=None):
     """
     Processes the Credit Agricole PDF and returns CSV content as a string.
     """
-    text = extract_text_from_pdf(pdf_file)
-    transactions = extract_transactions(text)
-    summary_transactions = extract_summary_transaction(text)
-    transactions.extend(summary_transactions)
-    
-    # Clean up descriptions to ensure they're on a single line
-    for tx in transactions:
-        tx["Descrizione"] = tx["Descrizione"].replace('\n', ' ').replace('\\n', ' ').strip()
-    
-    output = io.StringIO()
-    writer = csv.DictWriter(output, fieldnames=["Data", "Descrizione", "Uscite", "Entrate"], delimiter=";")
-    writer.writeheader()
-    for row in transactions:
-        writer.writerow(row)
-    return output.getvalue()
+    return to_csv(FIELDNAMES, OUTPUT, iter_batches(pdf_file, progress), delimiter=";")
 
 if __name__ == "__main__":
     import sys
@@ -119,4 +128,4 @@ if __name__ == "__main__":
             csv_content = process_pdf(f)
         print(csv_content)
     else:
-        print("Usage: python mCreditAgricole.py <pdf_file>")
+        print("Usage: python -m script.mCreditAgricole <pdf_file>")
@@ -1,35 +1,28 @@
-import pdfplumber
 import csv
 import re
-import io
+from script.csvout import to_csv
+from script.tables import iter_table_rows
+from script.timing import timed_iter
+from script.transactions import Layout, NO_AMOUNT, batched
 
-def extract_table_standard(pdf_file):
-    """
-    Extracts table rows from the PDF using a 'standard' horizontal (lines-based) strategy and explicit vertical lines.
-    """
-    table_settings = {
-        "vertical_strategy": "explicit",
-        "horizontal_strategy": "lines",
-        "explicit_vertical_lines": [40, 80, 177, 358, 380, 455, 500, 556],
-        "snap_tolerance": 3,
-    }
-    all_rows = []
-    with pdfplumber.open(pdf_file) as pdf:
-        for page in pdf.pages:
-            table = page.extract_table(table_settings)
-            if table:
-                all_rows.extend(table)
-    return all_rows
+FIELDNAMES = ["Data", "Descrizione", "Uscite", "Entrate"]
+CSV_FORMAT = {"delimiter": ";", "quoting": csv.QUOTE_MINIMAL}
+OUTPUT = Layout(["date", "description", "debit", "credit"], date_format="dd/mm/yyyy")
+
+# Page 1 markers for automatic detection (see script.detect).
+FINGERPRINT = {
+    "phrases": ["Popolare di Sondrio"],
+    "patterns": [r"^\d{2}/\d{2}/\d{4}\s+\D.*\s[\d.]+,\d{2}\s+EUR\s*$"],
+}
+
+# Column separators of the statement table (see script.tables).
+TABLE_LAYOUT = {"vertical_lines": [40, 80, 177, 358, 380, 455, 500, 556]}
 
-def process_pdf(pdf_file):
+def process_rows(rows):
     """
-    Processes the PDF file-like object and returns CSV content as a string.
+    Processes the extracted rows and yields entries with:
+    Data, Descrizione, Uscite, Entrate.
     """
-    rows = extract_table_standard(pdf_file)
-    output = io.StringIO()
-    writer = csv.writer(output, delimiter=";", quoting=csv.QUOTE_MINIMAL)
-    writer.writerow(["Data", "Descrizione", "Uscite", "Entrate"])
-    
     date_pattern = re.compile(r"^\d{2}/\d{2}/\d{4}$")
     
     for row in rows:
@@ -50,11 +43,23 @@ def process_pdf(pdf_file):
             m = re.search(r"([0-9.]+,[0-9]+)", text)
             if m:
                 return m.group(1)
-            return "0"
-        uscite = extract_numeric_value(uscite_raw) if uscite_raw else "0"
-        entrate = extract_numeric_value(entrate_raw) if entrate_raw else "0"
-        writer.writerow([data, descrizione, uscite, entrate])
-    return output.getvalue()
+            return NO_AMOUNT
+        uscite = extract_numeric_value(uscite_raw) if uscite_raw else NO_AMOUNT
+        entrate = extract_numeric_value(entrate_raw) if entrate_raw else NO_AMOUNT
+        yield data, descrizione, uscite, entrate
+
+def iter_batches(pdf_file, progress=None):
+    """
+    Yields the transactions in TransactionBatch objects, page by page.
+    """
+    rows = timed_iter(iter_table_rows(pdf_file, TABLE_LAYOUT, progress), __name__, "extract_table")
+    return batched(OUTPUT, process_rows(rows))
+
+def process_pdf(pdf_file, progress=None):
+    """
+    Processes the PDF file-like object and returns CSV content as a string.
+    """
+    return to_csv(FIELDNAMES, OUTPUT, iter_batches(pdf_file, progress), **CSV_FORMAT)
 
 if __name__ == "__main__":
     import sys
@@ -64,4 +69,4 @@ if __name__ == "__main__":
             csv_content = process_pdf(f)
         print(csv_content)
     else:
-        print("Usage: python mSONDRIO.py <pdf_file>")
+        print("Usage: python -m script.mSONDRIO <pdf_file>")
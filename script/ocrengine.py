@@ -0,0 +1,240 @@
+import os
+import sys
+import shlex
+import shutil
+import tempfile
+import subprocess
+import threading
+import importlib.util
+from contextlib import contextmanager
+
+# --- Tesseract engines ---
+# Opt-in: tesserocr is not in requirements.txt (it needs the tesseract and leptonica
+# development libraries to build), so deployments use pytesseract unless they add it.
+# With tesserocr installed (pip install tesserocr), OCR runs in-process on resident
+# engines: each one loads its traineddata once and is then reused for every page and
+# conversion handled by the same process, one borrower at a time. Without tesserocr
+# every call goes through pytesseract, which starts a tesseract process per image
+# (reloading the model and passing the image through temporary files); images_to_data
+# amortizes that by reading several images (e.g. a page's column strips) with a single
+# tesseract process, through a list file.
+# TESSERACT_ENGINE forces a backend: "tesserocr", "cli" (pytesseract) or "auto".
+TESSERACT_ENGINE = os.environ.get("TESSERACT_ENGINE", "auto")
+TESSERACT_LANG = os.environ.get("TESSERACT_LANG", "eng")
+
+# Usual install locations, tried after TESSERACT_CMD, the bundled build and the PATH.
+TESSERACT_LOCATIONS = {
+    "nt": [r"C:\Program Files\Tesseract-OCR\tesseract.exe", r"C:\Program Files (x86)\Tesseract-OCR\tesseract.exe"],
+    "posix": ["/usr/bin/tesseract", "/usr/local/bin/tesseract", "/opt/homebrew/bin/tesseract"],
+}
+POPPLER_LOCATIONS = {
+    "nt": [r"C:\Program Files\poppler\Library\bin", r"C:\Program Files\poppler\bin"],
+    "posix": ["/usr/bin", "/usr/local/bin", "/opt/homebrew/bin"],
+}
+# Windows builds shipped with the app (and with the PyInstaller bundle).
+BUNDLED_TESSERACT = "Tesseract-OCR/tesseract.exe"
+BUNDLED_POPPLER = "poppler-24.08.0/Library/bin"
+
+TSV_INT_FIELDS = ["level", "page_num", "block_num", "par_num", "line_num", "word_num",
+                  "left", "top", "width", "height"]
+
+def resource_path(relative_path):
+    """Get absolute path to resource, works for dev and for PyInstaller."""
+    if hasattr(sys, '_MEIPASS'):
+        return os.path.join(sys._MEIPASS, relative_path)
+    return os.path.join(os.path.abspath("."), relative_path)
+
+def _executable(name):
+    return name + ".exe" if os.name == "nt" else name
+
+def find_tesseract():
+    """
+    Returns the path of the tesseract executable for this platform: TESSERACT_CMD if set,
+    the bundled build (Windows only), tesseract on the PATH, then the usual install
+    locations. None when there is none.
+    """
+    if os.environ.get("TESSERACT_CMD"):
+        return os.environ["TESSERACT_CMD"]
+    candidates = [resource_path(BUNDLED_TESSERACT)] if os.name == "nt" else []
+    candidates.append(shutil.which(_executable("tesseract")))
+    candidates.extend(TESSERACT_LOCATIONS.get(os.name, []))
+    return next((path for path in candidates if path and os.path.isfile(path)), None)
+
+def find_poppler():
+    """
+    Returns the directory holding the poppler tools (pdftoppm) for this platform:
+    POPPLER_PATH if set, the bundled build (Windows only), the PATH, then the usual
+    install locations. None when there is none.
+    """
+    if os.environ.get("POPPLER_PATH"):
+        return os.environ["POPPLER_PATH"]
+    candidates = [resource_path(BUNDLED_POPPLER)] if os.name == "nt" else []
+    pdftoppm = shutil.which(_executable("pdftoppm"))
+    candidates.append(os.path.dirname(pdftoppm) if pdftoppm else None)
+    candidates.extend(POPPLER_LOCATIONS.get(os.name, []))
+    return next((path for path in candidates
+                 if path and os.path.isfile(os.path.join(path, _executable("pdftoppm")))), None)
+
+def find_tessdata(tesseract_cmd):
+    """tessdata directory for resident engines: TESSDATA_PREFIX, or the one next to tesseract_cmd."""
+    if os.environ.get("TESSDATA_PREFIX"):
+        return os.environ["TESSDATA_PREFIX"]
+    if tesseract_cmd:
+        tessdata = os.path.join(os.path.dirname(tesseract_cmd), "tessdata")
+        if os.path.isdir(tessdata):
+            return tessdata
+    return None  # tesserocr falls back to the path it was built with
+
+def resident_available():
+    """True when OCR runs on resident tesserocr engines (see TESSERACT_ENGINE)."""
+    if TESSERACT_ENGINE == "cli":
+        return False
+    return importlib.util.find_spec("tesserocr") is not None
+
+def check_engine(tesseract_cmd):
+    """Returns the problems that would make OCR fail with the selected backend."""
+    if resident_available():
+        return []
+    if TESSERACT_ENGINE == "tesserocr":
+        return ["pacchetto Python 'tesserocr' non installato (TESSERACT_ENGINE=tesserocr)"]
+    problems = []
+    if importlib.util.find_spec("pytesseract") is None:
+        problems.append("pacchetto Python 'pytesseract' non installato")
+    if not tesseract_cmd:
+        problems.append("tesseract non trovato (imposta TESSERACT_CMD o installalo nel PATH)")
+    return problems
+
+def parse_config(config):
+    """Splits a tesseract command-line config ("--psm 6 -c name=value") into (psm, variables)."""
+    psm, variables = None, {}
+    args = config.split()
+    for flag, value in zip(args, args[1:]):
+        if flag == "--psm":
+            psm = int(value)
+        elif flag == "-c":
+            name, _, value = value.partition("=")
+            variables[name] = value
+    return psm, variables
+
+def parse_tsv(tsv):
+    """Parses tesseract TSV output into the dict pytesseract.image_to_data(output_type=DICT) returns."""
+    data = {field: [] for field in TSV_INT_FIELDS + ["conf", "text"]}
+    for line in tsv.splitlines():
+        values = line.split("\t", 11)
+        if len(values) < 11 or not values[0].isdigit():
+            continue  # Header or malformed line
+        for field, value in zip(TSV_INT_FIELDS, values):
+            data[field].append(int(value))
+        data["conf"].append(float(values[10]))
+        data["text"].append(values[11] if len(values) > 11 else "")
+    return data
+
+class EnginePool:
+    """
+    Resident tesserocr engines, one set per config, created on demand and reused.
+    An engine serves one borrower at a time; idle engines stay loaded for the next one.
+    """
+
+    def __init__(self, tessdata=None, lang=TESSERACT_LANG):
+        self.tessdata = tessdata
+        self.lang = lang
+        self._idle = {}  # config -> [engine]
+        self._lock = threading.Lock()
+
+    def _create(self, config):
+        import tesserocr
+        psm, variables = parse_config(config)
+        kwargs = {"lang": self.lang}
+        if psm is not None:
+            kwargs["psm"] = psm
+        if self.tessdata:
+            kwargs["path"] = self.tessdata
+        engine = tesserocr.PyTessBaseAPI(**kwargs)
+        for name, value in variables.items():
+            engine.SetVariable(name, value)
+        return engine
+
+    @contextmanager
+    def borrow(self, config):
+        with self._lock:
+            idle = self._idle.setdefault(config, [])
+            engine = idle.pop() if idle else None
+        if engine is None:
+            engine = self._create(config)
+        try:
+            yield engine
+        except BaseException:
+            engine.End()  # State unknown after a failure: do not reuse it
+            raise
+        with self._lock:
+            self._idle[config].append(engine)
+
+    def image_to_data(self, img, config=""):
+        from PIL import Image
+        image = Image.fromarray(img) if not isinstance(img, Image.Image) else img
+        with self.borrow(config) as engine:
+            engine.SetImage(image)
+            tsv = engine.GetTSVText(0)
+        return parse_tsv(tsv or "")
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def image_to_data(img, config="", tesseract_cmd=None):
+    """
+    OCR data of img (numpy array or PIL image), in the format of
+    pytesseract.image_to_data(output_type=Output.DICT): on a resident engine when
+    available, otherwise through the tesseract executable at tesseract_cmd.
+    """
+    global _pool
+    if resident_available():
+        if _pool is None:
+            with _pool_lock:
+                if _pool is None:
+                    _pool = EnginePool(find_tessdata(tesseract_cmd))
+        return _pool.image_to_data(img, config)
+    import pytesseract
+    if tesseract_cmd:
+        pytesseract.pytesseract.tesseract_cmd = tesseract_cmd
+    return pytesseract.image_to_data(img, config=config, output_type=pytesseract.Output.DICT)
+
+def images_to_data(images, config="", tesseract_cmd=None):
+    """
+    OCR data of each image in images, as image_to_data returns it. Without resident
+    engines the images are read by one tesseract process (see cli_images_to_data).
+    """
+    if resident_available() or len(images) < 2:
+        return [image_to_data(img, config, tesseract_cmd) for img in images]
+    return cli_images_to_data(images, config, tesseract_cmd)
+
+def cli_images_to_data(images, config="", tesseract_cmd=None):
+    """
+    Runs the tesseract executable once on a list file naming the images, saved as PNG
+    to a temporary directory, and splits its TSV output by page (one page per image).
+    """
+    from PIL import Image
+    with tempfile.TemporaryDirectory(prefix="ocr_") as tmp_dir:
+        list_path = os.path.join(tmp_dir, "images.txt")
+        with open(list_path, "w", encoding="utf-8") as f:
+            for index, img in enumerate(images):
+                image = Image.fromarray(img) if not isinstance(img, Image.Image) else img
+                image_path = os.path.join(tmp_dir, f"{index}.png")
+                image.save(image_path)
+                f.write(image_path + "\n")
+        output_base = os.path.join(tmp_dir, "output")
+        command = [tesseract_cmd or "tesseract", list_path, output_base, "-l", TESSERACT_LANG]
+        command += shlex.split(config) + ["tsv"]
+        # No console window per call in the Windows desktop build (as pytesseract does).
+        creationflags = subprocess.CREATE_NO_WINDOW if os.name == "nt" else 0
+        result = subprocess.run(command, capture_output=True, creationflags=creationflags)
+        if result.returncode != 0:
+            message = result.stderr.decode("utf-8", "replace").strip()
+            raise RuntimeError(f"tesseract terminato con codice {result.returncode}: {message}")
+        with open(output_base + ".tsv", "r", encoding="utf-8") as f:
+            data = parse_tsv(f.read())
+    pages = [{field: [] for field in data} for _ in images]
+    for i, page_num in enumerate(data["page_num"]):
+        if 1 <= page_num <= len(pages):
+            for field, values in data.items():
+                pages[page_num - 1][field].append(values[i])
+    return pages
@@ -0,0 +1,132 @@
+import json
+import hashlib
+import weakref
+from pdfminer.pdftypes import PDFObjRef, PDFStream
+from pdfminer.psparser import PSLiteral, PSKeyword
+
+# --- Page-level extraction cache ---
+# Statements are often converted again with a few more pages (the same account,
+# downloaded later in the month), or detected and then converted. What the scripts
+# extract from a page (its text lines, table rows or OCR tokens) is cached under a
+# digest of what the page draws (content streams, fonts, images, boxes), so only new
+# or changed pages are parsed or OCR'd again. The digest is combined with a namespace
+# describing how the page is read (the extraction and its settings, e.g. a script's
+# table layout), since the same page gives different results with other settings.
+# The cache is off until the application configures a store: any object with
+# get(key) -> text or None and put(key, text), such as result_cache.ResultCache.
+
+# Bump when the digest or the cached values change, to ignore older entries.
+VERSION = "1"
+
+# Page attributes that determine what is drawn.
+_PAGE_ATTRIBUTES = ("Contents", "Resources", "MediaBox", "CropBox", "Rotate")
+
+_store = None
+_MISSING = object()
+# Document -> {object id: digest}, so objects shared by many pages (fonts, logos)
+# are hashed once per document; page -> digest, so a page keeps the digest it had
+# before extraction decoded its streams.
+_object_digests = weakref.WeakKeyDictionary()
+_page_digests = weakref.WeakKeyDictionary()
+
+def configure(store):
+    """Sets the store the page cache uses (None disables the cache)."""
+    global _store
+    _store = store
+
+def namespace(name, **settings):
+    """Returns the namespace of an extraction: its name and the settings it depends on."""
+    return f"{name}|{json.dumps(settings, sort_keys=True, default=repr)}"
+
+def _update(digest, obj, memo, seen):
+    if isinstance(obj, PDFObjRef):
+        if obj.objid in memo:
+            digest.update(memo[obj.objid])
+            return
+        if obj.objid in seen:  # Reference cycle: the object is already being hashed
+            digest.update(b"R%d" % obj.objid)
+            return
+        seen.add(obj.objid)
+        inner = hashlib.sha256()
+        _update(inner, obj.resolve(), memo, seen)
+        memo[obj.objid] = inner.digest()
+        digest.update(memo[obj.objid])
+    elif isinstance(obj, PDFStream):
+        _update(digest, obj.attrs, memo, seen)
+        # Hash the stream as stored; pdfminer drops the raw bytes once decoded.
+        data = obj.rawdata if obj.rawdata is not None else obj.data
+        digest.update(b"S%d:" % len(data or b""))
+        digest.update(data or b"")
+    elif isinstance(obj, dict):
+        digest.update(b"{")
+        for key in sorted(obj, key=str):
+            digest.update(str(key).encode("utf-8") + b":")
+            _update(digest, obj[key], memo, seen)
+        digest.update(b"}")
+    elif isinstance(obj, (list, tuple)):
+        digest.update(b"[")
+        for item in obj:
+            _update(digest, item, memo, seen)
+        digest.update(b"]")
+    elif isinstance(obj, (PSLiteral, PSKeyword)):
+        digest.update(b"/" + str(obj.name).encode("utf-8"))
+    elif isinstance(obj, bytes):
+        digest.update(b"b%d:" % len(obj) + obj)
+    else:
+        digest.update(repr(obj).encode("utf-8"))
+
+def page_digest(page):
+    """
+    Returns the hex digest of what a pdfplumber page draws. Objects shared with other
+    pages of the same document are hashed only once.
+    """
+    page_obj = page.page_obj
+    page_hex = _page_digests.get(page_obj)
+    if page_hex is None:
+        memo = _object_digests.setdefault(page_obj.doc, {})
+        digest = hashlib.sha256()
+        for name in _PAGE_ATTRIBUTES:
+            digest.update(name.encode("ascii") + b"=")
+            _update(digest, page_obj.attrs.get(name), memo, set())
+        page_hex = _page_digests[page_obj] = digest.hexdigest()
+    return page_hex
+
+def page_key(page, namespace):
+    """Returns the cache key of page read as namespace, or None when the cache is off."""
+    if _store is None:
+        return None
+    return hashlib.sha256(f"{VERSION}|{namespace}|{page_digest(page)}".encode("utf-8")).hexdigest()
+
+def load(key, default=None):
+    """Returns the value cached under key (see page_key), or default."""
+    if _store is None or key is None:
+        return default
+    content = _store.get(key)
+    if content is None:
+        return default
+    try:
+        return json.loads(content)
+    except ValueError:
+        return default
+
+def store(key, value):
+    """Caches a JSON-serializable value under key (no-op when key is None)."""
+    if _store is None or key is None:
+        return
+    try:
+        _store.put(key, json.dumps(value, ensure_ascii=False, separators=(",", ":")))
+    except OSError as e:
+        print(f"Page cache store failed: {e}") # Log server-side, the page is just not cached
+
+def cached(page, namespace, extract):
+    """Returns extract(page), read from the cache when this page was already extracted as namespace."""
+    key = page_key(page, namespace)
+    value = load(key, _MISSING)
+    if value is _MISSING:
+        value = extract(page)
+        store(key, value)
+    return value
+
+def page_text(page, **settings):
+    """page.extract_text(**settings), through the cache."""
+    return cached(page, namespace("extract_text", **settings), lambda page: page.extract_text(**settings))
@@ -0,0 +1,152 @@
+import io
+import os
+import mmap
+from contextlib import contextmanager
+import pdfplumber
+
+# --- Zero-copy access to uploaded PDFs ---
+# Uploads arrive as in-memory buffers (small files) or temporary files on disk (large
+# ones). Instead of read()-ing a whole file into a new bytes object, the scripts map it
+# (mmap for files, the existing buffer for BytesIO), so resident memory does not grow
+# with the file size: the OS pages in only what the parser touches.
+
+@contextmanager
+def mapped(pdf_file):
+    """
+    Yields a read-only bytes-like view of the whole content of pdf_file, without copying
+    it: a memory map for real files, the underlying buffer for io.BytesIO. Other streams
+    are read once. The view is only valid inside the with-block.
+    """
+    getbuffer = getattr(pdf_file, "getbuffer", None)
+    if getbuffer is not None:  # io.BytesIO (also behind a werkzeug FileStorage)
+        view = getbuffer()
+        try:
+            yield view
+        finally:
+            _release(view)
+        return
+    try:
+        fileno = pdf_file.fileno()
+    except (AttributeError, OSError, io.UnsupportedOperation):
+        fileno = None
+    if fileno is not None and os.fstat(fileno).st_size > 0:
+        view = mmap.mmap(fileno, 0, access=mmap.ACCESS_READ)
+        try:
+            yield view
+        finally:
+            _release(view)
+        return
+    pdf_file.seek(0)
+    yield pdf_file.read()
+
+def _release(view):
+    try:
+        view.close() if isinstance(view, mmap.mmap) else view.release()
+    except BufferError:
+        pass  # Still referenced (e.g. by a traceback); freed by garbage collection
+
+class BufferReader(io.RawIOBase):
+    """
+    Read-only, seekable file object over a bytes-like buffer. Unlike io.BytesIO(buffer),
+    it does not copy the buffer, and each reader has its own position.
+    """
+
+    def __init__(self, buffer):
+        self._view = memoryview(buffer).cast("B")
+        self._pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, b):
+        data = self._view[self._pos:self._pos + len(b)]
+        size = len(data)
+        b[:size] = data
+        self._pos += size
+        return size
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._pos
+        elif whence == io.SEEK_END:
+            offset += len(self._view)
+        self._pos = max(0, offset)
+        return self._pos
+
+    def tell(self):
+        return self._pos
+
+    def close(self):
+        if not self.closed:
+            self._view.release()
+        super().close()
+
+@contextmanager
+def open_pdf(source):
+    """
+    Opens a PDF with pdfplumber through a memory-mapped view. source is a file-like
+    object (see mapped) or a bytes-like buffer that is already mapped.
+    """
+    if isinstance(source, (bytes, bytearray, memoryview, mmap.mmap)):
+        reader = BufferReader(source)
+        try:
+            with pdfplumber.open(reader) as pdf:
+                yield pdf
+        finally:
+            reader.close()
+        return
+    with mapped(source) as buffer, open_pdf(buffer) as pdf:
+        yield pdf
+
+def count_pages(source):
+    """Returns the number of pages of a PDF (source as for open_pdf)."""
+    with open_pdf(source) as pdf:
+        return len(pdf.pages)
+
+def release_page(page):
+    """
+    Drops what pdfplumber parsed from page (or a cropped page): its objects, layout and
+    textmap. pdfplumber pages sit in reference cycles (the textmap cache holds a bound
+    method), so without this they would keep their objects until the garbage collector
+    runs, several pages later.
+    """
+    page.flush_cache()
+    page.get_textmap.cache_clear()
+
+def release_contents(pdf, page):
+    """
+    Removes the content streams of page from pdfminer's object cache, which otherwise
+    keeps every page's decoded contents until the document is closed. They are parsed
+    again from the file if the page is read again.
+    """
+    cached_objects = getattr(pdf.doc, "_cached_objs", None)
+    if cached_objects is None:
+        return
+    for stream in getattr(page.page_obj, "contents", ()):
+        cached_objects.pop(getattr(stream, "objid", None), None)
+
+def iter_pages(pdf, progress=None):
+    """
+    Yields (page_number, page) for the pages of an open pdfplumber document, lazily.
+    Each page drops what pdfplumber parsed from it (see release_page) and its decoded
+    content streams (see release_contents) as soon as the caller moves on, and is then
+    removed from pdf.pages, so only one page is held in memory however long the PDF is;
+    a caller that stops early leaves the remaining pages unparsed. pdf.pages is not
+    usable afterwards.
+    If given, progress(page_number, page_count) is called after each page.
+    """
+    pages = pdf.pages
+    page_count = len(pages)
+    for page_number in range(1, page_count + 1):
+        page = pages[page_number - 1]
+        try:
+            yield page_number, page
+        finally:
+            release_page(page)
+            release_contents(pdf, page)
+            pages[page_number - 1] = page = None
+        if progress:
+            progress(page_number, page_count)
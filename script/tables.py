@@ -0,0 +1,84 @@
+from script import pagecache
+from script.pdfsource import iter_pages, open_pdf, release_page
+
+# Extra points kept around a table's bounding box when cropping, so that characters
+# straddling the outer column lines are not clipped (which would move their midpoint
+# and change which cell they fall in).
+CROP_MARGIN = 10
+
+def table_settings(layout):
+    """
+    Builds the pdfplumber table settings for a layout spec. A layout is a dict with:
+    "vertical_lines": x positions of the column separators (required),
+    "horizontal_lines": y positions of the row separators (optional; when missing, rows
+    are found from the ruling lines drawn on the page),
+    "snap_tolerance": defaults to 3.
+    """
+    settings = {
+        "vertical_strategy": "explicit",
+        "horizontal_strategy": "lines",
+        "explicit_vertical_lines": layout["vertical_lines"],
+        "snap_tolerance": layout.get("snap_tolerance", 3),
+    }
+    if layout.get("horizontal_lines"):
+        settings["horizontal_strategy"] = "explicit"
+        settings["explicit_horizontal_lines"] = layout["horizontal_lines"]
+    return settings
+
+def table_bbox(page, layout):
+    """
+    Returns the page region holding the table: between the outer column lines and,
+    when the layout fixes the rows, between the outer row lines; clamped to the page.
+    """
+    x0 = min(layout["vertical_lines"]) - CROP_MARGIN
+    x1 = max(layout["vertical_lines"]) + CROP_MARGIN
+    top, bottom = page.bbox[1], page.bbox[3]
+    if layout.get("horizontal_lines"):
+        top = min(layout["horizontal_lines"]) - CROP_MARGIN
+        bottom = max(layout["horizontal_lines"]) + CROP_MARGIN
+    return (
+        max(x0, page.bbox[0]),
+        max(top, page.bbox[1]),
+        min(x1, page.bbox[2]),
+        min(bottom, page.bbox[3]),
+    )
+
+def iter_page_tables(pdf, layout, progress=None):
+    """
+    Yields (page_number, page, table) for every page of an open pdfplumber document.
+    The table is extracted from the page cropped to the layout's bounding box, so
+    pdfplumber only processes the objects inside it; it is [] when no table is found.
+    Tables are read through the page cache (see script.pagecache), keyed by the layout.
+    page is the whole (uncropped) page, for callers that read more from it before
+    resuming the iteration (see pdfsource.iter_pages).
+    """
+    settings = table_settings(layout)
+    table_namespace = pagecache.namespace("extract_table", layout=layout, crop_margin=CROP_MARGIN)
+
+    def extract(page):
+        cropped = page.crop(table_bbox(page, layout))
+        try:
+            return cropped.extract_table(settings) or []
+        finally:
+            release_page(cropped)
+
+    for page_number, page in iter_pages(pdf, progress):
+        table = pagecache.cached(page, table_namespace, extract)
+        yield page_number, page, table
+
+def iter_table_pages(pdf_file, layout, progress=None):
+    """
+    Opens the PDF once and yields the table rows of each page, as one list per page.
+    If given, progress(page_number, page_count) is called after each page.
+    """
+    with open_pdf(pdf_file) as pdf:
+        for _, _, table in iter_page_tables(pdf, layout, progress):
+            yield table
+
+def iter_table_rows(pdf_file, layout, progress=None):
+    """
+    Opens the PDF once and yields its table rows page by page.
+    If given, progress(page_number, page_count) is called after each page.
+    """
+    for table in iter_table_pages(pdf_file, layout, progress):
+        yield from table
@@ -0,0 +1,113 @@
+import time
+import threading
+from contextlib import contextmanager
+
+# --- Stage timing hooks for the script modules ---
+# Scripts wrap their stages (rendering, thresholding, tesseract, pdfplumber table/text
+# extraction, parsing, CSV writing) in timed()/timed_iter(); each stage reports one
+# observation per conversion, (script, stage, seconds), to the registered recorders.
+# Times are exclusive: a stage that pulls from another timed stage (parsing consuming
+# extracted rows) is not charged for the time spent inside it.
+# Without recorders (e.g. command-line use) the hooks only cost a couple of clock reads.
+
+_recorders = []
+_local = threading.local()
+
+def add_recorder(recorder):
+    """Registers recorder(script, stage, seconds), called once per stage per conversion."""
+    _recorders.append(recorder)
+
+def record(script, stage, seconds):
+    samples = getattr(_local, "samples", None)
+    if samples is not None:  # Inside collected(): keep them for the caller
+        samples.append((script, stage, seconds))
+        return
+    for recorder in _recorders:
+        recorder(script, stage, seconds)
+
+class StageTimer:
+    """Accumulates the exclusive time of one stage across several timed sections."""
+
+    def __init__(self, script, stage):
+        self.script = script
+        self.stage = stage
+        self.seconds = 0.0
+        self._done = False
+
+    def __enter__(self):
+        stack = getattr(_local, "stack", None)
+        if stack is None:
+            stack = _local.stack = []
+        stack.append([time.perf_counter(), 0.0])  # [start, time spent in nested stages]
+        return self
+
+    def __exit__(self, *exc_info):
+        stack = _local.stack
+        start, nested = stack.pop()
+        elapsed = time.perf_counter() - start
+        self.seconds += elapsed - nested
+        if stack:
+            stack[-1][1] += elapsed
+        return False
+
+    def done(self):
+        """Reports the accumulated time (only once)."""
+        if not self._done:
+            self._done = True
+            record(self.script, self.stage, self.seconds)
+
+@contextmanager
+def timed(script, stage):
+    """Times a block as one observation of stage."""
+    timer = StageTimer(script, stage)
+    try:
+        with timer:
+            yield timer
+    finally:
+        timer.done()
+
+def timed_iter(iterable, script, stage):
+    """
+    Yields the items of iterable, charging to stage the time spent producing them
+    (not the time the consumer spends between items). Reported when exhausted or closed;
+    closing it also closes iterable (e.g. a generator holding a PDF open).
+    """
+    timer = StageTimer(script, stage)
+    iterator = iter(iterable)
+    try:
+        while True:
+            with timer:
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+    finally:
+        close = getattr(iterator, "close", None)
+        if close is not None:
+            close()
+        timer.done()
+
+def collected(function, *args, **kwargs):
+    """
+    Runs function (typically in a worker process) and returns (result, samples), where
+    samples are the (script, stage, seconds) observations it made in this thread instead
+    of reporting them; the parent process passes them to replay().
+    """
+    saved = getattr(_local, "samples", None)
+    samples = _local.samples = []
+    try:
+        return function(*args, **kwargs), samples
+    finally:
+        _local.samples = saved
+
+def replay(samples):
+    """
+    Reports observations collected in worker processes, summed per (script, stage), so
+    work split across processes (e.g. one OCR task per page) counts as one conversion.
+    """
+    totals = {}
+    for script, stage, seconds in samples:
+        totals[script, stage] = totals.get((script, stage), 0.0) + seconds
+    for (script, stage), seconds in totals.items():
+        record(script, stage, seconds)
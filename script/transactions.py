@@ -0,0 +1,253 @@
+import re
+import itertools
+from array import array
+from script.timing import timed_iter
+from script.amounts import parse_cents, parse_column, format_column, _CANONICAL
+
+# --- Transaction batches ---
+# The scripts hand their transactions over in column-oriented batches instead of one
+# list or dict per row: dates as YYYYMMDD integers (year 0 when the statement omits
+# it), amounts as integer cents in arrays, descriptions as a list of strings. Writers
+# (script.csvout) serialize a batch column by column through the script's Layout,
+# which holds what differs between banks: column order, date format and how an empty
+# amount is written ("0" or "0,00").
+# Values that do not survive the typed round-trip (an unparseable amount, a date
+# written in an unusual way) are kept verbatim next to the batch, so the output is
+# exactly what the statement said.
+
+# Amount of a transaction that has none on that side (an empty Uscite or Entrate cell).
+NO_AMOUNT = -2 ** 63
+NO_DATE = 0
+
+BATCH_SIZE = 256
+
+_DATE_TOKENS = re.compile(r"yyyy|yy|dd|d|mm|m")
+
+class DateFormat:
+    """
+    A date layout written with the tokens dd/d (day, zero-padded or not), mm/m (month)
+    and yyyy/yy (year; yy means 20yy); anything else is a literal separator.
+    Parses dates into YYYYMMDD integers and formats them back.
+    """
+
+    def __init__(self, layout):
+        self.layout = layout
+        pattern = []
+        self._parts = []  # ("literal", text) or (token, None)
+        position = 0
+        for match in _DATE_TOKENS.finditer(layout):
+            literal = layout[position:match.start()]
+            if literal:
+                pattern.append(re.escape(literal))
+                self._parts.append(("literal", literal))
+            token = match.group()
+            pattern.append({"yyyy": r"(\d{4})", "yy": r"(\d{2})", "dd": r"(\d{2})", "d": r"(\d{1,2})",
+                            "mm": r"(\d{2})", "m": r"(\d{1,2})"}[token])
+            self._parts.append((token, None))
+            position = match.end()
+        if layout[position:]:
+            pattern.append(re.escape(layout[position:]))
+            self._parts.append(("literal", layout[position:]))
+        self._pattern = re.compile("".join(pattern))
+        self._tokens = [token for token, literal in self._parts if literal is None]
+
+    def parse(self, text):
+        """Returns text as a YYYYMMDD integer, or NO_DATE when it does not follow the layout."""
+        match = self._pattern.fullmatch(text)
+        if match is None:
+            return NO_DATE
+        year = month = day = 0
+        for token, value in zip(self._tokens, match.groups()):
+            if token in ("dd", "d"):
+                day = int(value)
+            elif token in ("mm", "m"):
+                month = int(value)
+            else:
+                year = int(value) + (2000 if token == "yy" else 0)
+        if not (1 <= day <= 31 and 1 <= month <= 12):
+            return NO_DATE
+        return year * 10000 + month * 100 + day
+
+    def format(self, value):
+        """Formats a YYYYMMDD integer; NO_DATE becomes an empty string."""
+        if value == NO_DATE:
+            return ""
+        year, month_day = divmod(value, 10000)
+        month, day = divmod(month_day, 100)
+        out = []
+        for token, literal in self._parts:
+            if literal is not None:
+                out.append(literal)
+            elif token == "dd":
+                out.append(f"{day:02d}")
+            elif token == "d":
+                out.append(str(day))
+            elif token == "mm":
+                out.append(f"{month:02d}")
+            elif token == "m":
+                out.append(str(month))
+            elif token == "yy":
+                out.append(f"{year % 100:02d}")
+            else:
+                out.append(f"{year:04d}")
+        return "".join(out)
+
+class Layout:
+    """
+    How a script's transactions are read and written: columns lists the batch fields in
+    output order (matching the script's FIELDNAMES), date_format the output date layout
+    (read with input_date_format, by default the same), empty_amount the text written
+    for NO_AMOUNT.
+    """
+
+    MAX_CACHED_DATES = 4096
+
+    def __init__(self, columns, date_format, input_date_format=None, empty_amount="0"):
+        self.columns = list(columns)
+        self.date_format = DateFormat(date_format)
+        self.input_date_format = DateFormat(input_date_format) if input_date_format else self.date_format
+        self.empty_amount = empty_amount
+        self._dates = {}  # date text -> (value, text kept verbatim or None)
+
+    def read_date(self, text):
+        """Returns (YYYYMMDD value, text to keep verbatim or None) for a date as printed."""
+        cached = self._dates.get(text)
+        if cached is None:
+            value = self.input_date_format.parse(text)
+            exact = value != NO_DATE and self.input_date_format.format(value) == text
+            cached = (value, None if exact or not text else text)
+            if len(self._dates) >= self.MAX_CACHED_DATES:
+                self._dates.clear()
+            self._dates[text] = cached
+        return cached
+
+    def render(self, batch):
+        """Returns the batch as rows of strings, in column order."""
+        columns = {}
+        for name in self.columns:
+            if name == "description":
+                columns[name] = batch.descriptions
+            elif name in ("date", "value_date"):
+                seen = {NO_DATE: ""}
+                date_format = self.date_format
+                columns[name] = [seen[value] if value in seen else seen.setdefault(value, date_format.format(value))
+                                 for value in getattr(batch, name + "s")]
+            else:
+                columns[name] = format_column(getattr(batch, name + "s"), known={NO_AMOUNT: self.empty_amount})
+        for (name, index), text in batch.texts.items():
+            if name in columns:
+                columns[name][index] = text
+        return zip(*(columns[name] for name in self.columns))
+
+    def rows(self, batches):
+        """Yields the rows of several batches (see render)."""
+        for batch in batches:
+            yield from self.render(batch)
+
+class TransactionBatch:
+    """
+    Column-oriented transactions: dates and value_dates (YYYYMMDD, array "l"),
+    descriptions (list), debits and credits (integer cents, array "q"; NO_AMOUNT when
+    empty). texts maps (field, index) to values kept verbatim (see Layout.read_date
+    and append).
+    """
+
+    __slots__ = ("layout", "dates", "value_dates", "descriptions", "debits", "credits", "texts")
+
+    def __init__(self, layout):
+        self.layout = layout
+        self.dates = array("l")
+        self.value_dates = array("l")
+        self.descriptions = []
+        self.debits = array("q")
+        self.credits = array("q")
+        self.texts = {}
+
+    def __len__(self):
+        return len(self.descriptions)
+
+    def append(self, date, description, debit=NO_AMOUNT, credit=NO_AMOUNT, value_date=""):
+        """
+        Adds a transaction. date and value_date are texts in the layout's input date
+        format. debit and credit are integer cents (or NO_AMOUNT), or texts: amounts
+        already in output form ("1.234,56") are stored as cents, any other text is
+        written verbatim (its cents, if it parses, are still stored for typed readers).
+        """
+        index = len(self.descriptions)
+        self.dates.append(self._date(date, "date", index))
+        self.value_dates.append(self._date(value_date, "value_date", index) if value_date else NO_DATE)
+        self.descriptions.append(description)
+        self.debits.append(self._amount(debit, "debit", index))
+        self.credits.append(self._amount(credit, "credit", index))
+
+    def _date(self, text, field, index):
+        value, verbatim = self.layout.read_date(text)
+        if verbatim is not None:
+            self.texts[field, index] = verbatim
+        return value
+
+    def _amount(self, amount, field, index):
+        if amount.__class__ is int:
+            return amount
+        if _CANONICAL.fullmatch(amount):
+            return parse_cents(amount)
+        self.texts[field, index] = amount
+        try:
+            return parse_cents(amount)
+        except ValueError:
+            return NO_AMOUNT
+
+def amount_value(text, empty=NO_AMOUNT, invalid=None):
+    """
+    An amount cell as the scripts normalize it: integer cents when it is a number
+    (written back in the canonical "1.234,56" form), empty when it is blank, invalid
+    when it is not an amount (by default the stripped text, which is written verbatim).
+    """
+    if not text or text.isspace():
+        return empty
+    try:
+        return parse_cents(text)
+    except ValueError:
+        return text.strip() if invalid is None else invalid
+
+_INVALID = object()
+
+def amount_column(texts, empty=NO_AMOUNT, invalid=None):
+    """
+    amount_value over a whole column (e.g. the Uscite of a page), converted with
+    amounts.parse_column: repeated values are parsed once.
+    """
+    texts = list(texts)
+    column = parse_column(texts, empty=empty, invalid=_INVALID if invalid is None else invalid)
+    if invalid is None:
+        for index, value in enumerate(column):
+            if value is _INVALID:
+                column[index] = texts[index].strip()
+    return column
+
+def batched(layout, records, size=BATCH_SIZE):
+    """
+    Packs records (argument tuples for TransactionBatch.append) into batches of up to
+    `size` transactions, yielded as they fill up.
+    """
+    batch = TransactionBatch(layout)
+    for record in records:
+        batch.append(*record)
+        if len(batch) >= size:
+            yield batch
+            batch = TransactionBatch(layout)
+    if len(batch):
+        yield batch
+
+def iter_module_batches(module, pdf_file, progress=None):
+    """
+    Returns the batches of module.iter_batches(pdf_file, progress), with the time spent
+    producing them (outside the module's own timed stages) reported as its "parse" stage.
+    The first batch is parsed before returning, so that unreadable PDFs raise here
+    rather than halfway through a streamed response.
+    """
+    batches = timed_iter(module.iter_batches(pdf_file, progress), module.__name__, "parse")
+    first_batch = next(batches, None)
+    if first_batch is not None:
+        batches = itertools.chain([first_batch], batches)
+    return batches
@@ -12,6 +12,9 @@ document.addEventListener('DOMContentLoaded', () => {
     const loadingIndicator = document.getElementById('loading-indicator');
     // Theme Toggle Element
     const themeToggleButton = document.getElementById('theme-toggle');
+    const loadingText = loadingIndicator ? loadingIndicator.querySelector('p') : null;
+
+    const JOB_POLL_INTERVAL_MS = 1000;
 
     // --- Data (Passed from Flask) ---
     // const availableDocsByBank = { /* Injected by Flask via <script> tag in HTML */ };
@@ -25,6 +28,16 @@ document.addEventListener('DOMContentLoaded', () => {
         // Clear previous options
         docSelect.innerHTML = "";
 
+        // Automatic detection: bank and document type are recognized from the PDF
+        if (typeof autoDetect !== 'undefined' && selectedBank === autoDetect) {
+            const option = document.createElement("option");
+            option.value = autoDetect;
+            option.text = "Riconosciuto dal PDF";
+            docSelect.add(option);
+            docSelect.disabled = true;
+            return;
+        }
+
         if (types.length > 0) {
             types.forEach(type => {
                 const option = document.createElement("option");
@@ -45,6 +58,7 @@ document.addEventListener('DOMContentLoaded', () => {
     function showLoading(isLoading) {
         if (isLoading) {
             loadingIndicator.style.display = 'block';
+            showProgress('Elaborazione in corso... Attendere.');
             submitButton.disabled = true;
             statusDiv.textContent = ''; // Clear previous status
             statusDiv.className = 'status'; // Reset status class
@@ -54,6 +68,41 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     }
 
+    function showProgress(message) {
+        if (loadingText) {
+            loadingText.textContent = message;
+        }
+    }
+
+    // Submits the form to the job API and polls until the job ends.
+    // Resolves with the result download response, or with the error response to display.
+    async function runConversionJob(formData) {
+        const submitResponse = await fetch('/jobs', {
+            method: 'POST',
+            body: formData
+            // No 'Content-Type' header needed, browser sets it for FormData
+        });
+        if (!submitResponse.ok) {
+            return submitResponse;
+        }
+        const job = await submitResponse.json();
+
+        while (true) {
+            await new Promise(resolve => setTimeout(resolve, JOB_POLL_INTERVAL_MS));
+            const statusResponse = await fetch(job.status_url);
+            if (!statusResponse.ok) {
+                return statusResponse;
+            }
+            const status = await statusResponse.json();
+            if (status.state === 'done' || status.state === 'error') {
+                return fetch(job.result_url);
+            }
+            if (status.pages_total) {
+                showProgress(`Elaborazione in corso... pagina ${status.pages_done} di ${status.pages_total}.`);
+            }
+        }
+    }
+
     function showStatus(message, isError = false) {
          statusDiv.textContent = message;
          statusDiv.className = isError ? 'status error' : 'status success';
@@ -180,11 +229,8 @@ document.addEventListener('DOMContentLoaded', () => {
             formData.append('output_filename', outputFilename); // Append the output filename
 
             try {
-                const response = await fetch('/run_script', {
-                    method: 'POST',
-                    body: formData
-                    // No 'Content-Type' header needed, browser sets it for FormData
-                });
+                // Long conversions run as background jobs: submit, poll progress, then download
+                const response = await runConversionJob(formData);
 
                 // Check if response indicates a file download (CSV)
                 const contentType = response.headers.get("content-type");